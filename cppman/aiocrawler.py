@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+#
+# aiocrawler.py - asyncio based crawler engine
+#
+# Copyright (C) 2010 - 2016  Wei-Ning Huang (AZ) <aitjcize@gmail.com>
+# All Rights reserved.
+#
+# This file is part of cppman.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+import asyncio
+import http.client as httplib
+import re
+import ssl
+import time
+
+
+class Response(object):
+    """Minimal stand-in for http.client.HTTPResponse, enough for
+    Crawler._handle_response and Document."""
+    def __init__(self, status, headers):
+        self.status = status
+        self.headers = headers
+        self.body = b''
+        self.will_close = False
+
+    def read(self):
+        return self.body
+
+    def getheader(self, name, default=None):
+        name = name.lower()
+        for key, value in self.headers:
+            if key.lower() == name:
+                return value
+        return default
+
+    def getheaders(self):
+        return list(self.headers)
+
+
+class ConnectionPool(object):
+    """Keep-alive HTTP/1.1 connections, pooled per (protocol, host)."""
+    def __init__(self, limit_per_host, timeout=10):
+        self.limit_per_host = limit_per_host
+        self.timeout = timeout
+        self.opened = 0
+        self._idle = {}
+        self._slots = {}
+
+    async def request(self, protocol, host, path, headers=None):
+        key = (protocol, host)
+        if key not in self._slots:
+            self._slots[key] = asyncio.Semaphore(self.limit_per_host)
+
+        async with self._slots[key]:
+            while True:
+                conn, reused = await self._acquire(key)
+                try:
+                    res = await asyncio.wait_for(
+                        self._roundtrip(conn, host, path, headers or {}),
+                        self.timeout)
+                except (httplib.HTTPException, EnvironmentError,
+                        EOFError, asyncio.TimeoutError):
+                    conn[1].close()
+                    # The server may have dropped an idle keep-alive
+                    # connection, retry once on a fresh one.
+                    if reused:
+                        continue
+                    raise
+
+                if res.will_close:
+                    conn[1].close()
+                else:
+                    self._idle.setdefault(key, []).append(conn)
+                return res
+
+    def close(self):
+        for conns in self._idle.values():
+            for reader, writer in conns:
+                writer.close()
+        self._idle = {}
+
+    async def _acquire(self, key):
+        idle = self._idle.get(key)
+        if idle:
+            return idle.pop(), True
+
+        protocol, host = key
+        hostname, _, port = host.partition(':')
+        if protocol == 'https':
+            conn = asyncio.open_connection(
+                hostname, int(port or 443), ssl=ssl.create_default_context(),
+                server_hostname=hostname)
+        else:
+            conn = asyncio.open_connection(hostname, int(port or 80))
+        conn = await asyncio.wait_for(conn, self.timeout)
+        self.opened += 1
+        return conn, False
+
+    async def _roundtrip(self, conn, host, path, headers):
+        reader, writer = conn
+
+        lines = ['GET %s HTTP/1.1' % path,
+                 'Host: %s' % host,
+                 'Connection: keep-alive',
+                 'Accept-Encoding: identity']
+        lines.extend('%s: %s' % item for item in headers.items())
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise httplib.RemoteDisconnected('connection closed by server')
+
+        parts = status_line.decode('latin-1').split(None, 2)
+        if len(parts) < 2 or not parts[0].startswith('HTTP/') or \
+                not parts[1].isdigit():
+            raise httplib.BadStatusLine(status_line)
+
+        res_headers = []
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            res_headers.append((name.strip(), value.strip()))
+
+        res = Response(int(parts[1]), res_headers)
+
+        connection = res.getheader('Connection', '').lower()
+        res.will_close = connection == 'close' or \
+            (parts[0] == 'HTTP/1.0' and connection != 'keep-alive')
+
+        if res.status in (204, 304) or 100 <= res.status < 200:
+            pass
+        elif 'chunked' in res.getheader('Transfer-Encoding', '').lower():
+            res.body = await self._read_chunked(reader)
+        elif res.getheader('Content-Length') is not None:
+            try:
+                length = int(res.getheader('Content-Length'))
+            except ValueError:
+                raise httplib.HTTPException('invalid Content-Length')
+            res.body = await reader.readexactly(length)
+        else:
+            res.body = await reader.read()
+            res.will_close = True
+
+        return res
+
+    async def _read_chunked(self, reader):
+        chunks = []
+        while True:
+            size = await reader.readline()
+            try:
+                size = int(size.split(b';', 1)[0].strip(), 16)
+            except ValueError:
+                raise httplib.IncompleteRead(b''.join(chunks))
+            if size == 0:
+                break
+            chunks.append(await reader.readexactly(size))
+            await reader.readline()
+
+        # Skip trailers
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+
+        return b''.join(chunks)
+
+
+class AsyncEngine(object):
+    """Crawl with asyncio and pooled keep-alive connections.
+
+    At most `max_outstanding' requests of the crawler are in flight at any
+    time, the crawler's scheduler may hold them back further. Documents are
+    handed to the crawler's process_document callback exactly as the
+    threaded engine does.
+    """
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.window = max(1, crawler.max_outstanding)
+        self.pool = None
+
+    def run(self):
+        asyncio.run(self._crawl())
+
+    async def _crawl(self):
+        self.pool = ConnectionPool(self.window)
+        pending = set()
+        try:
+            while True:
+                while len(pending) < self.window:
+                    target = self._next_target()
+                    if target is None:
+                        break
+                    pending.add(asyncio.ensure_future(self._fetch(target)))
+
+                # Targets waiting for a retry
+                delay = self.crawler.targets.next_delay()
+
+                if not pending:
+                    if delay is None:
+                        break
+                    await asyncio.sleep(delay)
+                    continue
+
+                done, pending = await asyncio.wait(
+                    pending, timeout=delay,
+                    return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    task.result()
+
+                self.crawler._maybe_checkpoint()
+        except BaseException:
+            self.crawler.targets.close()
+            raise
+        finally:
+            self.pool.close()
+
+    def _next_target(self):
+        return self.crawler.targets.get_nowait()
+
+    async def _fetch(self, target):
+        targets = self.crawler.targets
+        (url, std) = target
+        scheduler = self.crawler.scheduler
+        rx = re.match('(https?)://([^/]+)(.*)', url)
+        host = rx.group(2)
+        try:
+            while True:
+                wait = scheduler.try_acquire(host)
+                if not wait:
+                    break
+                await asyncio.sleep(wait)
+
+            start = time.time()
+            try:
+                res = await self.pool.request(
+                    rx.group(1), host, rx.group(3) or '/',
+                    self.crawler._request_headers(url))
+            except BaseException:
+                scheduler.release(host, latency=time.time() - start,
+                                  error=True)
+                raise
+            scheduler.release(host, res.status, time.time() - start,
+                              res.getheader('Retry-After'))
+            self.crawler._handle_response(url, std, res)
+        except (httplib.HTTPException, EnvironmentError, EOFError,
+                asyncio.TimeoutError):
+            self.crawler._retry(url, std)
+        except Exception as e:
+            print('Error processing %s: %s' % (url, e))
+        finally:
+            targets.task_done(target)
@@ -0,0 +1,357 @@
+# -*- coding: utf-8 -*-
+#
+# cache.py - storage backends of cached man pages
+#
+# Copyright (C) 2010 - 2016  Wei-Ning Huang (AZ) <aitjcize@gmail.com>
+# All Rights reserved.
+#
+# This file is part of cppman.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+import gzip
+import hashlib
+import io
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from collections import namedtuple
+from threading import Lock
+
+from cppman.util import replace_file
+
+
+B_DIRECTORY, B_PACK = 'directory', 'pack'
+
+# What is known of a cached page, fetched is a timestamp
+PageInfo = namedtuple('PageInfo', ['url', 'size', 'fetched'])
+
+
+def normalized_page_name(name):
+    return name.replace('/', '_')
+
+
+def compress(groff_text):
+    buf = io.BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode='wb') as f:
+        f.write(groff_text.encode('utf-8'))
+    return buf.getvalue()
+
+
+def connect(path):
+    """Open the SQLite database of a cache, creating its directory."""
+    try:
+        os.makedirs(os.path.dirname(path))
+    except OSError:
+        pass
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+
+def remove_database(path):
+    for suffix in ('', '-wal', '-shm'):
+        try:
+            os.remove(path + suffix)
+        except OSError:
+            pass
+
+
+class Manifest(object):
+    """Persistent record of the pages of a DirectoryCache: source url, size
+    and fetch time of each page, so looking a page up needs neither a
+    directory listing nor a stat."""
+    def __init__(self, path):
+        self.path = path
+        self.lock = Lock()
+        self.conn = None
+
+    def _connect(self):
+        if self.conn is None:
+            self.conn = connect(self.path)
+            self.conn.execute('CREATE TABLE IF NOT EXISTS "page" '
+                              '(source TEXT, name TEXT, url TEXT, '
+                              'size INTEGER, fetched REAL, '
+                              'PRIMARY KEY (source, name))')
+            self.conn.commit()
+        return self.conn
+
+    def get(self, source, name):
+        with self.lock:
+            row = self._connect().execute(
+                'SELECT url, size, fetched FROM "page" '
+                'WHERE source=? AND name=?', (source, name)).fetchone()
+        return PageInfo(*row) if row else None
+
+    def put(self, source, name, info):
+        with self.lock:
+            conn = self._connect()
+            conn.execute('INSERT OR REPLACE INTO "page" '
+                         '(source, name, url, size, fetched) '
+                         'VALUES (?, ?, ?, ?, ?)', (source, name) + info)
+            conn.commit()
+
+    def remove(self, source, name):
+        with self.lock:
+            conn = self._connect()
+            conn.execute('DELETE FROM "page" WHERE source=? AND name=?',
+                         (source, name))
+            conn.commit()
+
+    def clear(self):
+        self.close()
+        remove_database(self.path)
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+
+class DirectoryCache(object):
+    """Pages as <man_dir>/<source>/<name>.3.gz files, which man(1) and mandb
+    can use directly."""
+    def __init__(self, man_dir, manifest_file):
+        self.man_dir = man_dir
+        self.manifest = Manifest(manifest_file)
+
+    def path(self, source, name):
+        return os.path.join(self.man_dir, source,
+                            normalized_page_name(name) + '.3.gz')
+
+    def contains(self, source, name):
+        return self.info(source, name) is not None
+
+    def info(self, source, name):
+        """Return the PageInfo of a cached page, or None."""
+        name = normalized_page_name(name)
+        info = self.manifest.get(source, name)
+        if info is None:
+            # Cached before the manifest, or by another program
+            try:
+                st = os.stat(self.path(source, name))
+            except OSError:
+                return None
+            info = PageInfo(None, st.st_size, st.st_mtime)
+            self.manifest.put(source, name, info)
+        return info
+
+    def write(self, source, name, groff_text, url=None):
+        self.write_compressed(source, name, compress(groff_text), url)
+
+    def write_compressed(self, source, name, data, url=None, fetched=None):
+        try:
+            os.makedirs(os.path.join(self.man_dir, source))
+        except OSError:
+            pass
+
+        with open(self.path(source, name), 'wb') as f:
+            f.write(data)
+        self.manifest.put(source, normalized_page_name(name),
+                          PageInfo(url, len(data), fetched or time.time()))
+
+    def read_compressed(self, source, name):
+        with open(self.path(source, name), 'rb') as f:
+            return f.read()
+
+    def open(self, source, name):
+        """Return a binary file object of the gzipped page."""
+        try:
+            return open(self.path(source, name), 'rb')
+        except IOError:
+            # Removed behind the manifest's back
+            self.manifest.remove(source, normalized_page_name(name))
+            raise
+
+    def pages(self, source):
+        try:
+            filenames = os.listdir(os.path.join(self.man_dir, source))
+        except OSError:
+            return []
+        return [f[:-len('.3.gz')] for f in filenames if f.endswith('.3.gz')]
+
+    def clear(self):
+        self.manifest.clear()
+        shutil.rmtree(self.man_dir)
+
+    def close(self):
+        self.manifest.close()
+
+
+class PackCache(object):
+    """Pages of all sources as gzipped blobs in a single SQLite file, a
+    single lookup instead of a file per page."""
+    def __init__(self, path):
+        self.path = path
+        self.lock = Lock()
+        self.conn = None
+
+    def _connect(self):
+        if self.conn is None:
+            self.conn = connect(self.path)
+            self.conn.execute('CREATE TABLE IF NOT EXISTS "page" '
+                              '(source TEXT, name TEXT, data BLOB, '
+                              'url TEXT, size INTEGER, fetched REAL, '
+                              'PRIMARY KEY (source, name))')
+            self.conn.commit()
+        return self.conn
+
+    def contains(self, source, name):
+        return self.info(source, name) is not None
+
+    def info(self, source, name):
+        """Return the PageInfo of a cached page, or None."""
+        with self.lock:
+            row = self._connect().execute(
+                'SELECT url, size, fetched FROM "page" '
+                'WHERE source=? AND name=?',
+                (source, normalized_page_name(name))).fetchone()
+        return PageInfo(*row) if row else None
+
+    def write(self, source, name, groff_text, url=None):
+        self.write_compressed(source, name, compress(groff_text), url)
+
+    def write_compressed(self, source, name, data, url=None, fetched=None):
+        with self.lock:
+            conn = self._connect()
+            conn.execute('INSERT OR REPLACE INTO "page" '
+                         '(source, name, data, url, size, fetched) '
+                         'VALUES (?, ?, ?, ?, ?, ?)',
+                         (source, normalized_page_name(name),
+                          sqlite3.Binary(data), url, len(data),
+                          fetched or time.time()))
+            conn.commit()
+
+    def read_compressed(self, source, name):
+        with self.lock:
+            row = self._connect().execute(
+                'SELECT data FROM "page" WHERE source=? AND name=?',
+                (source, normalized_page_name(name))).fetchone()
+        if row is None:
+            raise IOError('%s: page not in %s' % (name, self.path))
+        return bytes(row[0])
+
+    def open(self, source, name):
+        """Return a binary file object of the gzipped page. It is backed by
+        an unlinked temporary file, so it can be passed to a pager as its
+        standard input."""
+        f = tempfile.TemporaryFile()
+        f.write(self.read_compressed(source, name))
+        f.seek(0)
+        return f
+
+    def pages(self, source):
+        with self.lock:
+            return [name for name, in self._connect().execute(
+                'SELECT name FROM "page" WHERE source=?', (source,))]
+
+    def clear(self):
+        self.close()
+        remove_database(self.path)
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+
+class RenderCache(object):
+    """Pages typeset for a number of columns, an output device and a
+    renderer, as files in directory, so viewing a page again needs no groff.
+    The least recently viewed are removed past max_size bytes."""
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        self.max_size = max_size
+
+    @staticmethod
+    def key(source, name, info, columns, device, renderer):
+        """Key of the rendering of a page, changing when it is cached
+        again."""
+        digest = hashlib.sha1(repr((source, normalized_page_name(name),
+                                    info.size, info.fetched))
+                              .encode('utf-8')).hexdigest()
+        return '%s-%d-%s-%s' % (digest, columns, device, renderer)
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    def open(self, key):
+        """Return a binary file object of a rendering, or None."""
+        try:
+            f = open(self.path(key), 'rb')
+        except IOError:
+            return None
+        try:
+            # Mark it as recently viewed
+            os.utime(self.path(key))
+        except OSError:
+            pass
+        return f
+
+    def put(self, key, data):
+        try:
+            os.makedirs(self.directory)
+        except OSError:
+            pass
+
+        def write(tmp):
+            with open(tmp, 'wb') as f:
+                f.write(data)
+
+        # Hidden until renamed, evict leaves it alone
+        replace_file(self.path(key), write)
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently viewed renderings past max_size."""
+        entries = []
+        for filename in os.listdir(self.directory):
+            if filename.startswith('.'):
+                # Being written
+                continue
+            try:
+                st = os.stat(os.path.join(self.directory, filename))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, filename))
+
+        total = sum(size for mtime, size, filename in entries)
+        for mtime, size, filename in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(os.path.join(self.directory, filename))
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def open_cache(backend, man_dir, pack_file, manifest_file):
+    """Return the page cache of the given backend."""
+    if backend == B_PACK:
+        return PackCache(pack_file)
+    elif backend == B_DIRECTORY:
+        return DirectoryCache(man_dir, manifest_file)
+    raise RuntimeError("invalid cache backend `%s'" % backend)
@@ -29,11 +29,15 @@ import os
 class Config(object):
     PAGERS = ['vim', 'less', 'system']
     SOURCES = ['cplusplus.com', 'cppreference.com']
+    CACHE_BACKENDS = ['directory', 'pack']
+    RENDERERS = ['auto', 'groff', 'python']
 
     DEFAULTS = {
         'Source': 'cplusplus.com',
         'UpdateManPath': 'false',
-        'Pager': 'vim'
+        'Pager': 'vim',
+        'CacheBackend': 'directory',
+        'Renderer': 'auto'
     }
 
     def __init__(self, configfile):
@@ -24,11 +24,18 @@
 
 from __future__ import print_function
 
+import heapq
+import json
 import os
 import re
+import sqlite3
 import sys
+import time
 
-from threading import Thread, Lock
+from collections import deque
+from threading import Condition, Thread, Lock
+
+from cppman.scheduler import Scheduler, THROTTLED
 
 if sys.version_info < (3, 0):
     import httplib
@@ -67,12 +74,25 @@ class LinkParser(object):
         links = self._find_links()
         return list(set(links))
 
+CPLUSPLUS_LINK = re.compile(
+    r'''<a[^>]*href\s*=\s*['"]\s*([^'"]+)['"][^>]*>(.+?)</a>''', re.S)
+CPLUSPLUS_CPP11 = re.compile(r'''class\s*=\s*['"][^'"]*C_cpp11[^'"]*['"]''')
+
+# Either a link or a span.t-mark-rev with the C++ revision of the link before
+# it, e.g.
+#   <a href="LinkA">LinkA</a>
+#   <a href="LinkB">LinkB</a> <span class="t-mark-rev">(C++11)</span>
+CPPREFERENCE_LINK = re.compile(
+    r'''href\s*=\s*['"]\s*([^'"]+)['"]'''
+    r'''|<span[^<]*class\s*=\s*['"][^'"]*t-mark-rev[^'"]*['"][^<]*>'''
+    r'''\(([^(<>]*)\)</span>''')
+
+
 class CPlusPlusLinkParser(LinkParser):
     def _find_links(self):
         links = []
-        for url, text in re.findall(
-            '''<a[^>]*href\s*=\s*['"]\s*([^'"]+)['"][^>]*>(.+?)</a>''', self.text, re.S):
-            if re.search('''class\s*=\s*['"][^'"]*C_cpp11[^'"]*['"]''', text):
+        for url, text in CPLUSPLUS_LINK.findall(self.text):
+            if CPLUSPLUS_CPP11.search(text):
                 links.append(Link(url, "C++11"))
             else:
                 links.append(Link(url, ""))
@@ -80,40 +100,221 @@ class CPlusPlusLinkParser(LinkParser):
 
 class CPPReferenceLinkParser(LinkParser):
     def _find_links(self):
-        processed = {}
-        links = []
-        body = re.search('<[^>]*body[^>]*>(.+?)</body>', self.text, re.S).group(1)
-        """
-        The link follow by the span.t-mark-rev will contained c++xx information.
-        Consider the below case
-          <a href="LinkA">LinkA</a>
-          <a href="LinkB">LinkB</a>
-          <span class="t-mark-rev">(C++11)</span>
-        We're reversing the body so it is easier to write the regex to get the pair of (std, url).
+        """Collect links and their C++ revision in a single forward pass.
+
+        A span.t-mark-rev belongs to the nearest link before it on the same
+        line, if several spans follow a link the last one wins. A url linked
+        several times gets the revision of its last tagged occurrence.
         """
-        bodyr = body[::-1]
-        href = "href"[::-1]
-        span = "span"[::-1]
-        mark_rev = "t-mark-rev"[::-1]
-        _class = "class"[::-1]
-        for std, url in re.findall(
-            '>' + span + '/<\)([^(<>]*)\(' + '>[^<]*?' +
-            '''['"][^'"]*''' + mark_rev + '''[^'"]*['"]\s*=\s*''' + _class +
-            '[^<]*' + span + '''<.*?['"]([^'"]+)['"]=''' + href
-            , bodyr):
-            std = std[::-1]
-            url = url[::-1]
-            links.append(Link(url, std))
-            processed[url] = True
-
-
-        for url in re.findall('''href\s*=\s*['"]\s*([^'"]+)['"]''', self.text):
-            if url in processed:
-                continue
-            links.append(Link(url, ""))
-            processed[url] = True
+        text = self.text
+        stds = {}
+        last_url = None
+        last_end = 0
+
+        for m in CPPREFERENCE_LINK.finditer(text):
+            url = m.group(1)
+            if url is not None:
+                if url not in stds:
+                    stds[url] = ""
+                last_url = url
+                last_end = m.end()
+            elif last_url is not None and \
+                    text.find('\n', last_end, m.start()) < 0:
+                stds[last_url] = m.group(2)
+
+        return [Link(url, std) for url, std in stds.items()]
+
+
+class Frontier(object):
+    """FIFO of (url, std) targets which counts outstanding work.
+
+    Every target taken with get() must be released with task_done() once it
+    is processed; targets discovered while processing have to be put()
+    before that. The crawl is thus done exactly when the queue is empty,
+    no target is waiting for a delayed retry and no target is in flight.
+    """
+    def __init__(self):
+        self._queue = deque()
+        self._delayed = []
+        self._in_flight = {}
+        self._seq = 0
+        self._cond = Condition(Lock())
+        self._outstanding = 0
+        self._closed = False
+
+    def __len__(self):
+        return len(self._queue) + len(self._delayed)
+
+    def put(self, target, delay=0):
+        """Queue a target, after `delay' seconds if given."""
+        with self._cond:
+            if delay > 0:
+                self._seq += 1
+                heapq.heappush(self._delayed,
+                               (time.time() + delay, self._seq, target))
+            else:
+                self._queue.append(target)
+            self._outstanding += 1
+            self._cond.notify()
+
+    def get(self):
+        """Wait for the next target, returns None once the crawl is done."""
+        with self._cond:
+            while not self._closed and self._outstanding:
+                target = self._pop()
+                if target is not None:
+                    return target
+                self._cond.wait(self._next_delay())
+            return None
 
-        return links
+    def get_nowait(self):
+        """Return the next target, or None if none is ready right now."""
+        with self._cond:
+            if self._closed:
+                return None
+            return self._pop()
+
+    def next_delay(self):
+        """Seconds until the next delayed target is ready, or None."""
+        with self._cond:
+            return self._next_delay()
+
+    def task_done(self, target):
+        with self._cond:
+            if self._closed:
+                # Keep aborted targets in flight, so snapshot() has them
+                return
+            self._in_flight[target] -= 1
+            if not self._in_flight[target]:
+                del self._in_flight[target]
+            self._outstanding -= 1
+            if self._outstanding == 0:
+                self._cond.notify_all()
+
+    def done(self):
+        with self._cond:
+            return self._closed or self._outstanding == 0
+
+    def close(self):
+        """Abort the crawl, waiting workers are released."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def snapshot(self):
+        """Return all unfinished targets, including those in flight."""
+        with self._cond:
+            return (list(self._queue) + [d[2] for d in self._delayed] +
+                    list(self._in_flight))
+
+    def _next_delay(self):
+        if not self._delayed:
+            return None
+        return max(0, self._delayed[0][0] - time.time())
+
+    def _pop(self):
+        now = time.time()
+        while self._delayed and self._delayed[0][0] <= now:
+            self._queue.append(heapq.heappop(self._delayed)[2])
+
+        if not self._queue:
+            return None
+        target = self._queue.popleft()
+        self._in_flight[target] = self._in_flight.get(target, 0) + 1
+        return target
+
+
+class Checkpoint(object):
+    """SQLite journal of crawl progress, see Crawler.set_checkpoint.
+
+    The state of every crawl is stored under its root url: the frontier,
+    the visited urls, the recorded pages and the results of the crawler.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = Lock()
+        for table, columns in (
+                ('crawl', 'root TEXT PRIMARY KEY, finished INTEGER'),
+                ('frontier', 'root TEXT, url TEXT, std TEXT'),
+                ('visited', 'root TEXT, url TEXT'),
+                ('crawled', 'root TEXT, url TEXT, etag TEXT, '
+                            'last_modified TEXT, links TEXT'),
+                ('results', 'root TEXT, row TEXT')):
+            self.conn.execute('CREATE TABLE IF NOT EXISTS "%s" (%s)'
+                              % (table, columns))
+        self.conn.commit()
+
+    def reset(self):
+        with self.lock:
+            for table in ('crawl', 'frontier', 'visited', 'crawled',
+                          'results'):
+                self.conn.execute('DELETE FROM "%s"' % table)
+            self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def save(self, root, finished, frontier, visited, crawled, results):
+        with self.lock:
+            with self.conn:
+                for table in ('frontier', 'visited', 'crawled', 'results'):
+                    self.conn.execute('DELETE FROM "%s" WHERE root = ?'
+                                      % table, (root,))
+                self.conn.execute('INSERT OR REPLACE INTO "crawl" '
+                                  '(root, finished) VALUES (?, ?)',
+                                  (root, int(finished)))
+                self.conn.executemany(
+                    'INSERT INTO "frontier" VALUES (?, ?, ?)',
+                    [(root, url, std) for url, std in frontier])
+                self.conn.executemany(
+                    'INSERT INTO "visited" VALUES (?, ?)',
+                    [(root, url) for url in visited])
+                self.conn.executemany(
+                    'INSERT INTO "crawled" VALUES (?, ?, ?, ?, ?)',
+                    [(root, url, etag, last_modified, json.dumps(links))
+                     for url, (etag, last_modified, links) in crawled])
+                self.conn.executemany(
+                    'INSERT INTO "results" VALUES (?, ?)',
+                    [(root, json.dumps(row)) for row in results])
+
+    def load(self, root):
+        """Return (finished, frontier, visited, crawled, results) of a crawl,
+        or None if it was never checkpointed."""
+        with self.lock:
+            row = self.conn.execute('SELECT finished FROM "crawl" '
+                                    'WHERE root = ?', (root,)).fetchone()
+            if row is None:
+                return None
+
+            def select(sql):
+                return self.conn.execute(sql, (root,)).fetchall()
+
+            frontier = select('SELECT url, std FROM "frontier" WHERE root = ?')
+            visited = [r[0] for r in
+                       select('SELECT url FROM "visited" WHERE root = ?')]
+            crawled = dict(
+                (url, (etag, last_modified,
+                       [tuple(link) for link in json.loads(links)]))
+                for url, etag, last_modified, links in
+                select('SELECT url, etag, last_modified, links '
+                       'FROM "crawled" WHERE root = ?'))
+            results = [tuple(json.loads(r[0])) for r in
+                       select('SELECT row FROM "results" WHERE root = ?')]
+            return bool(row[0]), frontier, visited, crawled, results
+
+
+URL = re.compile(r'(https?://)([^/:]+)(:[0-9]+)?([^\?]*)(\?.*)?')
+LINK_URL = re.compile(r'((https?://)([^/:]+)(:[0-9]+)?)?([^\?]*)(\?.*)?')
+HASHTAG = re.compile(r'(%23|#).*$')
+
+
+def split_url(url):
+    """Split url into (proto, host, port, path, dir_path)."""
+    rx = URL.match(url)
+    path = rx.group(4) if len(rx.group(4)) > 0 else '/'
+    return (rx.group(1), rx.group(2), rx.group(3) if rx.group(3) else '',
+            path, os.path.dirname(path))
 
 
 def create_link_parser(url):
@@ -126,24 +327,39 @@ def create_link_parser(url):
 
 class Crawler(object):
     F_ANY, F_SAME_DOMAIN, F_SAME_HOST, F_SAME_PATH = list(range(4))
+    E_THREAD, E_ASYNCIO = 'thread', 'asyncio'
+    ENGINES = [E_THREAD, E_ASYNCIO]
 
     def __init__(self):
         self.host = None
         self.visited = {}
-        self.targets = set()
+        self.revalidate = {}
+        self.crawled = {}
+        self.targets = Frontier()
         self.threads = []
-        self.concurrency = 0
         self.max_outstanding = 16
         self.max_depth = 0
         self.include_hashtag = False
+        self.engine = self.E_THREAD
+        self.scheduler = Scheduler(self.max_outstanding)
+
+        self.retries = {}
+        self.max_retries = 5
+        self.retry_backoff = 1.0
+
+        self.checkpoint = None
+        self.checkpoint_interval = 60
+        self.resume = False
+        self.last_checkpoint = 0
 
         self.follow_mode = self.F_SAME_HOST
         self.content_type_filter = '(text/html)'
         self.url_filters = []
         self.prefix_filter = '^(#|javascript:|mailto:)'
+        self.link_filters = []
 
         self.targets_lock = Lock()
-        self.concurrency_lock = Lock()
+        self.checkpoint_lock = Lock()
 
     def set_content_type_filter(self, cf):
         self.content_type_filter = '(%s)' % ('|'.join(cf))
@@ -158,6 +374,46 @@ class Crawler(object):
 
     def set_concurrency_level(self, level):
         self.max_outstanding = level
+        self.scheduler.max_concurrency = level
+
+    def set_rate_limit(self, rate, burst=1):
+        """Send at most `rate' requests per second to each host, in bursts
+        of at most `burst' requests. robots.txt Crawl-delay may lower it."""
+        self.scheduler.rate = rate
+        self.scheduler.burst = burst
+
+    def set_obey_robots(self, obey):
+        self.scheduler.robots = obey
+
+    def set_engine(self, engine):
+        if engine not in self.ENGINES:
+            raise RuntimeError('invalid crawler engine.')
+        self.engine = engine
+
+    def set_revalidate(self, pages):
+        """Revalidate pages of a previous crawl with conditional requests.
+
+        `pages' maps url to (etag, last_modified, links) as recorded in
+        `self.crawled'. Unmodified pages are not downloaded nor parsed,
+        process_unmodified is called and their recorded links are followed.
+        """
+        self.revalidate = pages
+
+    def set_retry_policy(self, max_retries, backoff):
+        """Retry a url failing with a network error at most `max_retries'
+        times, waiting backoff * 2 ** n seconds before the n-th retry."""
+        self.max_retries = max_retries
+        self.retry_backoff = backoff
+
+    def set_checkpoint(self, path, interval=60, resume=False):
+        """Journal crawl progress to the SQLite file `path' every `interval'
+        seconds and when interrupted. If resume is True, crawls continue
+        from the journaled state, otherwise the journal is cleared."""
+        self.checkpoint = Checkpoint(path)
+        self.checkpoint_interval = interval
+        self.resume = resume
+        if not resume:
+            self.checkpoint.reset()
 
     def set_max_depth(self, max_depth):
         self.max_depth = max_depth
@@ -169,6 +425,18 @@ class Crawler(object):
         print('GET', doc.status, doc.url, std)
         # to do stuff with url depth use self._calc_depth(doc.url)
 
+    def process_unmodified(self, url, std):
+        print('NOT MODIFIED', url, std)
+
+    def checkpoint_results(self):
+        """Return the results collected so far as a list of JSON
+        serializable rows, journaled along with the crawl state."""
+        return []
+
+    def restore_results(self, rows):
+        """Restore results returned by checkpoint_results."""
+        pass
+
     def crawl(self, url, path=None):
         self.root_url = url
         self.link_parser = create_link_parser(url)
@@ -183,17 +451,90 @@ class Crawler(object):
         if path:
             self.dir_path = path
 
-        self.targets.add((url, ""))
-        self._spawn_new_worker()
-
-        while self.threads:
+        self.link_filters = [re.compile(f) for f in
+                             [self.prefix_filter] + self.url_filters]
+
+        self.targets = Frontier()
+        self.retries = {}
+        self.last_checkpoint = time.time()
+        self.scheduler.load_robots(self.proto, self.host)
+
+        state = None
+        if self.checkpoint and self.resume:
+            state = self.checkpoint.load(url)
+
+        if state:
+            finished, frontier, visited, crawled, results = state
+            self.visited.update((u, True) for u in visited)
+            self.crawled.update(crawled)
+            self.restore_results(results)
+            if finished:
+                return
+            for target in frontier:
+                self.visited[target[0]] = True
+                self.targets.put(target)
+        else:
+            with self.targets_lock:
+                self.visited[url] = True
+            self.targets.put((url, ""))
+
+        try:
+            if self.engine == self.E_ASYNCIO:
+                # Imported lazily, asyncio is only needed by this engine
+                from cppman.aiocrawler import AsyncEngine
+                AsyncEngine(self).run()
+            else:
+                self._run_workers()
+        except KeyboardInterrupt:
+            self.targets.close()
+            if self.checkpoint:
+                self.save_checkpoint()
+                print('\nCrawl interrupted, progress saved to %s' %
+                      self.checkpoint.path)
+            sys.exit(1)
+        finally:
+            self.scheduler.print_stats(self.host)
+
+        if self.checkpoint:
+            self.save_checkpoint(finished=True)
+
+    def save_checkpoint(self, finished=False):
+        # Order matters: a url missing from the frontier snapshot has either
+        # not been visited yet, or has been processed and thus has its
+        # results in the later snapshots.
+        with self.targets_lock:
+            visited = list(self.visited)
+        frontier = self.targets.snapshot()
+        crawled = list(self.crawled.items())
+        results = self.checkpoint_results()
+
+        self.checkpoint.save(self.root_url, finished, frontier, visited,
+                             crawled, results)
+        self.last_checkpoint = time.time()
+
+    def _maybe_checkpoint(self):
+        if not self.checkpoint or \
+                time.time() - self.last_checkpoint < self.checkpoint_interval:
+            return
+        # Let a single worker do it, the others keep crawling
+        if self.checkpoint_lock.acquire(False):
             try:
-                for t in self.threads:
-                    t.join(1)
-                    if not t.isAlive():
-                        self.threads.remove(t)
-            except KeyboardInterrupt:
-                sys.exit(1)
+                if time.time() - self.last_checkpoint >= \
+                        self.checkpoint_interval:
+                    self.save_checkpoint()
+            finally:
+                self.checkpoint_lock.release()
+
+    def _run_workers(self):
+        self.threads = []
+        for i in range(max(1, self.max_outstanding)):
+            t = Thread(target=self._worker, args=(i,))
+            t.daemon = True
+            self.threads.append(t)
+            t.start()
+
+        for t in self.threads:
+            t.join()
 
     def _url_domain(self, host):
         parts = host.split('.')
@@ -204,27 +545,22 @@ class Crawler(object):
         else:
             return '.'.join(parts[1:])
 
-    def _follow_link(self, url, link):
-        # Skip prefix
-        if re.search(self.prefix_filter, link):
-            return None
-
-        # Filter url
-        for f in self.url_filters:
-            if re.search(f, link):
+    def _follow_link(self, url, link, parent=None):
+        """Resolve `link' found on page `url', returns None if it is not to
+        be followed. `parent' is split_url(url), pass it when following many
+        links of the same page."""
+        # Skip prefix and filter url
+        for f in self.link_filters:
+            if f.search(link):
                 return None
 
         if not self.include_hashtag:
-            link = re.sub(r'(%23|#).*$', '', link)
+            link = HASHTAG.sub('', link)
 
-        rx = re.match('(https?://)([^/:]+)(:[0-9]+)?([^\?]*)(\?.*)?', url)
-        url_proto = rx.group(1)
-        url_host = rx.group(2)
-        url_port = rx.group(3) if rx.group(3) else ''
-        url_path = rx.group(4) if len(rx.group(4)) > 0 else '/'
-        url_dir_path = os.path.dirname(url_path)
+        url_proto, url_host, url_port, url_path, url_dir_path = \
+            parent or split_url(url)
 
-        rx = re.match('((https?://)([^/:]+)(:[0-9]+)?)?([^\?]*)(\?.*)?', link)
+        rx = LINK_URL.match(link)
         link_full_url = rx.group(1) is not None
         link_proto = rx.group(2) if rx.group(2) else url_proto
         link_host = rx.group(3) if rx.group(3) else url_host
@@ -244,9 +580,9 @@ class Crawler(object):
             return link_url if self._url_domain(self.host) == \
                 self._url_domain(link_host) else None
         elif self.follow_mode == self.F_SAME_HOST:
-            return link_url if self.host == link_host else None
+            return link_url if self.host == link_host + link_port else None
         elif self.follow_mode == self.F_SAME_PATH:
-            if self.host == link_host and \
+            if self.host == link_host + link_port and \
                     link_dir_path.startswith(self.dir_path):
                 return link_url
             else:
@@ -264,26 +600,102 @@ class Crawler(object):
         if self.max_depth and self._calc_depth(target) > self.max_depth:
             return
 
+        proto, host, port = split_url(target)[:3]
+        if not self.scheduler.allowed(proto, host + port, target):
+            return
+
         with self.targets_lock:
-          if target in self.visited:
-              return
-          self.targets.add((target, std))
-
-    def _spawn_new_worker(self):
-        with self.concurrency_lock:
-          self.concurrency += 1
-          t = Thread(target=self._worker, args=(self.concurrency,))
-          t.daemon = True
-          self.threads.append(t)
-          t.start()
+            if target in self.visited:
+                return
+            self.visited[target] = True
+            self.targets.put((target, std))
+
+    def _retry(self, url, std, delay=None):
+        """Re-queue a target which failed with a network error, with
+        exponential backoff, or after `delay' seconds if given, until its
+        retry budget is exhausted."""
+        with self.targets_lock:
+            attempt = self.retries.get(url, 0) + 1
+            self.retries[url] = attempt
+
+        if attempt > self.max_retries:
+            print('Giving up %s after %d retries' % (url, self.max_retries))
+            return
+
+        if delay is None:
+            delay = self.retry_backoff * 2 ** (attempt - 1)
+        self.targets.put((url, std), delay)
+
+    def _request_headers(self, url):
+        """Conditional request headers for `url', if it was crawled
+        before."""
+        headers = {'User-Agent': self.scheduler.user_agent}
+        if url in self.revalidate:
+            etag, last_modified, links = self.revalidate[url]
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+        return headers
+
+    def _handle_response(self, url, std, res):
+        """Process a fetched response, shared by all crawler engines."""
+        if res.status == 404:
+            return
+
+        if res.status in THROTTLED:
+            # The host is blocked for its Retry-After time
+            proto, host, port = split_url(url)[:3]
+            self._retry(url, std, self.scheduler.delay(host + port))
+            return
+
+        if res.status == 304 and url in self.revalidate:
+            page = self.revalidate[url]
+            self.crawled[url] = page
+            self.process_unmodified(url, std)
+            for rlink, link_std in page[2]:
+                self._add_target(rlink, link_std)
+            return
+
+        if res.status == 301 or res.status == 302:
+            rlink = self._follow_link(url, res.getheader('location'))
+            self._add_target(rlink)
+            return
+
+        # Check content type
+        try:
+            if not re.search(
+                self.content_type_filter,
+                    res.getheader('Content-Type')):
+                return
+        except TypeError:  # getheader result is None
+            return
+
+        doc = Document(res, url)
+        self.process_document(doc, std)
+
+        # Make unique list
+        links = self.link_parser.get_unique_links(doc.text)
+
+        parent = split_url(url)
+        followed = []
+        for link in links:
+            rlink = self._follow_link(url, link.url.strip(), parent)
+            if rlink:
+                followed.append((rlink, link.std))
+            self._add_target(rlink, link.std)
+
+        self.crawled[url] = (res.getheader('ETag'),
+                             res.getheader('Last-Modified'), followed)
 
     def _worker(self, sid):
-        while self.targets:
-            try:
-                with self.targets_lock:
-                  (url, std) = self.targets.pop()
-                  self.visited[url] = True
+        while True:
+            target = self.targets.get()
+            if target is None:
+                break
 
+            (url, std) = target
+            try:
                 rx = re.match('(https?)://([^/]+)(.*)', url)
                 protocol = rx.group(1)
                 host = rx.group(2)
@@ -294,45 +706,24 @@ class Crawler(object):
                 else:
                     conn = httplib.HTTPSConnection(host, timeout=10)
 
-                conn.request('GET', path)
-                res = conn.getresponse()
-
-                if res.status == 404:
-                    continue
-
-                if res.status == 301 or res.status == 302:
-                    rlink = self._follow_link(url, res.getheader('location'))
-                    self._add_target(rlink)
-                    continue
-
-                # Check content type
+                self.scheduler.acquire(host)
+                start = time.time()
                 try:
-                    if not re.search(
-                        self.content_type_filter,
-                            res.getheader('Content-Type')):
-                        continue
-                except TypeError:  # getheader result is None
-                    continue
-
-                doc = Document(res, url)
-                self.process_document(doc, std)
-
-                # Make unique list
-                links = self.link_parser.get_unique_links(doc.text)
-
-
-                for link in links:
-                    rlink = self._follow_link(url, link.url.strip())
-                    self._add_target(rlink, link.std)
-
-                if self.concurrency < self.max_outstanding:
-                    self._spawn_new_worker()
-            except KeyError:
-                # Pop from an empty set
-                break
+                    conn.request('GET', path,
+                                 headers=self._request_headers(url))
+                    res = conn.getresponse()
+                except (httplib.HTTPException, EnvironmentError):
+                    self.scheduler.release(host, latency=time.time() - start,
+                                           error=True)
+                    raise
+                self.scheduler.release(host, res.status, time.time() - start,
+                                       res.getheader('Retry-After'))
+                self._handle_response(url, std, res)
             except (httplib.HTTPException, EnvironmentError):
-                with self.targets_lock:
-                  self.targets.add((url, ""))
+                self._retry(url, std)
+            except Exception as e:
+                print('Error processing %s: %s' % (url, e))
+            finally:
+                self.targets.task_done(target)
 
-        with self.concurrency_lock:
-          self.concurrency -= 1
+            self._maybe_checkpoint()
@@ -32,15 +32,23 @@ HOME = os.path.expanduser('~')
 man_dir = HOME + '/.local/share/man/'
 config_dir = HOME + '/.config/cppman/'
 config_file = config_dir + 'cppman.cfg'
+cache_dir = HOME + '/.cache/cppman/'
+snapshot_dir = cache_dir + 'snapshots/'
+pack_file = cache_dir + 'pages.pack'
+manifest_file = cache_dir + 'manifest.db'
+search_db = cache_dir + 'search.db'
+names_file = cache_dir + 'names.idx'
+completion_list = cache_dir + 'completion.list'
+render_dir = cache_dir + 'rendered/'
 
-config = Config(config_file)
+# Bytes of typeset pages kept in render_dir
+render_cache_size = 32 * 1024 * 1024
 
-try:
-    os.makedirs(config_dir)
-except:
-    pass
+config = Config(config_file)
 
 index_db_re = os.path.normpath(os.path.join(config_dir, 'index.db'))
+crawl_checkpoint = os.path.normpath(os.path.join(config_dir,
+                                                 'crawl-checkpoint.db'))
 
 index_db = index_db_re if os.path.exists(index_db_re) \
     else get_lib_path('index.db')
@@ -53,3 +61,13 @@ source = config.Source
 if source not in config.SOURCES:
     source = config.SOURCES[0]
     config.Source = source
+
+cache_backend = config.CacheBackend
+if cache_backend not in config.CACHE_BACKENDS:
+    cache_backend = config.CACHE_BACKENDS[0]
+    config.CacheBackend = cache_backend
+
+renderer = config.Renderer
+if renderer not in config.RENDERERS:
+    renderer = config.RENDERERS[0]
+    config.Renderer = renderer
@@ -27,6 +27,7 @@ import re
 import urllib.request
 
 from cppman.util import html2man, fixupHTML
+from cppman.formatter.rules import RuleSet, splice
 from cppman.formatter.tableparser import parse_table
 
 
@@ -136,9 +137,16 @@ rps = [
     (r'\n\s*\n+', r'\n', 0),
     (r'\n\n+', r'\n', 0),
     # Preserve \n" in EXAMPLE
-    (r'\\n', r'\en', 0),
+    (r'\\n', r'\\en', 0),
 ]
 
+pre_rules = RuleSet(pre_rps)
+rules = RuleSet(rps)
+
+# Table cells starting with '.', escaped not to be taken for requests
+DOT_CELL = re.compile(r'T{\n(\..*?)\nT}', re.S)
+
+
 def escape_pre_section(table):
     """Escape <pre> section in table."""
     def replace_newline(g):
@@ -156,22 +164,20 @@ def html2groff(data, name):
         pass
 
     # Pre replace all
-    for rp in pre_rps:
-        data = re.compile(rp[0], rp[2]).sub(rp[1], data)
+    data = pre_rules.sub(data)
 
-    for table in re.findall(r'<table.*?>.*?</table>', data, re.S):
-        tbl = parse_table(escape_pre_section(table))
+    def format_table(g):
+        tbl = parse_table(escape_pre_section(g.group(0)))
         # Escape column with '.' as prefix
-        tbl = re.compile(r'T{\n(\..*?)\nT}', re.S).sub(r'T{\n\E \1\nT}', tbl)
-        data = data.replace(table, tbl)
+        return DOT_CELL.sub(r'T{\n\\E \1\nT}', tbl)
+
+    data = re.sub(r'<table.*?>.*?</table>', format_table, data, flags=re.S)
 
     # Replace all
-    for rp in rps:
-        data = re.compile(rp[0], rp[2]).sub(rp[1], data)
+    data = rules.sub(data)
 
     # Upper case all section headers
-    for st in re.findall(r'.SH .*\n', data):
-        data = data.replace(st, st.upper())
+    data = re.sub(r'.SH .*\n', lambda g: g.group(0).upper(), data)
 
     # Add tags to member/inherited member functions
     # e.g. insert -> vector::insert
@@ -189,9 +195,13 @@ def html2groff(data, name):
     if page_type and 'class' in page_type.group(1):
         class_name = re.search(r'\n\.SH "NAME"\n(?:.*::)?(.+?) ', data).group(1)
 
-        secs = re.findall(r'\n\.SH "(.+?)"(.+?)\.SE', data, re.S)
+        # The edits of the sections are spliced in at once, at the offsets
+        # they are found
+        secs = re.finditer(r'\n\.SH "(.+?)"(.+?)\.SE', data, re.S)
 
-        for sec, content in secs:
+        edits = []
+        for g in secs:
+            sec, content = g.groups()
             # Member functions
             if ('MEMBER' in sec and
                 'NON-MEMBER' not in sec and
@@ -204,14 +214,15 @@ def html2groff(data, name):
                                   content2)
                 content2 = re.sub(r'\(destructor\)', r'~%s' % class_name,
                                   content2)
-                data = data.replace(content, content2)
+                edits.append(g.span(2) + (content2,))
             # Inherited member functions
             elif 'MEMBER' in sec and 'INHERITED' in sec:
                 inherit = re.search(r'.+?INHERITED FROM (.+)',
                                     sec).group(1).lower()
                 content2 = re.sub(r'\n\.IP "(.+)"', r'\n.IP "%s::\1"'
                                   % inherit, content)
-                data = data.replace(content, content2)
+                edits.append(g.span(2) + (content2,))
+        data = splice(data, edits)
 
     # Remove pseudo macro '.SE'
     data = data.replace('\n.SE', '')
@@ -30,13 +30,18 @@ import urllib.request
 from functools import partial
 
 from cppman.util import html2man, fixupHTML
+from cppman.formatter.rules import RuleSet, splice
 from cppman.formatter.tableparser import parse_table
 
 
+# Table cells starting with '.', escaped not to be taken for requests
+DOT_CELL = re.compile(r'T{\n(\..*?)\nT}', re.S)
+
+
 def member_table_def(g):
     tbl = parse_table('<table>%s</table>' % str(g.group(3)))
     # Escape column with '.' as prefix
-    tbl = re.compile(r'T{\n(\..*?)\nT}', re.S).sub(r'T{\n\E \1\nT}', tbl)
+    tbl = DOT_CELL.sub(r'T{\n\\E \1\nT}', tbl)
     return '\n.IP "%s"\n%s\n%s\n' % (g.group(1), g.group(2), tbl)
 
 
@@ -58,7 +63,7 @@ def member_type_function(g):
 NAV_BAR_END = '<div class="t-navbar-sep">.?</div></div>'
 
 # Format replacement RE list
-# The '.SE' pseudo macro is described in the function: html2groff
+# The '.SE' pseudo macro is described in the function: postprocess
 rps = [
     # Workaround: remove <p> in t-dcl
     (r'<tr class="t-dcl">(.*?)</tr>',
@@ -172,7 +177,7 @@ rps = [
     (r'\n\s*\n+', r'\n', 0),
     (r'\n\n+', r'\n', 0),
     # Preserve \n" in EXAMPLE
-    (r'\\n', r'\en', 0),
+    (r'\\n', r'\\en', 0),
     # Remove leading whitespace
     (r'^\s+', r'', re.S),
     # Trailing white-spaces
@@ -185,6 +190,8 @@ rps = [
     (r'(?<!T{)\n\s*(\[(:?since|until) C\+\+\d+\])', r' \1', re.S)
 ]
 
+rules = RuleSet(rps)
+
 
 def html2groff(data, name):
     """Convert HTML text from cppreference.com to Groff-formatted text."""
@@ -198,24 +205,27 @@ def html2groff(data, name):
     # Remove non-printable characters
     data = ''.join([x for x in data if x in string.printable])
 
-    for table in re.findall(
-            r'<table class="(?:wikitable|dsctable)"[^>]*>.*?</table>',
-            data, re.S):
-        tbl = parse_table(table)
+    def format_table(g):
+        tbl = parse_table(g.group(0))
         # Escape column with '.' as prefix
-        tbl = re.compile(r'T{\n(\..*?)\nT}', re.S).sub(r'T{\n\E \1\nT}', tbl)
-        data = data.replace(table, tbl)
+        return DOT_CELL.sub(r'T{\n\\E \1\nT}', tbl)
+
+    data = re.sub(r'<table class="(?:wikitable|dsctable)"[^>]*>.*?</table>',
+                  format_table, data, flags=re.S)
 
     # Pre replace all
-    for rp in rps:
-        data = re.compile(rp[0], rp[2]).sub(rp[1], data)
+    data = rules.sub(data)
+
+    return postprocess(data, name)
+
 
+def postprocess(data, name):
+    """Finish the groff text of the page name, from the rules."""
     # Remove non-printable characters
     data = ''.join([x for x in data if x in string.printable])
 
     # Upper case all section headers
-    for st in re.findall(r'.SH .*\n', data):
-        data = data.replace(st, st.upper())
+    data = re.sub(r'.SH .*\n', lambda g: g.group(0).upper(), data)
 
     # Add tags to member/inherited member functions
     # e.g. insert -> vector::insert
@@ -249,10 +259,13 @@ def html2groff(data, name):
             normalized_class_name = class_name[len('std::'):]
         else:
             normalized_class_name = class_name
-        class_member_content = data[:idx]
-        secs = re.findall(r'\.SH "(.+?)"(.+?)\.SE', class_member_content, re.S)
-
-        for sec, content in secs:
+        # The sections of the class, before the inherited members. Their
+        # edits are spliced in at once, at the offsets they are found.
+        secs = re.compile(r'\.SH "(.+?)"(.+?)\.SE', re.S).finditer(data, 0,
+                                                                    idx)
+        edits = []
+        for g in secs:
+            sec, content = g.groups()
             # Member functions
             if ('MEMBER' in sec and
                 'NON-MEMBER' not in sec and
@@ -266,25 +279,30 @@ def html2groff(data, name):
                                   normalized_class_name, content2)
                 content2 = re.sub(r'\(destructor\)', r'~%s' %
                                   normalized_class_name, content2)
-                data = data.replace(content, content2)
-
-    blocks = re.findall(r'\.IBEGIN\s*(.+?)\s*\n(.+?)\.IEND', data, re.S)
+                edits.append(g.span(2) + (content2,))
+        data = splice(data, edits)
 
-    for inherited_class, content in blocks:
-        content2 = re.sub(r'\.SH "(.+?)"', r'\n.SH "\1 INHERITED FROM %s"'
-                          % inherited_class.upper(), content)
-        data = data.replace(content, content2)
+    blocks = re.finditer(r'\.IBEGIN\s*(.+?)\s*\n(.+?)\.IEND', data, re.S)
 
-        secs = re.findall(r'\.SH "(.+?)"(.+?)\.SE', content, re.S)
+    edits = []
+    for g in blocks:
+        inherited_class, content = g.groups()
+        secs = re.finditer(r'\.SH "(.+?)"(.+?)\.SE', content, re.S)
 
-        for sec, content in secs:
+        members = []
+        for sec in secs:
             # Inherited member functions
-            if 'MEMBER' in sec and \
-               sec != 'MEMBER TYPES':
+            if 'MEMBER' in sec.group(1) and \
+               sec.group(1) != 'MEMBER TYPES':
                 content2 = re.sub(r'\n\.IP "(.+)"',
                                   partial(add_header_multi, inherited_class),
-                                  content)
-                data = data.replace(content, content2)
+                                  sec.group(2))
+                members.append(sec.span(2) + (content2,))
+
+        content2 = re.sub(r'\.SH "(.+?)"', r'\n.SH "\1 INHERITED FROM %s"'
+                          % inherited_class.upper(), splice(content, members))
+        edits.append(g.span(2) + (content2,))
+    data = splice(data, edits)
 
     # Remove unneeded pseudo macro
     data = re.sub('(?:\n.SE|.IBEGIN.*?\n|\n.IEND)', '', data)
@@ -0,0 +1,427 @@
+# -*- coding: utf-8 -*-
+#
+# htmltree.py - HTML parsed into a tree of elements, with html.parser
+#
+# Copyright (C) 2010 - 2016  Wei-Ning Huang (AZ) <aitjcize@gmail.com>
+# All Rights reserved.
+#
+# This file is part of cppman.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+import re
+
+from html import unescape
+
+
+# Tags, comments and declarations; a '<' starting none of them is text
+TOKEN = re.compile(r"""<(?:(/?)([a-zA-Z][^\t\n\f\r />]*)"""
+                   r"""((?:[^>"']|"[^"]*"|'[^']*')*)>|!--.*?--!?>|[!?][^>]*>)""",
+                   re.S)
+ATTR = re.compile(r"""([^\s/>=][^\s/=>]*)(?:\s*=+\s*('[^']*'|"[^"]*"|"""
+                  r"""(?!['"])[^>\s]*))?""")
+# Elements whose content is text up to their end tag
+RAW_TEXT = frozenset(['script', 'style'])
+
+# Elements without content or end tag
+VOID = frozenset(['area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input',
+                  'link', 'meta', 'param', 'source', 'track', 'wbr'])
+
+# Elements whose end tag closes the elements left open in them, and which
+# the end tag of other elements doesn't close, as in HTML5
+SPECIAL = frozenset([
+    'address', 'applet', 'area', 'article', 'aside', 'base', 'blockquote',
+    'body', 'br', 'button', 'caption', 'center', 'col', 'colgroup', 'dd',
+    'details', 'dir', 'div', 'dl', 'dt', 'embed', 'fieldset', 'figcaption',
+    'figure', 'footer', 'form', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'head',
+    'header', 'hr', 'html', 'iframe', 'img', 'input', 'li', 'link', 'main',
+    'marquee', 'menu', 'meta', 'nav', 'noscript', 'object', 'ol', 'p',
+    'param', 'pre', 'script', 'section', 'select', 'source', 'style',
+    'summary', 'table', 'tbody', 'td', 'template', 'textarea', 'tfoot', 'th',
+    'thead', 'title', 'tr', 'track', 'ul', 'wbr'])
+
+# Elements an open element is looked for up to at most
+SCOPE = frozenset(['applet', 'caption', 'html', 'table', 'td', 'th',
+                   'marquee', 'object', 'template', 'button'])
+
+# Start tags closing an open <p>
+CLOSES_P = frozenset([
+    'address', 'article', 'aside', 'blockquote', 'dd', 'details', 'div',
+    'dl', 'dt', 'fieldset', 'figcaption', 'figure', 'footer', 'form', 'h1',
+    'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'hr', 'li', 'main', 'menu',
+    'nav', 'ol', 'p', 'pre', 'section', 'table', 'ul'])
+
+TABLE_SECTIONS = frozenset(['tbody', 'thead', 'tfoot'])
+
+# Elements containing the cells, rows and sections of a table
+TABLE_SCOPE = frozenset(['html', 'table', 'template'])
+
+# Elements of tables, whose end tags close those left open in them
+TABLE_ELEMENTS = frozenset(['caption', 'table', 'tbody', 'td', 'tfoot', 'th',
+                            'thead', 'tr'])
+
+# Start tags closing the open elements of their kind, up to the elements
+# containing them
+IMPLIED_END = {
+    'li': (('li',), SCOPE | frozenset(['ul', 'ol'])),
+    'dt': (('dt', 'dd'), SCOPE | frozenset(['dl'])),
+    'dd': (('dt', 'dd'), SCOPE | frozenset(['dl'])),
+    'tr': (('tr',), TABLE_SCOPE),
+    'td': (('td', 'th'), TABLE_SCOPE | frozenset(['tr'])),
+    'th': (('td', 'th'), TABLE_SCOPE | frozenset(['tr'])),
+    'tbody': (TABLE_SECTIONS, TABLE_SCOPE),
+    'thead': (TABLE_SECTIONS, TABLE_SCOPE),
+    'tfoot': (TABLE_SECTIONS, TABLE_SCOPE),
+    'option': (('option',), frozenset(['select'])),
+}
+
+# Scope of the <p> closed by the start of a block
+BUTTON_SCOPE = SCOPE | frozenset(['button'])
+
+
+def escape(text):
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def quote(value):
+    """The attribute value, escaped and quoted as BeautifulSoup does."""
+    value = escape(value)
+    if '"' not in value:
+        return '"%s"' % value
+    if "'" not in value:
+        return "'%s'" % value
+    return '"%s"' % value.replace('"', '&quot;')
+
+
+class Element(object):
+    """An element, of tag, a list of (name, value) attributes and children,
+    elements and strings."""
+    __slots__ = ('tag', 'attrs', 'children', 'parent')
+
+    def __init__(self, tag, attrs=(), parent=None):
+        self.tag = tag
+        self.attrs = attrs
+        self.children = []
+        self.parent = parent
+
+    def __repr__(self):
+        return '<Element %s %r>' % (self.tag, self.attrs)
+
+    def get(self, name, default=None):
+        for key, value in self.attrs:
+            if key == name:
+                return value if value is not None else ''
+        return default
+
+    @property
+    def classes(self):
+        return self.get('class', '').split()
+
+    def iter(self, tag=None):
+        """The descendant elements, of tag, in document order."""
+        stack = [iter(self.children)]
+        while stack:
+            for child in stack[-1]:
+                if type(child) is Element:
+                    if tag is None or child.tag == tag:
+                        yield child
+                    stack.append(iter(child.children))
+                    break
+            else:
+                stack.pop()
+
+    def find(self, tag=None, cls=None):
+        """The first descendant of tag, with the class cls, or None."""
+        for element in self.iter(tag):
+            if cls is None or cls in element.classes:
+                return element
+        return None
+
+    def text(self):
+        """The text of the element and its descendants."""
+        parts = []
+        stack = [iter(self.children)]
+        while stack:
+            for child in stack[-1]:
+                if type(child) is Element:
+                    stack.append(iter(child.children))
+                    break
+                parts.append(child)
+            else:
+                stack.pop()
+        return ''.join(parts)
+
+    def html(self):
+        """The element serialized as HTML, as BeautifulSoup does: void
+        elements as <br/>, text with &, < and > escaped."""
+        parts = []
+        serialize(self, parts)
+        return ''.join(parts)
+
+    def inner_html(self):
+        """The children of the element serialized as HTML."""
+        parts = []
+        serialize_children(self, parts)
+        return ''.join(parts)
+
+
+def serialize(element, parts):
+    parts.append('<' + element.tag)
+    for name, value in element.attrs:
+        if value is None:
+            parts.append(' ' + name)
+        else:
+            parts.append(' %s=%s' % (name, quote(value)))
+    if element.tag in VOID:
+        parts.append('/>')
+        return
+    parts.append('>')
+    serialize_children(element, parts)
+    parts.append('</%s>' % element.tag)
+
+
+def serialize_children(element, parts):
+    raw = element.tag in RAW_TEXT
+    for child in element.children:
+        if type(child) is Element:
+            serialize(child, parts)
+        else:
+            parts.append(child if raw else escape(child))
+
+
+def serialize_lxml(element, parts):
+    """Serialize the lxml element as serialize() does an Element."""
+    tag = element.tag
+    if isinstance(tag, str):
+        parts.append('<' + tag)
+        for name, value in element.attrib.items():
+            parts.append(' %s=%s' % (name, quote(value)))
+        if tag in VOID:
+            parts.append('/>')
+        else:
+            parts.append('>')
+            if element.text:
+                parts.append(element.text if tag in RAW_TEXT
+                             else escape(element.text))
+            for child in element:
+                serialize_lxml(child, parts)
+            parts.append('</%s>' % tag)
+    # Comments and processing instructions are dropped, as by parse()
+    if element.tail:
+        parts.append(escape(element.tail))
+
+
+class TreeBuilder(object):
+    """Build the tree of a document, closing the elements left open and
+    ignoring stray end tags mostly as HTML5 parsers do."""
+    def __init__(self):
+        self.root = Element('#document')
+        self.stack = [self.root]
+
+    def feed(self, html):
+        """Tokenize html, with a single scan by TOKEN."""
+        pos = 0
+        raw = None
+        for m in TOKEN.finditer(html):
+            tag = m.group(2)
+            if raw is not None:
+                # Only the end tag of a <script> or <style> ends its text
+                if m.group(1) and tag.lower() == raw:
+                    if m.start() > pos:
+                        self.stack[-1].children.append(html[pos:m.start()])
+                    self.handle_endtag(raw)
+                    pos = m.end()
+                    raw = None
+                continue
+
+            if m.start() > pos:
+                self.handle_data(html[pos:m.start()])
+            pos = m.end()
+            if tag is None:
+                # Comment or declaration
+                continue
+            tag = tag.lower()
+            if m.group(1):
+                self.handle_endtag(tag)
+                continue
+
+            attrs = m.group(3)
+            if attrs.endswith('/'):
+                self.handle_startendtag(tag, parse_attrs(attrs))
+                continue
+            self.handle_starttag(tag, parse_attrs(attrs) if attrs else [])
+            if tag in RAW_TEXT:
+                raw = tag
+
+        if pos < len(html):
+            if raw is None:
+                self.handle_data(html[pos:])
+            else:
+                self.stack[-1].children.append(html[pos:])
+
+    def close_to(self, element):
+        while self.stack.pop() is not element:
+            pass
+
+    def in_scope(self, tags, boundary):
+        """The open element of tags nearest to the current one, or None if
+        an element of boundary comes first."""
+        for element in reversed(self.stack):
+            if element.tag in tags:
+                return element
+            if element.tag in boundary:
+                return None
+        return None
+
+    def open(self, tag, attrs=()):
+        element = Element(tag, attrs, self.stack[-1])
+        self.stack[-1].children.append(element)
+        if tag not in VOID:
+            self.stack.append(element)
+
+    def handle_starttag(self, tag, attrs):
+        if tag in CLOSES_P:
+            p = self.in_scope(('p',), BUTTON_SCOPE)
+            if p is not None:
+                self.close_to(p)
+        if tag in IMPLIED_END:
+            tags, boundary = IMPLIED_END[tag]
+            open_element = self.in_scope(tags, boundary)
+            if open_element is not None:
+                self.close_to(open_element)
+
+            # Rows are in a <tbody> and cells in a <tr>
+            current = self.stack[-1].tag
+            if tag in ('tr', 'td', 'th') and current == 'table':
+                self.open('tbody')
+                current = 'tbody'
+            if tag in ('td', 'th') and current in TABLE_SECTIONS:
+                self.open('tr')
+
+        self.open(tag, attrs)
+
+    def handle_startendtag(self, tag, attrs):
+        # As in HTML5, '/>' only ends void elements, such as <br/>
+        self.handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag):
+        if tag in VOID:
+            if tag == 'br':
+                # </br> is taken for <br>
+                self.handle_starttag(tag, [])
+            return
+        if tag == 'p' and self.in_scope(('p',), BUTTON_SCOPE) is None:
+            # A </p> without <p> is an empty paragraph
+            self.handle_starttag(tag, [])
+        for element in reversed(self.stack[1:]):
+            if element.tag == tag:
+                self.close_to(element)
+                return
+            if tag in TABLE_ELEMENTS:
+                # Closes the cells and rows left open, within its table
+                if element.tag == 'table':
+                    return
+            elif element.tag in SPECIAL and (tag not in SPECIAL or
+                                             element.tag in SCOPE):
+                # Stray end tag
+                return
+
+    def handle_data(self, data):
+        if '&' in data:
+            data = unescape(data)
+        children = self.stack[-1].children
+        if not children and self.stack[-1].tag == 'pre' and \
+                data.startswith('\n'):
+            # A newline right after <pre> isn't part of its content
+            data = data[1:]
+        if children and type(children[-1]) is str:
+            children[-1] += data
+        elif data:
+            children.append(data)
+
+
+def parse_attrs(attrs):
+    """The (name, value) attributes of the attribute string of a tag."""
+    return [(name.lower(), parse_value(value))
+            for name, value in ATTR.findall(attrs)]
+
+
+def parse_value(value):
+    """The value of an attribute, as matched by ATTR, empty without one."""
+    if value[:1] in ('"', "'"):
+        value = value[1:-1]
+    return unescape(value) if '&' in value else value
+
+
+def parse(html):
+    """The document element of html, a str or UTF-8 bytes."""
+    if isinstance(html, bytes):
+        html = html.decode('utf-8', 'replace')
+    builder = TreeBuilder()
+    builder.feed(html)
+    return builder.root
+
+
+def normalize(html):
+    """html, a str or UTF-8 bytes, with its tags balanced, serialized as
+    BeautifulSoup does."""
+    return parse(html).inner_html()
+
+
+def normalize_lxml(html, parser):
+    """html with its tags balanced, by parser, html5_parser.parse or
+    lxml.html.document_fromstring, serialized as BeautifulSoup does."""
+    parts = []
+    serialize_lxml(parser(html), parts)
+    return ''.join(parts)
+
+
+def loosened(html):
+    """html, as BeautifulSoup serializes it, with the tags HTML lets pages
+    leave out removed and the entities they use instead of characters."""
+    html = re.sub(r'</(?:li|td|th|tr|tbody)>|<tbody>', '', html)
+    html = re.sub(r'</p>(<(?:p|div|table|h\d|ul|pre)[ >])', r'\1', html)
+    return html.replace('<br/>', '<br>').replace('\xa0', '&nbsp;')
+
+
+def func_test(corpus_dir):
+    """Check the pages of corpus_dir/<source>, loosened, are formatted as
+    saved with every installed normalizer."""
+    import os
+    from cppman import util
+    from cppman.formatter import cplusplus, cppreference
+
+    formatters = {'cplusplus.com': cplusplus,
+                  'cppreference.com': cppreference}
+    normalizers = []
+    for normalizer in util.NORMALIZERS:
+        try:
+            util.fixupHTML('<p>', normalizer)
+        except (ImportError, RuntimeError):
+            continue
+        normalizers.append(normalizer)
+
+    for source, formatter in sorted(formatters.items()):
+        directory = os.path.join(corpus_dir, source)
+        for filename in sorted(os.listdir(directory)):
+            with open(os.path.join(directory, filename),
+                      encoding='utf-8') as f:
+                html = f.read()
+            expected = formatter.html2groff(html, filename)
+            for normalizer in normalizers:
+                result = formatter.html2groff(
+                    util.fixupHTML(loosened(html), normalizer), filename)
+                assert result == expected, (source, filename, normalizer)
@@ -0,0 +1,345 @@
+# -*- coding: utf-8 -*-
+#
+# rules.py - compiled substitution rules of the formatters
+#
+# Copyright (C) 2010 - 2016  Wei-Ning Huang (AZ) <aitjcize@gmail.com>
+# All Rights reserved.
+#
+# This file is part of cppman.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+import re
+import time
+
+# Single characters written as escapes
+ESCAPES = {'a': '\a', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t', 'v': '\v'}
+# Classes written as escapes, and whether they contain a newline
+CATEGORIES = {'d': False, 'w': False, 'S': False,
+              's': True, 'D': True, 'W': True}
+# Also matches some literal braces, which are then taken for a repeat
+QUANTIFIER = re.compile(r'(?:[*+?]|\{\d*,?\d*\})[?+]?')
+
+
+def scan(pattern, flags):
+    """The alternatives of pattern, each a list of (kind, value) items:
+    ('char', c) for a character, ('set', newline) for a class of
+    characters, newline telling whether it contains a newline, ('group',
+    alternatives), ('repeat', item), ('ref', None) for a backreference and
+    ('anchor', None) for an anchor or lookaround. None for the patterns
+    using syntax beyond that, or flags that change what characters match,
+    which the optimizations then leave alone."""
+    if flags & (re.I | re.X):
+        return None
+    try:
+        branches, end = scan_branches(pattern, 0, flags)
+    except ValueError:
+        return None
+    return branches if end == len(pattern) else None
+
+
+def scan_branches(pattern, pos, flags):
+    branches = [[]]
+    while pos < len(pattern) and pattern[pos] != ')':
+        items = branches[-1]
+        match = QUANTIFIER.match(pattern, pos)
+        if pattern[pos] == '|':
+            branches.append([])
+            pos += 1
+        elif match:
+            if not items or items[-1][0] in ('anchor', 'repeat'):
+                raise ValueError(pattern)
+            items[-1] = ('repeat', items[-1])
+            pos = match.end()
+        else:
+            item, pos = scan_item(pattern, pos, flags)
+            items.append(item)
+    return branches, pos
+
+
+def scan_item(pattern, pos, flags):
+    char = pattern[pos]
+    if char == '\\':
+        return scan_escape(pattern, pos + 1, False)
+    if char == '[':
+        return scan_class(pattern, pos + 1)
+    if char == '(':
+        return scan_group(pattern, pos + 1, flags)
+    if char == '.':
+        return ('set', bool(flags & re.S)), pos + 1
+    if char in '^$':
+        return ('anchor', None), pos + 1
+    return ('char', char), pos + 1
+
+
+def scan_escape(pattern, pos, in_class):
+    if pos == len(pattern):
+        raise ValueError(pattern)
+    char = pattern[pos]
+    if char in ESCAPES:
+        return ('char', ESCAPES[char]), pos + 1
+    if char in CATEGORIES:
+        return ('set', CATEGORIES[char]), pos + 1
+    if char in 'bBAZ' and not in_class:
+        return ('anchor', None), pos + 1
+    if char in '123456789' and not in_class:
+        end = pos + 1
+        while end < len(pattern) and pattern[end].isdigit():
+            end += 1
+        if end - pos > 2:
+            raise ValueError(pattern)
+        return ('ref', None), end
+    if char.isalnum():
+        # Octal, hexadecimal and named characters
+        raise ValueError(pattern)
+    return ('char', char), pos + 1
+
+
+def scan_class(pattern, pos):
+    negated = pattern.startswith('^', pos)
+    if negated:
+        pos += 1
+    newline = False
+    first = True
+    while pos < len(pattern) and (pattern[pos] != ']' or first):
+        first = False
+        if pattern[pos] == '\\':
+            (kind, value), pos = scan_escape(pattern, pos + 1, True)
+        else:
+            (kind, value), pos = ('char', pattern[pos]), pos + 1
+        if kind == 'set':
+            newline = newline or value
+            continue
+        low = high = value
+        if pattern.startswith('-', pos) and not pattern.startswith('-]', pos):
+            if pattern.startswith('-\\', pos):
+                (kind, high), pos = scan_escape(pattern, pos + 2, True)
+            else:
+                (kind, high), pos = ('char', pattern[pos + 1:pos + 2]), pos + 2
+            if kind != 'char' or not high:
+                raise ValueError(pattern)
+        newline = newline or low <= '\n' <= high
+    if pos == len(pattern):
+        raise ValueError(pattern)
+    return ('set', newline != negated), pos + 1
+
+
+def scan_group(pattern, pos, flags):
+    lookaround = False
+    if pattern.startswith('?', pos):
+        if pattern.startswith('?:', pos):
+            pos += 2
+        elif pattern.startswith('?P<', pos):
+            pos = pattern.index('>', pos) + 1
+        elif pattern.startswith('?P=', pos):
+            return ('ref', None), pattern.index(')', pos) + 1
+        elif pattern.startswith(('?=', '?!'), pos):
+            lookaround = True
+            pos += 2
+        elif pattern.startswith(('?<=', '?<!'), pos):
+            lookaround = True
+            pos += 3
+        else:
+            # Inline flags, comments and conditionals
+            raise ValueError(pattern)
+    branches, pos = scan_branches(pattern, pos, flags)
+    if pos == len(pattern):
+        raise ValueError(pattern)
+    if lookaround:
+        return ('anchor', None), pos + 1
+    return ('group', branches), pos + 1
+
+
+def literal(pattern, flags):
+    """The string pattern matches, if it has no special characters, or
+    None."""
+    branches = scan(pattern, flags)
+    if branches is None or len(branches) != 1:
+        return None
+    chars = []
+    for kind, value in branches[0]:
+        if kind != 'char':
+            return None
+        chars.append(value)
+    return ''.join(chars) or None
+
+
+def required_literal(pattern, flags):
+    """The longest string every match of pattern contains, or None."""
+    branches = scan(pattern, flags)
+    if branches is None or len(branches) != 1:
+        return None
+    runs = ['']
+    for kind, value in branches[0]:
+        if kind == 'char':
+            runs[-1] += value
+        else:
+            runs.append('')
+    return max(runs, key=len) or None
+
+
+def within_lines(branches):
+    """Whether the matches of the scanned pattern never contain a newline
+    and don't depend on the text around them, so the lines of a document
+    can be searched one at a time."""
+    for items in branches:
+        for kind, value in items:
+            while kind == 'repeat':
+                kind, value = value
+            if kind == 'char' and value == '\n' or \
+                    kind == 'set' and value or kind == 'anchor':
+                # Anchors and lookarounds see past the line
+                return False
+            if kind == 'group' and not within_lines(value):
+                return False
+    return True
+
+
+def overlap(a, b):
+    """Whether occurrences of the strings a and b can overlap."""
+    if a in b or b in a:
+        return True
+    return any(a.endswith(b[:i]) or b.endswith(a[:i])
+               for i in range(1, min(len(a), len(b))))
+
+
+def splice(data, edits):
+    """data with the (start, end, text) edits, in order and not
+    overlapping, made in a single join rather than a copy of data each."""
+    parts = []
+    last = 0
+    for start, end, text in edits:
+        parts.append(data[last:start])
+        parts.append(text)
+        last = end
+    parts.append(data[last:])
+    return ''.join(parts)
+
+
+class Rule(object):
+    """A substitution of pattern by repl, a template or a function of the
+    match, over the whole document."""
+    def __init__(self, pattern, repl, flags):
+        self.pattern = pattern
+        self.regex = re.compile(pattern, flags)
+        self.repl = repl
+        # Documents without it are left as is, without a scan by regex
+        self.required = required_literal(pattern, flags)
+        # Only the lines with required are searched by patterns not
+        # starting with a string, such as '.*<h3>', which try every position
+        # of the lines otherwise
+        if self.required is None:
+            self.by_line = False
+        else:
+            items = scan(pattern, flags)[0]
+            self.by_line = items[0][0] != 'char' and within_lines([items])
+
+    @property
+    def label(self):
+        return self.pattern
+
+    def sub(self, data):
+        if self.required is not None and self.required not in data:
+            return data
+        if not self.by_line:
+            return self.regex.sub(self.repl, data)
+
+        pieces = []
+        last = 0
+        found = data.find(self.required)
+        while found != -1:
+            newline = data.rfind('\n', last, found)
+            start = last if newline == -1 else newline + 1
+            end = data.find('\n', found)
+            if end == -1:
+                end = len(data)
+            pieces.append(data[last:start])
+            pieces.append(self.regex.sub(self.repl, data[start:end]))
+            last = end
+            found = data.find(self.required, end)
+        pieces.append(data[last:])
+        return ''.join(pieces)
+
+
+class LiteralRules(object):
+    """Adjacent substitutions of strings by strings in a single pass. Only
+    rules no other rule of the pass can see the effect of are fused: their
+    strings never overlap and no replacement contains a character of a
+    later string, so the result is that of applying them in order."""
+    def __init__(self, rules):
+        self.rules = rules
+        self.table = dict(rules)
+        self.regex = re.compile('|'.join(re.escape(s) for s, r in rules))
+
+    @property
+    def label(self):
+        return ' | '.join(s for s, r in self.rules)
+
+    def accepts(self, string, repl):
+        if not repl or any(overlap(string, s) for s, r in self.rules):
+            return False
+        # The replacements of the rules before must not make new matches
+        # of string, which they would in their own passes
+        return not any(set(r) & set(string) for s, r in self.rules)
+
+    def add(self, string, repl):
+        self.rules.append((string, repl))
+        self.__init__(self.rules)
+
+    def sub(self, data):
+        if len(self.rules) == 1:
+            return data.replace(*self.rules[0])
+        table = self.table
+        return self.regex.sub(lambda m: table[m.group(0)], data)
+
+
+class RuleSet(object):
+    """The (pattern, repl, flags) substitutions of a formatter, compiled
+    once and applied in order to a document. Adjacent substitutions of
+    plain strings are fused into a single pass when that doesn't change
+    the result. The time spent in each pass is accumulated in timings."""
+    def __init__(self, rules):
+        self.passes = []
+        for pattern, repl, flags in rules:
+            string = literal(pattern, flags)
+            if string is not None and isinstance(repl, str) and \
+                    '\\' not in repl:
+                last = self.passes[-1] if self.passes else None
+                if isinstance(last, LiteralRules) and \
+                        last.accepts(string, repl):
+                    last.add(string, repl)
+                    continue
+                if repl:
+                    self.passes.append(LiteralRules([(string, repl)]))
+                    continue
+            self.passes.append(Rule(pattern, repl, flags))
+        self.timings = [0.0] * len(self.passes)
+
+    def sub(self, data):
+        timings = self.timings
+        for i, rule in enumerate(self.passes):
+            start = time.perf_counter()
+            data = rule.sub(data)
+            timings[i] += time.perf_counter() - start
+        return data
+
+    def profile(self):
+        """The (seconds, label) of each pass so far, slowest first."""
+        return sorted(zip(self.timings, (r.label for r in self.passes)),
+                      reverse=True)
+
+    def reset(self):
+        self.timings = [0.0] * len(self.passes)
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+#
+# index.py - schema and queries of the page index database
+#
+# Copyright (C) 2010 - 2016  Wei-Ning Huang (AZ) <aitjcize@gmail.com>
+# All Rights reserved.
+#
+# This file is part of cppman.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+import os
+import sqlite3
+import time
+
+from cppman.config import Config
+
+
+# Version 0: name, url and std columns, no indexes.
+# Version 1: normalized name column, indexes on name and normalized name.
+# Version 2: meta table, of the schema version and the build time.
+SCHEMA_VERSION = 2
+
+
+def normalized_name(name):
+    """Lookup key of a page name: lowercased, without the std:: prefix."""
+    name = name.strip().lower()
+    return name[5:] if name.startswith('std::') else name
+
+
+def escape_like(pattern):
+    return (pattern.replace('\\', '\\\\').replace('%', '\\%')
+            .replace('_', '\\_'))
+
+
+def create_tables(conn):
+    """Create the page tables of all sources, at the current version."""
+    for source in Config.SOURCES:
+        conn.execute('CREATE TABLE "%s" (name VARCHAR(255), url VARCHAR(255), '
+                     'std VARCHAR(255), normalized VARCHAR(255))' % source)
+        create_indexes(conn, source)
+    create_meta(conn)
+    conn.execute('INSERT INTO "meta" (key, value) VALUES (?, ?)',
+                 ('built', time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())))
+
+
+def create_indexes(conn, source):
+    conn.execute('CREATE INDEX IF NOT EXISTS "%s_name" ON "%s" (name)'
+                 % (source, source))
+    conn.execute('CREATE INDEX IF NOT EXISTS "%s_normalized" ON "%s" '
+                 '(normalized)' % (source, source))
+
+
+def create_meta(conn):
+    conn.execute('CREATE TABLE IF NOT EXISTS "meta" '
+                 '(key TEXT PRIMARY KEY, value TEXT)')
+    conn.execute('INSERT OR REPLACE INTO "meta" (key, value) VALUES (?, ?)',
+                 ('schema', str(SCHEMA_VERSION)))
+    conn.execute('PRAGMA user_version=%d' % SCHEMA_VERSION)
+
+
+def metadata(conn):
+    """The meta table of an index as a dict, empty before version 2."""
+    try:
+        return dict(conn.execute('SELECT key, value FROM "meta"'))
+    except sqlite3.OperationalError:
+        return {}
+
+
+def upgrade(conn):
+    """Migrate an index built by an older version to the current schema."""
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return
+
+    with conn:
+        for source in Config.SOURCES:
+            columns = [row[1] for row in conn.execute(
+                'PRAGMA table_info("%s")' % source)]
+            if not columns:
+                continue
+            if 'normalized' not in columns:
+                conn.execute('ALTER TABLE "%s" ADD COLUMN normalized '
+                             'VARCHAR(255)' % source)
+            conn.executemany(
+                'UPDATE "%s" SET normalized=? WHERE rowid=?' % source,
+                [(normalized_name(name), rowid) for rowid, name in
+                 conn.execute('SELECT rowid, name FROM "%s"' % source)])
+            create_indexes(conn, source)
+        create_meta(conn)
+
+
+def replace(tmp, path):
+    """Rename the database tmp, written and closed, over path. Readers have
+    either the previous or the new file open, never a partial one."""
+    fd = os.open(tmp, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    os.replace(tmp, path)
+
+    # Make the rename itself durable
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def write(path, build):
+    """Create the database path with build(conn), in a single transaction
+    on a new file renamed over path once complete."""
+    from cppman.util import replace_file
+
+    def write(tmp):
+        # Keep the permissions of the replaced file, not mkstemp's 0600
+        try:
+            os.chmod(tmp, os.stat(path).st_mode & 0o777)
+        except OSError:
+            os.chmod(tmp, 0o644)
+
+        conn = sqlite3.connect(tmp)
+        try:
+            with conn:
+                build(conn)
+        finally:
+            conn.close()
+
+    replace_file(path, write, suffix='.db', rename=replace)
+
+
+def open_readonly(path):
+    # Index files are never written in place, only replaced, so they are
+    # read as immutable: no locks, no journal, readers never block.
+    uri = os.path.abspath(path)
+    for c, escaped in (('%', '%25'), ('?', '%3f'), ('#', '%23')):
+        uri = uri.replace(c, escaped)
+    return sqlite3.connect('file:%s?mode=ro&immutable=1' % uri, uri=True)
+
+
+def connect(path):
+    """Open the index database at path read-only. An index of an older
+    version is upgraded in a copy replacing it, or in an in-memory copy if
+    it can't be replaced."""
+    conn = open_readonly(path)
+    if conn.execute('PRAGMA user_version').fetchone()[0] >= SCHEMA_VERSION:
+        return conn
+
+    def build(copy):
+        conn.backup(copy)
+        upgrade(copy)
+
+    try:
+        write(path, build)
+    except (OSError, sqlite3.Error):
+        memory = sqlite3.connect(':memory:')
+        conn.backup(memory)
+        conn.close()
+        upgrade(memory)
+        return memory
+    conn.close()
+    return open_readonly(path)
+
+
+def insert_many(conn, source, rows):
+    """Insert the (name, url, std) rows of pages of source."""
+    conn.executemany('INSERT INTO "%s" (name, url, std, normalized) '
+                     'VALUES (?, ?, ?, ?)' % source,
+                     [(name, url, std, normalized_name(name))
+                      for name, url, std in rows])
+
+
+def lookup(conn, source, pattern):
+    """Return the (name, url) of the page best matching pattern, or None.
+
+    Exact matches come first, then the page in std::, then case
+    insensitive matches and finally, only when none of these exists, the
+    shortest name containing pattern.
+    """
+    key = normalized_name(pattern)
+    return conn.execute(
+        'SELECT name, url FROM ('
+        ' SELECT name, url FROM "{0}" WHERE normalized=:key'
+        ' UNION ALL'
+        # The single row of miss makes the substring scan run only when
+        # the indexed lookup found nothing
+        ' SELECT name, url FROM (SELECT 1 WHERE NOT EXISTS'
+        '  (SELECT 1 FROM "{0}" WHERE normalized=:key)) AS miss'
+        " CROSS JOIN \"{0}\" WHERE name LIKE :like ESCAPE '\\')"
+        ' ORDER BY CASE name WHEN :pattern THEN 0'
+        "  WHEN 'std::' || :pattern THEN 1 ELSE 2 END, LENGTH(name)"
+        ' LIMIT 1'.format(source),
+        {'key': key, 'pattern': pattern,
+         'like': '%' + escape_like(pattern) + '%'}).fetchone()
+
+
+def lookup_many(conn, source, patterns):
+    """Return the match of lookup() of each of patterns, in order, with a
+    single query. ROW_NUMBER needs SQLite 3.25 or later."""
+    if not patterns:
+        return []
+    values = []
+    for i, pattern in enumerate(patterns):
+        values += [i, pattern, normalized_name(pattern),
+                   '%' + escape_like(pattern) + '%']
+    matches = [None] * len(patterns)
+    for i, name, url in conn.execute(
+            'WITH patterns (i, pattern, key, substring) AS (VALUES %s)'
+            ' SELECT i, name, url FROM ('
+            '  SELECT i, name, url, ROW_NUMBER() OVER (PARTITION BY i'
+            '   ORDER BY CASE name WHEN pattern THEN 0'
+            "    WHEN 'std::' || pattern THEN 1 ELSE 2 END, LENGTH(name))"
+            '   AS rank FROM ('
+            '   SELECT i, pattern, name, url FROM patterns'
+            '    CROSS JOIN "{0}" WHERE normalized=key'
+            '   UNION ALL'
+            # As in lookup(), the substring scan of a pattern only runs when
+            # its indexed lookup found nothing
+            '   SELECT i, pattern, name, url FROM patterns'
+            '    CROSS JOIN "{0}" WHERE NOT EXISTS'
+            '     (SELECT 1 FROM "{0}" WHERE normalized=key)'
+            "    AND name LIKE substring ESCAPE '\\'))"
+            ' WHERE rank=1'.format(source)
+            % ', '.join(['(?, ?, ?, ?)'] * len(patterns)), values):
+        matches[i] = (name, url)
+    return matches
+
+
+def search(conn, source, pattern):
+    """Return the (name, url, std) of all pages whose name contains pattern,
+    shortest first."""
+    return conn.execute(
+        "SELECT name, url, std FROM \"%s\" WHERE name LIKE ? ESCAPE '\\' "
+        "ORDER BY LENGTH(name)" % source,
+        ('%' + escape_like(pattern) + '%',)).fetchall()
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+#
+# indexer.py - crawler building the page index database
+#
+# Copyright (C) 2010 - 2016  Wei-Ning Huang (AZ) <aitjcize@gmail.com>
+# All Rights reserved.
+#
+# This file is part of cppman.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+import json
+import os
+import re
+import sqlite3
+
+from cppman import environ
+from cppman import index
+from cppman.crawler import Crawler
+
+
+class Indexer(Crawler):
+    """Crawl cplusplus.com and cppreference.com to build index.db. The
+    HTML of indexed pages is recorded in snapshots, a SnapshotStore."""
+    def __init__(self, snapshots):
+        Crawler.__init__(self)
+        self.snapshots = snapshots
+        self.results = set()
+        self.page_names = {}
+
+        self.blacklist = [
+        ]
+        self.name_exceptions = [
+            'http://www.cplusplus.com/reference/string/swap/'
+        ]
+
+    def extract_name(self, data):
+        """Extract man page name from web page."""
+        name = re.search('<h1[^>]*>(.+?)</h1>', data).group(1)
+        name = re.sub(r'<([^>]+)>', r'', name)
+        name = re.sub(r'&gt;', r'>', name)
+        name = re.sub(r'&lt;', r'<', name)
+        return name
+
+    def rebuild_index(self, incremental=False, resume=False):
+        """Rebuild index database from cplusplus.com and cppreference.com.
+
+        If incremental is True, pages recorded by the previous rebuild are
+        revalidated with conditional requests, only changed pages are
+        downloaded and parsed again. If resume is True, an interrupted
+        rebuild continues from its last checkpoint.
+        """
+        if incremental:
+            self.set_revalidate(self.load_crawl_cache())
+
+        try:
+            os.makedirs(environ.config_dir)
+        except OSError:
+            pass
+
+        self.set_checkpoint(environ.crawl_checkpoint, resume=resume)
+
+        try:
+            self.add_url_filter('\.(jpg|jpeg|gif|png|js|css|swf|svg)$')
+            self.set_follow_mode(Crawler.F_SAME_PATH)
+
+            # cplusplus.com
+            self.crawl('http://www.cplusplus.com/reference/')
+            cplusplus = self.rename_duplicates(self.index_rows())
+
+            # cppreference.com
+            self.results = set()
+            self.crawl('http://en.cppreference.com/w/cpp', '/w/cpp')
+            cppreference = self.index_rows()
+        finally:
+            self.checkpoint.close()
+
+        self.write_index(environ.index_db_re,
+                         {'cplusplus.com': cplusplus,
+                          'cppreference.com': cppreference})
+
+        # Completed, nothing to resume
+        os.remove(environ.crawl_checkpoint)
+
+    def index_rows(self):
+        """The (name, url, std) rows of the crawled pages, a row for each
+        name of pages documenting several, e.g. 'std::vector::begin, end'.
+        """
+        rows = []
+        for name, url, std in sorted(self.results):
+            names = name.split(',')
+
+            if len(names) > 1:
+                m = re.match(r'^\s*(.*?::(?:operator)?)([^:]*)\s*$',
+                             names[0])
+                if m:
+                    prefix = m.group(1)
+                    names[0] = m.group(2)
+                    names = [prefix + n for n in names]
+
+            rows.extend((n.strip(), url, std) for n in names)
+        return rows
+
+    def rename_duplicates(self, rows):
+        """Rename the rows of names shared by several pages after their
+        group, e.g. 'insert (map)', from their url."""
+        count = {}
+        for name, url, std in rows:
+            count[name] = count.get(name, 0) + 1
+
+        renamed = []
+        for name, url, std in rows:
+            if count[name] > 1 and url not in self.name_exceptions:
+                short = name[5:] if name.startswith('std::') else name
+                m = (re.search('/([^/]+)/%s/$' % re.escape(short), url) or
+                     re.search('/([^/]+)/[^/]+/$', url))
+                name = '%s (%s)' % (name, m.group(1))
+            renamed.append((name, url, std))
+        return renamed
+
+    def write_index(self, path, tables):
+        """Write the rows of each source of tables and the crawl cache to
+        a new index replacing path, see index.write."""
+        def build(conn):
+            index.create_tables(conn)
+            for source, rows in tables.items():
+                index.insert_many(conn, source, rows)
+            self.save_crawl_cache(conn)
+
+        index.write(path, build)
+
+    def process_document(self, doc, std):
+        """callback to insert index"""
+        if doc.url not in self.blacklist:
+            print("Indexing '%s' %s..." % (doc.url, std))
+            self.snapshots.put(doc.url, doc.text.encode('utf-8'))
+            name = self.extract_name(doc.text)
+            self.page_names[doc.url] = name
+            self.results.add((name, doc.url, std))
+        else:
+            print("Skipping blacklisted page '%s' ..." % doc.url)
+            return None
+
+    def process_unmodified(self, url, std):
+        """callback to reuse the index entry of an unmodified page"""
+        name = self.page_names.get(url)
+        if name is not None:
+            print("Unmodified '%s' %s..." % (url, std))
+            self.results.add((name, url, std))
+
+    def checkpoint_results(self):
+        return list(self.results)
+
+    def restore_results(self, rows):
+        for name, url, std in rows:
+            self.page_names[url] = name
+            self.results.add((name, url, std))
+
+    def load_crawl_cache(self):
+        """Load pages recorded by the previous rebuild_index."""
+        pages = {}
+        if not os.path.exists(environ.index_db_re):
+            return pages
+
+        conn = index.open_readonly(environ.index_db_re)
+        try:
+            rows = conn.execute('SELECT url, name, etag, last_modified, links '
+                                'FROM "crawl_cache"').fetchall()
+        except sqlite3.OperationalError:
+            # Index built by an older version, no crawl cache
+            rows = []
+        finally:
+            conn.close()
+
+        for url, name, etag, last_modified, links in rows:
+            self.page_names[url] = name
+            pages[url] = (etag, last_modified,
+                          [tuple(link) for link in json.loads(links)])
+        return pages
+
+    def save_crawl_cache(self, conn):
+        """Record validators, names and links of crawled pages."""
+        conn.execute('CREATE TABLE "crawl_cache" '
+                     '(url VARCHAR(255) PRIMARY KEY, name VARCHAR(255), '
+                     'etag VARCHAR(255), last_modified VARCHAR(255), '
+                     'links TEXT)')
+        conn.executemany(
+            'INSERT INTO "crawl_cache" '
+            '(url, name, etag, last_modified, links) VALUES (?, ?, ?, ?, ?)',
+            [(url, self.page_names.get(url), etag, last_modified,
+              json.dumps(links))
+             for url, (etag, last_modified, links) in self.crawled.items()])
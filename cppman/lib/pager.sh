@@ -24,10 +24,11 @@
 
 # Script arguments:
 #   $1: pager type
-#   $2: page path
+#   $2: page path, '-' for standard input
 #   $3: column
 #   $4: vim config
 #   $5: page name
+#   $6: 'rendered' if the page was already typeset
 
 get_dev_type() {
   dev=ascii
@@ -47,10 +48,15 @@ page_path=$2
 col=$3
 vim_config=$4
 page_name=$5
+page_mode=$6
 
 render() {
-  gunzip -c "$page_path" | \
-    groff -t -c -m man -T$output_dev -rLL=${col}n -rLT=${col}n 2>/dev/null
+  if [ "$page_mode" = "rendered" ]; then
+    cat "$page_path"
+  else
+    gunzip -c "$page_path" | \
+      groff -t -c -m man -T$output_dev -rLL=${col}n -rLT=${col}n 2>/dev/null
+  fi
 }
 
 remove_escape() {
@@ -22,136 +22,134 @@
 # Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 #
 
-import gzip
-import importlib
 import os
 import re
-import shutil
-import sqlite3
-import subprocess
 import sys
-import urllib.request
+import time
 
 from cppman import environ
-from cppman import util
-from cppman.crawler import Crawler
+from cppman import index
 
+# Only what looking pages up and viewing cached pages needs is imported
+# here, fetching, formatting and crawling import their modules on first
+# use, so cppman starts fast.
 
-class Cppman(Crawler):
-    """Manage cpp man pages, indexes"""
-    def __init__(self, forced=False, force_columns=-1):
-        Crawler.__init__(self)
-        self.results = set()
-        self.forced = forced
-        self.success_count = None
-        self.failure_count = None
-        self.force_columns = force_columns
 
-        self.blacklist = [
-        ]
-        self.name_exceptions = [
-            'http://www.cplusplus.com/reference/string/swap/'
-        ]
-
-    def extract_name(self, data):
-        """Extract man page name from web page."""
-        name = re.search('<h1[^>]*>(.+?)</h1>', data).group(1)
-        name = re.sub(r'<([^>]+)>', r'', name)
-        name = re.sub(r'&gt;', r'>', name)
-        name = re.sub(r'&lt;', r'<', name)
-        return name
-
-    def rebuild_index(self):
-        """Rebuild index database from cplusplus.com and cppreference.com."""
-        try:
-            os.remove(environ.index_db_re)
-        except:
-            pass
+def format_page(source, html, name):
+    """Convert the raw HTML of a page of source to groff."""
+    import importlib
 
-        self.db_conn = sqlite3.connect(environ.index_db_re)
-        self.db_cursor = self.db_conn.cursor()
-        self.db_cursor.execute('CREATE TABLE "cplusplus.com" '
-                               '(name VARCHAR(255), url VARCHAR(255), std VARCHAR(255))')
-        self.db_cursor.execute('CREATE TABLE "cppreference.com" '
-                               '(name VARCHAR(255), url VARCHAR(255), std VARCHAR(255))')
+    from cppman import util
 
-        try:
-            self.add_url_filter('\.(jpg|jpeg|gif|png|js|css|swf|svg)$')
-            self.set_follow_mode(Crawler.F_SAME_PATH)
-
-            # cplusplus.com
-            self.crawl('http://www.cplusplus.com/reference/')
-            for name, url, std in self.results:
-                self.insert_index('cplusplus.com', name, url, std)
-            self.db_conn.commit()
-
-            # Rename duplicate entries
-            duplicates = self.db_cursor.execute('SELECT name, COUNT(name) '
-                                                'AS NON '
-                                                'FROM "cplusplus.com" '
-                                                'GROUP BY NAME '
-                                                'HAVING (NON > 1)').fetchall()
-            for name, num in duplicates:
-                dump = self.db_cursor.execute('SELECT name, url FROM '
-                                              '"cplusplus.com" WHERE name="%s"'
-                                              % name).fetchall()
-                for n, u in dump:
-                    if u not in self.name_exceptions:
-                        n2 = n[5:] if n.startswith('std::') else n
-                        try:
-                            group = re.search('/([^/]+)/%s/$' % n2, u).group(1)
-                        except Exception:
-                            group = re.search('/([^/]+)/[^/]+/$', u).group(1)
-
-                        new_name = '%s (%s)' % (n, group)
-                        self.db_cursor.execute('UPDATE "cplusplus.com" '
-                                               'SET name="%s", url="%s" '
-                                               'WHERE url="%s"' %
-                                               (new_name, u, u))
-            self.db_conn.commit()
-
-            # cppreference.com
-            self.results = set()
-            self.crawl('http://en.cppreference.com/w/cpp', '/w/cpp')
-
-            for name, url, std in self.results:
-                self.insert_index('cppreference.com', name, url, std)
-            self.db_conn.commit()
-
-        except KeyboardInterrupt:
-            os.remove(environ.index_db_re)
-            raise KeyboardInterrupt
-        finally:
-            self.db_conn.close()
-
-    def process_document(self, doc, std):
-        """callback to insert index"""
-        if doc.url not in self.blacklist:
-            print("Indexing '%s' %s..." % (doc.url, std))
-            name = self.extract_name(doc.text)
-            self.results.add((name, doc.url, std))
-        else:
-            print("Skipping blacklisted page '%s' ..." % doc.url)
-            return None
+    # There are often some errors in the HTML, for example: missing closing
+    # tag. We use fixupHTML to fix this.
+    data = util.fixupHTML(html)
 
-    def insert_index(self, table, name, url, std=""):
-        """callback to insert index"""
-        names = name.split(',')
+    formatter = importlib.import_module('cppman.formatter.%s' % source[:-4])
+    return formatter.html2groff(data, name)
 
-        if len(names) > 1:
-            m = re.match(r'^\s*(.*?::(?:operator)?)([^:]*)\s*$', names[0])
-            if m:
-                prefix = m.group(1)
-                names[0] = m.group(2)
-                names = [prefix + n for n in names]
 
-        for n in names:
-            self.db_cursor.execute(
-                'INSERT INTO "%s" (name, url, std) VALUES ("%s", "%s", "%s")' %
-                (table, n.strip(), url, std))
+class Cppman(object):
+    """Manage cpp man pages, indexes"""
+    # Crawler.ENGINES, without importing the crawler
+    E_THREAD, E_ASYNCIO = 'thread', 'asyncio'
+    ENGINES = [E_THREAD, E_ASYNCIO]
 
-    def cache_all(self):
-        """Cache all available man pages"""
+    def __init__(self, forced=False, force_columns=-1):
+        self.forced = forced
+        self.success_count = None
+        self.failure_count = None
+        self.force_columns = force_columns
+        # Pages fetched at the same time by cache_pages
+        self.max_outstanding = 16
+        self._snapshots = None
+        self._cache = None
+        self._render_cache = None
+        self._search_index = None
+        self._name_index = None
+        # Page name to the future of its background caching, see prefetch
+        self.prefetching = {}
+        self.prefetcher = None
+
+    @property
+    def snapshots(self):
+        """Store of the raw HTML of fetched pages, opened on first use."""
+        if self._snapshots is None:
+            from cppman.snapshot import SnapshotStore
+            self._snapshots = SnapshotStore(environ.snapshot_dir)
+        return self._snapshots
+
+    @property
+    def cache(self):
+        """Cache of formatted man pages, of the configured backend."""
+        if self._cache is None:
+            from cppman.cache import open_cache
+            self._cache = open_cache(environ.cache_backend, environ.man_dir,
+                                     environ.pack_file, environ.manifest_file)
+        return self._cache
+
+    @property
+    def render_cache(self):
+        """Pages typeset by groff, for a terminal width and device."""
+        if self._render_cache is None:
+            from cppman.cache import RenderCache
+            self._render_cache = RenderCache(environ.render_dir,
+                                             environ.render_cache_size)
+        return self._render_cache
+
+    @property
+    def search_index(self):
+        """Full-text index of page names, descriptions and text."""
+        if self._search_index is None:
+            from cppman.search import SearchIndex
+            self._search_index = SearchIndex(environ.search_db)
+        return self._search_index
+
+    def _open_stores(self):
+        """Open and return the stores fetch_page and cache_man_page write
+        to. The properties opening them are not thread-safe: threads opening
+        a store at once would each open one, and the writes to all but one
+        would be lost."""
+        return self.cache, self.snapshots, self.search_index
+
+    @property
+    def name_index(self):
+        """Page names of index.db, for completion and suggestions."""
+        if self._name_index is None:
+            from cppman.names import NameIndex
+            self._name_index = NameIndex.open(environ.names_file,
+                                              environ.index_db)
+        return self._name_index
+
+    def rebuild_index(self, incremental=False, resume=False,
+                      engine=None, rate=None):
+        """Rebuild index database from cplusplus.com and cppreference.com,
+        with the crawler engine and per host rate limit of the given
+        values. See Indexer.rebuild_index."""
+        from cppman.indexer import Indexer
+        from cppman.names import NameIndex
+
+        indexer = Indexer(self.snapshots)
+        if engine:
+            indexer.set_engine(engine)
+        if rate:
+            indexer.set_rate_limit(rate)
+        indexer.rebuild_index(incremental, resume)
+
+        self.search_index.sync(environ.index_db_re)
+        names = NameIndex.build(environ.index_db_re)
+        names.save(environ.names_file)
+        if os.path.exists(environ.completion_list):
+            names.save_completion_list(environ.source,
+                                       environ.completion_list)
+
+    def cache_all(self, jobs=None):
+        """Cache all available man pages.
+
+        Pages are fetched by concurrent threads, formatted by `jobs' worker
+        processes (one per CPU by default) and written by the calling
+        thread.
+        """
         print('By default, cppman fetches pages on-the-fly if corresponding '
               'page is not found in the cache. The "cache-all" option is only '
               'useful if you want to view man pages offline. '
@@ -162,161 +160,441 @@ class Cppman(Crawler):
         if respond.lower() not in ['y', 'ye', 'yes']:
             raise KeyboardInterrupt
 
-        try:
-            os.makedirs(environ.man_dir)
-        except:
-            pass
-
         self.success_count = 0
         self.failure_count = 0
 
         if not os.path.exists(environ.index_db):
             raise RuntimeError("can't find index.db")
 
-        conn = sqlite3.connect(environ.index_db)
+        conn = index.connect(environ.index_db)
         cursor = conn.cursor()
 
         source = environ.config.source
-        print('Caching manpages from %s ...' % source)
-        data = cursor.execute('SELECT * FROM "%s"' % source).fetchall()
-
-        for name, url in data:
-            retries = 3
-            print('Caching %s ...' % name)
-            while retries > 0:
-                try:
-                    self.cache_man_page(source, url, name)
-                except Exception:
-                    print('Retrying ...')
-                    retries -= 1
-                else:
-                    break
-
-            if retries == 0:
-                print('Error caching %s ...' % name)
-                self.failure_count += 1
-            else:
-                self.success_count += 1
+        data = cursor.execute('SELECT name, url FROM "%s"' % source).fetchall()
         conn.close()
 
+        # Skip if already exists, override if forced flag is true
+        if not self.forced:
+            data = [(name, url) for name, url in data
+                    if not self.cache.contains(source, name)]
+
+        print('Caching %d manpages from %s ...' % (len(data), source))
+        self.cache_pages(source, data, jobs)
+
+        self.search_index.optimize()
+
         print('\n%d manual pages cached successfully.' % self.success_count)
         print('%d manual pages failed to cache.' % self.failure_count)
         self.update_mandb(False)
 
-    def cache_man_page(self, source, url, name):
-        """callback to cache new man page"""
-        # Skip if already exists, override if forced flag is true
-        outname = self.get_page_path(source, name)
-        if os.path.exists(outname) and not self.forced:
-            return
+    def reformat(self, jobs=None):
+        """Regenerate the man pages of all pages with a snapshot, without
+        network access."""
+        if not os.path.exists(environ.index_db):
+            raise RuntimeError("can't find index.db")
+
+        conn = index.connect(environ.index_db)
+        source = environ.config.source
+        data = conn.execute('SELECT name, url FROM "%s"' % source).fetchall()
+        conn.close()
+
+        urls = self.snapshots.urls()
+        data = [(name, url) for name, url in data if url in urls]
+
+        self.success_count = 0
+        self.failure_count = 0
+
+        print('Reformatting %d manpages from %s snapshots ...' %
+              (len(data), source))
+        self.cache_pages(source, data, jobs, self.load_snapshot)
+
+        self.search_index.optimize()
+
+        print('\n%d manual pages reformatted successfully.' %
+              self.success_count)
+        print('%d manual pages failed to reformat.' % self.failure_count)
+        self.update_mandb(False)
+
+    def cache_pages(self, source, pages, jobs=None, fetch=None):
+        """Fetch, format and write the (name, url) pages of source. Pages
+        are fetched with fetch(url), fetch_page by default."""
+        import multiprocessing
+
+        from collections import OrderedDict
+        from concurrent.futures import (FIRST_COMPLETED, ProcessPoolExecutor,
+                                        ThreadPoolExecutor, wait)
+
+        fetch_page = fetch or self.fetch_page
+
+        # Names sharing an url are fetched once
+        urls = OrderedDict()
+        for name, url in pages:
+            urls.setdefault(url, []).append(name)
+        urls = iter(urls.items())
+
+        jobs = jobs or os.cpu_count() or 1
+        # Before the fetcher threads use them
+        self._open_stores()
+        fetchers = ThreadPoolExecutor(self.max_outstanding)
+        # A fork server, forking from this multi-threaded process is unsafe
+        formatters = ProcessPoolExecutor(
+            jobs, mp_context=multiprocessing.get_context('forkserver'))
+
+        # Bound the number of pages held in memory
+        window = self.max_outstanding + 2 * jobs
+        fetching = {}
+        formatting = {}
+        progress = Progress(len(pages))
+
+        def fetch(url, names, retries=3):
+            future = fetchers.submit(fetch_page, url)
+            fetching[future] = (url, names, retries)
+
+        def fail(name, error):
+            progress.clear()
+            print('Error caching %s: %s' % (name, error))
+            self.failure_count += 1
 
         try:
-            os.makedirs(os.path.join(environ.man_dir, source))
-        except OSError:
-            pass
+            while True:
+                while len(fetching) + len(formatting) < window:
+                    try:
+                        fetch(*next(urls))
+                    except StopIteration:
+                        break
+
+                if not fetching and not formatting:
+                    break
 
-        # There are often some errors in the HTML, for example: missing closing
-        # tag. We use fixupHTML to fix this.
-        data = util.fixupHTML(urllib.request.urlopen(url).read())
+                done, _ = wait(list(fetching) + list(formatting),
+                               return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future in fetching:
+                        url, names, retries = fetching.pop(future)
+                        try:
+                            html = future.result()
+                        except Exception as e:
+                            if retries > 1:
+                                fetch(url, names, retries - 1)
+                            else:
+                                for name in names:
+                                    fail(name, e)
+                                    progress.update()
+                            continue
+                        for name in names:
+                            formatting[formatters.submit(
+                                format_page, source, html, name)] = (name, url)
+                    else:
+                        name, url = formatting.pop(future)
+                        try:
+                            self.write_page(source, name, future.result(),
+                                            url)
+                        except Exception as e:
+                            fail(name, e)
+                        else:
+                            self.success_count += 1
+                        progress.update()
+        finally:
+            progress.clear()
+            # Pages not started yet are dropped, not fetched or formatted
+            for future in list(fetching) + list(formatting):
+                future.cancel()
+            fetchers.shutdown(wait=False)
+            # At most one page per process is still being formatted. Not
+            # waiting for the processes breaks the pool at exit on Python
+            # before 3.9.
+            formatters.shutdown()
+
+    def fetch_page(self, url):
+        """Fetch the raw HTML of a page, and keep a snapshot of it."""
+        import urllib.request
+
+        html = urllib.request.urlopen(url).read()
+        self.snapshots.put(url, html)
+        return html
+
+    def load_snapshot(self, url):
+        """Return the raw HTML of a page from its snapshot."""
+        html = self.snapshots.get(url)
+        if html is None:
+            raise RuntimeError('no snapshot of %s' % url)
+        return html
+
+    def write_page(self, source, name, groff_text, url=None):
+        """Write the groff text of a page, fetched from url, to the cache
+        and the search index."""
+        self.cache.write(source, name, groff_text, url)
+        self.search_index.update(source, name, groff_text, url)
 
-        formatter = importlib.import_module('cppman.formatter.%s' % source[:-4])
-        groff_text = formatter.html2groff(data, name)
+    def cache_man_page(self, source, url, name):
+        """callback to cache new man page"""
+        # Skip if already exists, override if forced flag is true
+        if self.cache.contains(source, name) and not self.forced:
+            return
 
-        with gzip.open(outname, 'w') as f:
-            f.write(groff_text.encode('utf-8'))
+        groff_text = format_page(source, self.fetch_page(url), name)
+        self.write_page(source, name, groff_text, url)
 
     def clear_cache(self):
         """Clear all cache in man3"""
-        shutil.rmtree(environ.man_dir)
+        self.cache.clear()
+        self.render_cache.clear()
 
-    def man(self, pattern):
-        """Call viewer.sh to view man page"""
-        try:
-            avail = os.listdir(os.path.join(environ.man_dir, environ.source))
-        except OSError:
-            avail = []
+    def export_cache(self):
+        """Write the pages of the pack cache as .3.gz files, so they can be
+        viewed with man(1) and indexed by mandb."""
+        from cppman.cache import DirectoryCache
+
+        if isinstance(self.cache, DirectoryCache):
+            print('Man pages are already cached as files in %s.' %
+                  environ.man_dir)
+            return
+
+        directory = DirectoryCache(environ.man_dir, environ.manifest_file)
+        count = 0
+        for source in environ.config.SOURCES:
+            for name in self.cache.pages(source):
+                info = self.cache.info(source, name)
+                directory.write_compressed(
+                    source, name, self.cache.read_compressed(source, name),
+                    info.url, info.fetched)
+                count += 1
+
+        print('%d manual pages exported to %s.' % (count, environ.man_dir))
+        self.update_mandb(False)
 
+    def resolve(self, patterns):
+        """Return the (name, url) of the page matching each of patterns, or
+        None, in order, looked up with a single query."""
         if not os.path.exists(environ.index_db):
             raise RuntimeError("can't find index.db")
 
-        conn = sqlite3.connect(environ.index_db)
-        cursor = conn.cursor()
-
-        # Try direct match
+        conn = index.connect(environ.index_db)
         try:
-            page_name, url = cursor.execute(
-                'SELECT name,url FROM "%s" '
-                'WHERE name="%s" ORDER BY LENGTH(name)'
-                % (environ.source, pattern)).fetchone()
-        except TypeError:
-            # Try standard library
-            try:
-                page_name, url = cursor.execute(
-                    'SELECT name,url FROM "%s" '
-                    'WHERE name="std::%s" ORDER BY LENGTH(name)'
-                    % (environ.source, pattern)).fetchone()
-            except TypeError:
-                try:
-                    page_name, url = cursor.execute(
-                        'SELECT name,url FROM "%s" '
-                        'WHERE name LIKE "%%%s%%" ORDER BY LENGTH(name)'
-                        % (environ.source, pattern)).fetchone()
-                except TypeError:
-                    raise RuntimeError('No manual entry for ' + pattern)
+            return index.lookup_many(conn, environ.source, patterns)
         finally:
             conn.close()
 
-        page_filename = self.get_normalized_page_name(page_name)
-        if self.forced or page_filename + '.3.gz' not in avail:
+    def prefetch(self, pages):
+        """Cache the (name, url) pages not cached yet in background
+        threads, while other pages are viewed. man() waits for the page
+        it shows if it is still being cached."""
+        pages = [(name, url) for name, url in pages
+                 if name not in self.prefetching and
+                 (self.forced or not self.cache.contains(environ.source,
+                                                         name))]
+        if not pages:
+            return
+
+        from concurrent.futures import ThreadPoolExecutor
+
+        # Before the threads use them
+        self._open_stores()
+        if self.prefetcher is None:
+            self.prefetcher = ThreadPoolExecutor(
+                min(len(pages), self.max_outstanding))
+        for name, url in pages:
+            self.prefetching[name] = self.prefetcher.submit(
+                self.cache_man_page, environ.source, url, name)
+
+    def stop_prefetch(self):
+        """Cancel the pages not being cached yet."""
+        if self.prefetcher is not None:
+            for future in self.prefetching.values():
+                future.cancel()
+            self.prefetcher.shutdown(wait=False)
+            self.prefetcher = None
+        self.prefetching = {}
+
+    def man(self, pattern, match=None):
+        """Call viewer.sh to view man page. match is the (name, url) pattern
+        resolves to, when already looked up."""
+        if match is None:
+            match = self.resolve([pattern])[0]
+        if match is None:
+            suggestions = self.name_index.suggest(environ.source, pattern)
+            if suggestions:
+                raise RuntimeError('No manual entry for %s, did you mean %s?'
+                                   % (pattern, ', '.join(suggestions)))
+            raise RuntimeError('No manual entry for ' + pattern)
+        page_name, url = match
+
+        prefetched = False
+        if page_name in self.prefetching:
+            try:
+                self.prefetching.pop(page_name).result()
+                prefetched = True
+            except Exception:
+                # Cancelled or failed, cached here reporting the error
+                pass
+        if not prefetched and (self.forced or
+                               not self.cache.contains(environ.source,
+                                                       page_name)):
             self.cache_man_page(environ.source, url, page_name)
 
         pager_type = environ.pager if sys.stdout.isatty() else 'pipe'
 
         # Call viewer
-        columns = (util.get_width() if self.force_columns == -1 else
+        from cppman.util import get_width
+
+        columns = (get_width() if self.force_columns == -1 else
                    self.force_columns)
+        # A rendering of the page at these columns is shown as is, without
+        # typesetting it again
+        from cppman.cache import RenderCache
+        from cppman.util import get_output_device, get_renderer
+
+        device = get_output_device()
+        renderer = get_renderer()
+        info = self.cache.info(environ.source, page_name)
+        key = info and RenderCache.key(environ.source, page_name, info,
+                                       columns, device, renderer)
+        page = key and (self.render_cache.open(key) or
+                        self.render(page_name, key, columns, device,
+                                    renderer))
+        if page:
+            mode = 'rendered'
+        else:
+            mode = 'groff'
+            # The page is read from standard input, pack cache pages have
+            # no file of their own
+            try:
+                page = self.cache.open(environ.source, page_name)
+            except IOError:
+                # Removed from the cache behind our back
+                self.cache_man_page(environ.source, url, page_name)
+                page = self.cache.open(environ.source, page_name)
+
         pid = os.fork()
         if pid == 0:
+            os.dup2(page.fileno(), 0)
             os.execl('/bin/sh', '/bin/sh', environ.pager_script, pager_type,
-                     self.get_page_path(environ.source, page_name),
-                     str(columns), environ.pager_config, page_name)
+                     '-', str(columns), environ.pager_config, page_name,
+                     mode)
+        page.close()
         return pid
 
+    def render(self, name, key, columns, device, renderer):
+        """Typeset the cached page name with renderer to the render cache,
+        and return a binary file object of the result, or None if groff
+        failed."""
+        from cppman.util import render_page
+
+        try:
+            text = render_page(self.cache.read_compressed(environ.source,
+                                                          name),
+                               columns, device, renderer)
+        except IOError:
+            return None
+        if text is None:
+            return None
+
+        try:
+            self.render_cache.put(key, text)
+        except (IOError, OSError):
+            # Shown anyway, rendered again next time
+            import tempfile
+
+            page = tempfile.TemporaryFile()
+            page.write(text)
+            page.seek(0)
+            return page
+        return self.render_cache.open(key)
+
     def find(self, pattern):
         """Find pages in database."""
 
         if not os.path.exists(environ.index_db):
             raise RuntimeError("can't find index.db")
 
-        conn = sqlite3.connect(environ.index_db)
-        cursor = conn.cursor()
-        selected = cursor.execute(
-            'SELECT * FROM "%s" WHERE name '
-            'LIKE "%%%s%%" ORDER BY LENGTH(name)'
-            % (environ.source, pattern)).fetchall()
-
-        pat = re.compile('(%s)' % pattern, re.I)
-
-        if selected:
-            for name, url, std in selected:
-                if os.isatty(sys.stdout.fileno()):
-                    print(pat.sub(r'\033[1;31m\1\033[0m', name) + (' \033[1;33m[%s]\033[0m' % std if std else ''))
-                else:
-                    print(name + (' [%s]' % std if std else ''))
+        if os.isatty(sys.stdout.fileno()):
+            start, end = '\033[1;31m', '\033[0m'
+            std_format = ' \033[1;33m[%s]\033[0m'
         else:
+            start, end = '', ''
+            std_format = ' [%s]'
+
+        def find_names():
+            from cppman.search import SearchResult
+
+            conn = index.connect(environ.index_db)
+            try:
+                pat = re.compile('(%s)' % re.escape(pattern), re.I)
+                return [SearchResult(pat.sub(start + r'\1' + end, name), url,
+                                     std, '', '')
+                        for name, url, std in index.search(
+                            conn, environ.source, pattern)]
+            finally:
+                conn.close()
+
+        def find_words():
+            # None when SQLite has no FTS5, leaving the page names
+            self.search_index.sync(environ.index_db)
+            return self.search_index.search(environ.source, pattern, start,
+                                            end)
+
+        # Symbols, e.g. 'operator<<', are lost by the full-text search
+        if re.search(r'[^\w\s:]', pattern):
+            selected = find_names() or find_words()
+        else:
+            selected = find_words() or find_names()
+
+        if not selected:
             raise RuntimeError('%s: nothing appropriate.' % pattern)
 
+        for result in selected:
+            line = result.name + (std_format % result.std if result.std
+                                  else '')
+            if result.description:
+                line += ' - ' + result.description
+            print(line)
+            if result.excerpt:
+                print('    ' + result.excerpt)
+
     def update_mandb(self, quiet=True):
         """Update mandb."""
         if not environ.config.UpdateManPath:
             return
+        import subprocess
+
         print('\nrunning mandb...')
         cmd = 'mandb %s' % (' -q' if quiet else '')
         subprocess.Popen(cmd, shell=True).wait()
 
-    def get_normalized_page_name(self, name):
-        return name.replace('/', '_')
 
-    def get_page_path(self, source, name):
-        name = self.get_normalized_page_name(name)
-        return os.path.join(environ.man_dir, source, name + '.3.gz')
+class Progress(object):
+    """Progress and ETA line of a long running operation."""
+    def __init__(self, total, out=sys.stdout):
+        self.total = total
+        self.count = 0
+        self.start = time.time()
+        self.out = out
+        self.tty = out.isatty()
+        self.shown = False
+
+    def update(self, count=1):
+        self.count += count
+        # Only every 5% when not on a terminal
+        step = max(1, self.total // 20)
+        if not self.tty and self.count % step and self.count != self.total:
+            return
+
+        elapsed = time.time() - self.start
+        rate = self.count / elapsed if elapsed > 0 else 0
+        eta = (self.total - self.count) / rate if rate else 0
+        line = '[%d/%d] %3d%% %.1f pages/sec ETA %d:%02d' % (
+            self.count, self.total, 100 * self.count // max(1, self.total),
+            rate, eta // 60, eta % 60)
+        if self.tty:
+            self.out.write('\r\033[K' + line)
+            self.shown = True
+        else:
+            self.out.write(line + '\n')
+        self.out.flush()
+
+    def clear(self):
+        """Clear the progress line, before printing other messages."""
+        if self.shown:
+            self.out.write('\r\033[K')
+            self.out.flush()
+            self.shown = False
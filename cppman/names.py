@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+#
+# names.py - prefix completion and fuzzy matching of page names
+#
+# Copyright (C) 2010 - 2016  Wei-Ning Huang (AZ) <aitjcize@gmail.com>
+# All Rights reserved.
+#
+# This file is part of cppman.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+import marshal
+import os
+
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+from cppman.config import Config
+from cppman.index import normalized_name, open_readonly
+from cppman.util import replace_file
+
+
+# Format of the serialized name index, bumped on incompatible changes
+FORMAT_VERSION = 1
+
+# Candidates of a fuzzy match ranked by edit distance, out of those sharing
+# the most trigrams with the pattern
+CANDIDATES = 64
+
+
+def index_stamp(index_db):
+    """Identify a version of index_db, to know when to rebuild from it."""
+    st = os.stat(index_db)
+    return '%s:%d:%d' % (os.path.abspath(index_db), st.st_mtime_ns,
+                         st.st_size)
+
+
+def trigrams(key):
+    key = '^' + key + '$'
+    return set(key[i:i + 3] for i in range(len(key) - 2))
+
+
+def edit_distance(a, b, limit):
+    """Edit distance of a and b, with insertions, deletions, substitutions
+    and transpositions of adjacent characters, or limit + 1 if it exceeds
+    limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+
+    before = None
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            d = min(previous[j] + 1, current[j - 1] + 1,
+                    previous[j - 1] + (ca != cb))
+            if i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                d = min(d, before[j - 2] + 1)
+            current.append(d)
+        if min(current) > limit:
+            return limit + 1
+        before, previous = previous, current
+    return previous[-1]
+
+
+def match_keys(name):
+    """Normalized forms of name to match against, with and without the
+    group cplusplus.com duplicates are renamed with, e.g. 'insert (map)'."""
+    key = normalized_name(name)
+    if key.endswith(')') and ' (' in key:
+        return (key, key[:key.rindex(' (')])
+    return (key,)
+
+
+def write_file(path, data):
+    try:
+        os.makedirs(os.path.dirname(path))
+    except OSError:
+        pass
+
+    def write(tmp):
+        with open(tmp, 'wb') as f:
+            f.write(data)
+
+    replace_file(path, write)
+
+
+class SourceNames(object):
+    """Names of the pages of a source, sorted lookup keys for prefix
+    completion and a trigram index of normalized names for fuzzy
+    matching."""
+    def __init__(self, names, keys, targets, postings):
+        self.names = names
+        # Sorted lowercase names and normalized names, and the index in
+        # names of each
+        self.keys = keys
+        self.targets = targets
+        # Trigram to array of indexes in names, decoded on first use
+        self.postings = postings
+
+    @classmethod
+    def build(cls, names):
+        names = tuple(sorted(set(names)))
+        keys = []
+        postings = {}
+        for i, name in enumerate(names):
+            normalized = normalized_name(name)
+            keys.append((name.lower(), i))
+            if normalized != name.lower():
+                keys.append((normalized, i))
+            for trigram in trigrams(match_keys(name)[-1]):
+                postings.setdefault(trigram, array('I')).append(i)
+        keys.sort()
+        return cls(names, tuple(k for k, i in keys),
+                   array('I', [i for k, i in keys]), postings)
+
+    def dump(self):
+        return (self.names, self.keys, self.targets.tobytes(),
+                dict((t, p.tobytes() if isinstance(p, array) else p)
+                     for t, p in self.postings.items()))
+
+    @classmethod
+    def load(cls, data):
+        names, keys, targets, postings = data
+        ids = array('I')
+        ids.frombytes(targets)
+        return cls(names, keys, ids, postings)
+
+    def _posting(self, trigram):
+        posting = self.postings.get(trigram)
+        if isinstance(posting, bytes):
+            ids = array('I')
+            ids.frombytes(posting)
+            posting = self.postings[trigram] = ids
+        return posting or ()
+
+    def complete(self, prefix, limit=None):
+        """Names starting with prefix, ignoring case and std::, in
+        order."""
+        prefix = prefix.lower()
+        keys = [prefix]
+        if normalized_name(prefix) != prefix:
+            keys.append(normalized_name(prefix))
+
+        found = set()
+        for key in keys:
+            i = bisect_left(self.keys, key)
+            while i < len(self.keys) and self.keys[i].startswith(key):
+                found.add(self.targets[i])
+                i += 1
+        return [self.names[i] for i in sorted(found)][:limit]
+
+    def completion_lines(self):
+        """'KEY\tNAME' line of each lookup key, sorted."""
+        return ['%s\t%s\n' % (key, self.names[i])
+                for key, i in zip(self.keys, self.targets)]
+
+    def suggest(self, pattern, limit=5):
+        """Names closest to pattern, best first: fewest edits to the
+        normalized names, then shortest."""
+        key = normalized_name(pattern)
+        if not key:
+            return []
+
+        shared = Counter()
+        for trigram in trigrams(key):
+            shared.update(self._posting(trigram))
+
+        # About one typo every four characters
+        max_distance = max(1, len(key) // 4)
+        ranked = []
+        for i, count in shared.most_common(CANDIDATES):
+            distance = min(edit_distance(key, k, max_distance)
+                           for k in match_keys(self.names[i]))
+            if distance <= max_distance:
+                ranked.append((distance, len(self.names[i]), self.names[i]))
+        return [name for distance, length, name in sorted(ranked)[:limit]]
+
+
+class NameIndex(object):
+    """Page names of index.db of each source, serialized to path so
+    loading needs neither SQLite nor rebuilding. The names of a source are
+    only decoded when used."""
+    def __init__(self, sources, stamp=None):
+        # Source to SourceNames, or to its serialized form
+        self.sources = sources
+        self.stamp = stamp
+
+    def names(self, source):
+        names = self.sources[source]
+        if isinstance(names, bytes):
+            names = self.sources[source] = SourceNames.load(
+                marshal.loads(names))
+        return names
+
+    @classmethod
+    def build(cls, index_db):
+        conn = open_readonly(index_db)
+        try:
+            sources = {}
+            for source in Config.SOURCES:
+                sources[source] = SourceNames.build(
+                    [name for name, in conn.execute(
+                        'SELECT name FROM "%s"' % source)])
+        finally:
+            conn.close()
+        return cls(sources, index_stamp(index_db))
+
+    @classmethod
+    def open(cls, path, index_db):
+        """Load the name index of index_db from path, building and saving
+        it first if path is missing or out of date."""
+        stamp = index_stamp(index_db)
+        try:
+            with open(path, 'rb') as f:
+                data = marshal.loads(f.read())
+            if data[0] == FORMAT_VERSION and data[1] == stamp:
+                return cls(data[2], stamp)
+        except (IOError, EOFError, ValueError, TypeError, IndexError):
+            pass
+
+        names = cls.build(index_db)
+        try:
+            names.save(path)
+        except (IOError, OSError):
+            # Still usable, rebuilt next time
+            pass
+        return names
+
+    def save(self, path):
+        write_file(path, marshal.dumps(
+            (FORMAT_VERSION, self.stamp,
+             dict((source, marshal.dumps(self.names(source).dump()))
+                  for source in self.sources))))
+
+    def save_completion_list(self, source, path):
+        """Write the names of source to path for shell completion scripts,
+        as 'KEY\tNAME' lines sorted by KEY, the lowercase name or the name
+        without std::, so look(1) finds the names of a prefix by
+        bisection."""
+        write_file(path, ''.join(
+            self.names(source).completion_lines()).encode('utf-8'))
+
+    def complete(self, source, prefix, limit=None):
+        return self.names(source).complete(prefix, limit)
+
+    def suggest(self, source, pattern, limit=5):
+        return self.names(source).suggest(pattern, limit)
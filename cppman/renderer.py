@@ -0,0 +1,775 @@
+# -*- coding: utf-8 -*-
+#
+# renderer.py - typeset man pages for terminals without groff
+#
+# Copyright (C) 2010 - 2016  Wei-Ning Huang (AZ) <aitjcize@gmail.com>
+# All Rights reserved.
+#
+# This file is part of cppman.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+import re
+
+
+# Indent of section bodies, and default indent of .IP and .RS
+INDENT = 7
+
+# Indent of .SS headings
+SS_INDENT = 3
+
+# Unpaddable space, \ and \~, kept apart from word separators until output
+NBSP = '\x00'
+
+# Special characters, \(xx and \[xx], of the ascii and utf8 devices
+SPECIAL_CHARS = {
+    'bu': ('o', '\u2022'),
+    'em': ('--', '\u2014'),
+    'en': ('-', '\u2013'),
+    'mi': ('-', '\u2212'),
+    'hy': ('-', '\u2010'),
+    'lq': ('"', '\u201c'),
+    'rq': ('"', '\u201d'),
+    'oq': ("'", '\u2018'),
+    'cq': ("'", '\u2019'),
+    'aq': ("'", "'"),
+    'dq': ('"', '"'),
+    'co': ('(C)', '\u00a9'),
+    'rg': ('(R)', '\u00ae'),
+    'tm': ('tm', '\u2122'),
+    'ha': ('^', '^'),
+    'ti': ('~', '~'),
+    'rs': ('\\', '\\'),
+    'sl': ('/', '/'),
+    'ga': ('`', '`'),
+    'ba': ('|', '|'),
+    'or': ('|', '|'),
+    'lB': ('[', '['),
+    'rB': (']', ']'),
+    'lC': ('{', '{'),
+    'rC': ('}', '}'),
+    'la': ('<', '\u27e8'),
+    'ra': ('>', '\u27e9'),
+    '<=': ('<=', '\u2264'),
+    '>=': ('>=', '\u2265'),
+    '!=': ('!=', '\u2260'),
+    '->': ('->', '\u2192'),
+    '<-': ('<-', '\u2190'),
+    'mu': ('x', '\u00d7'),
+    'de': ('o', '\u00b0'),
+}
+
+# Escapes printing nothing
+ZERO_WIDTH = '&^|:%c)dupz'
+
+ESCAPE = re.compile(r'\\(?:f(?:\[([^\]]*)\]|\((..)|(.))|'
+                    r'\((..)|\[([^\]]*)\]|\*(?:\[[^\]]*\]|\(..|.)|'
+                    r's[-+]?\d+|[NhvwoxbLlDRXYZkSH]\'[^\']*\'|"(.*)$|(.))')
+
+SENTENCE_END = re.compile(r'[.?!]["\')\]*]*$')
+
+
+class Word(object):
+    """A word of the output, as (text, font) chunks."""
+    def __init__(self):
+        self.chunks = []
+        self.width = 0
+        # Followed by two spaces, in fill mode
+        self.sentence_end = False
+
+    def append(self, text, font):
+        if text:
+            self.chunks.append((text, font))
+            self.width += len(text)
+
+    def __str__(self):
+        return ''.join(text for text, font in self.chunks)
+
+
+class Renderer(object):
+    """Typeset the man(7) and tbl(1) subset the formatters emit as text for
+    a terminal of the given columns, like groff -t -c -m man. Bold and
+    italic are overstruck, c^Hc and _^Hc, as grotty -c does."""
+    def __init__(self, columns, device='ascii'):
+        self.columns = columns
+        self.device = device
+        self.lines = []
+        self.title = None
+
+        # Left margin of the man macros: section bodies, .RS
+        self.margin = INDENT
+        self.margins = []
+        # Indent of the text of .IP paragraphs, relative to margin
+        self.ip_indent = 0
+        self.prevailing = INDENT
+        self.indent = INDENT
+        self.previous_indent = INDENT
+
+        self.fill = True
+        self.font = 'R'
+        self.previous_font = 'R'
+        # Font of the next text line, for .B and .I without arguments
+        self.next_line_font = None
+        self.words = []
+        # Tag of the current .IP paragraph, not output yet
+        self.tag = None
+        # Alternate the side extra spaces are added to, as groff does
+        self.spread_right = True
+        # Vertical space is ignored until the next output line
+        self.no_space = False
+
+    # Output
+    # ----------------------------------------------------------------------
+
+    def overstrike(self, word):
+        out = []
+        for text, font in word.chunks:
+            text = text.replace(NBSP, ' ')
+            if font == 'B':
+                text = ''.join(c + '\b' + c if c != ' ' else c for c in text)
+            elif font == 'I':
+                text = ''.join('_\b' + c if c != ' ' else c for c in text)
+            out.append(text)
+        return ''.join(out)
+
+    def emit(self, line):
+        self.lines.append(line.rstrip())
+        self.no_space = False
+
+    def space(self, count=1):
+        """Vertical space, unless in no-space mode, as after headings."""
+        if not self.no_space:
+            self.lines.extend([''] * count)
+
+    def emit_words(self, words, width, adjust):
+        gaps = [2 if w.sentence_end else 1 for w in words[:-1]]
+        extra = width - sum(w.width for w in words) - sum(gaps)
+        if adjust and gaps and extra > 0:
+            order = list(range(len(gaps)))
+            if self.spread_right:
+                order.reverse()
+            self.spread_right = not self.spread_right
+            for i in range(extra):
+                gaps[order[i % len(order)]] += 1
+
+        out = [self.overstrike(words[0])]
+        for gap, word in zip(gaps, words[1:]):
+            out.append(' ' * gap + self.overstrike(word))
+        return ''.join(out)
+
+    def flush(self, adjust=False):
+        """Output the words gathered so far as a line."""
+        prefix = ' ' * self.indent
+        if self.tag is not None:
+            tag, self.tag = self.tag, None
+            tag_indent = self.indent - self.ip_indent
+            if tag.width < self.ip_indent:
+                prefix = (' ' * tag_indent + self.overstrike(tag) +
+                          ' ' * (self.ip_indent - tag.width))
+            else:
+                self.emit(' ' * tag_indent + self.overstrike(tag))
+
+        if self.words:
+            width = max(1, self.columns - self.indent)
+            self.emit(prefix + self.emit_words(self.words, width, adjust))
+        elif prefix.strip():
+            self.emit(prefix)
+        self.words = []
+
+    def brk(self):
+        if self.words or self.tag is not None:
+            self.flush()
+
+    def add_words(self, words):
+        width = max(1, self.columns - self.indent)
+        for word in words:
+            if self.words:
+                used = (sum(w.width for w in self.words) +
+                        sum(2 if w.sentence_end else 1
+                            for w in self.words))
+                if used + word.width > width:
+                    self.flush(adjust=True)
+            self.words.append(word)
+
+    # Text
+    # ----------------------------------------------------------------------
+
+    def special(self, name):
+        chars = SPECIAL_CHARS.get(name)
+        if chars is None:
+            return name if len(name) == 1 else ''
+        return chars[self.device == 'utf8']
+
+    def parse(self, text):
+        """Split a text line into Words, interpreting escapes."""
+        words = [Word()]
+
+        def add(s):
+            for i, part in enumerate(s.split(' ')):
+                if i > 0 and words[-1].width:
+                    words.append(Word())
+                words[-1].append(part, self.font)
+
+        # \E is the escape character too
+        text = text.replace('\\E', '\\')
+        pos = 0
+        for m in ESCAPE.finditer(text):
+            add(text[pos:m.start()])
+            pos = m.end()
+            font = m.group(1) or m.group(2) or m.group(3)
+            if font is not None:
+                if font in ('P', ''):
+                    self.font, self.previous_font = (self.previous_font,
+                                                     self.font)
+                else:
+                    self.previous_font = self.font
+                    self.font = {'B': 'B', 'I': 'I', '3': 'B',
+                                 '2': 'I'}.get(font, 'R')
+            elif m.group(4) or m.group(5):
+                add(self.special(m.group(4) or m.group(5)))
+            elif m.group(6) is not None:
+                # Comment
+                pos = len(text)
+                break
+            elif m.group(7):
+                c = m.group(7)
+                if c in ('e', '\\'):
+                    add('\\')
+                elif c in (' ', '~', '0'):
+                    words[-1].append(NBSP, self.font)
+                elif c not in ZERO_WIDTH:
+                    add(c)
+        add(text[pos:])
+
+        return [w for w in words if w.width]
+
+    def phrase(self, text):
+        """text as a single Word, spaces kept."""
+        word = Word()
+        for w in self.parse(text.replace(' ', NBSP)):
+            for chunk, font in w.chunks:
+                word.append(chunk, font)
+        return word
+
+    def text(self, line):
+        font = None
+        if self.next_line_font:
+            font, self.font = self.font, self.next_line_font
+            self.next_line_font = None
+
+        if not self.fill:
+            self.brk()
+            self.emit(' ' * self.indent +
+                      self.overstrike(self.phrase(line)))
+        elif not line.strip():
+            self.brk()
+            self.space()
+        else:
+            if line[0] == ' ':
+                self.brk()
+            words = self.parse(line)
+            if words and SENTENCE_END.search(str(words[-1])):
+                words[-1].sentence_end = True
+            self.add_words(words)
+
+        if font is not None:
+            self.font = font
+
+    def styled(self, args, font):
+        """Words of the arguments of .B and .I."""
+        saved = self.font
+        self.font = font
+        words = self.parse(' '.join(args))
+        self.font = saved
+        return words
+
+    # Requests and macros
+    # ----------------------------------------------------------------------
+
+    def set_indent(self, indent):
+        self.previous_indent, self.indent = self.indent, max(0, indent)
+
+    def reset_paragraph(self):
+        self.ip_indent = 0
+        self.fill = True
+        self.set_indent(self.margin)
+
+    def heading(self, args, indent):
+        self.brk()
+        self.space()
+        self.margin = INDENT
+        self.margins = []
+        self.prevailing = INDENT
+        title = Word()
+        title.append(' '.join(args), 'B')
+        self.emit(' ' * indent + self.overstrike(title))
+        self.reset_paragraph()
+        self.no_space = True
+
+    def request(self, name, args):
+        if name == 'TH':
+            args += [''] * (5 - len(args))
+            # Escapes interpreted, e.g. "C++ Programmer\'s Manual"
+            args = [str(self.phrase(arg)).replace(NBSP, ' ') for arg in args]
+            self.title = args
+            head = '%s(%s)' % (args[0], args[1])
+            self.emit(self.three_part(head, args[4], head))
+            self.emit('')
+            self.no_space = True
+        elif name in ('SH', 'SS'):
+            self.heading(args, 0 if name == 'SH' else SS_INDENT)
+        elif name in ('PP', 'P', 'LP'):
+            self.brk()
+            self.space()
+            self.prevailing = INDENT
+            self.reset_paragraph()
+        elif name in ('IP', 'TP'):
+            self.brk()
+            self.space()
+            if len(args) > 1:
+                self.prevailing = self.units(args[1], self.prevailing)
+            self.ip_indent = self.prevailing
+            self.fill = True
+            self.set_indent(self.margin + self.ip_indent)
+            tag = self.phrase(args[0] if args else '')
+            self.tag = tag if tag.width else None
+        elif name == 'RS':
+            self.brk()
+            self.margins.append((self.margin, self.prevailing))
+            self.margin += self.units(args[0], self.prevailing) if args \
+                else self.prevailing
+            self.prevailing = INDENT
+            self.reset_paragraph()
+        elif name == 'RE':
+            self.brk()
+            if self.margins:
+                self.margin, self.prevailing = self.margins.pop()
+            self.reset_paragraph()
+        elif name == 'in':
+            self.brk()
+            if not args:
+                self.set_indent(self.previous_indent)
+            elif args[0][0] in '+-':
+                self.set_indent(self.indent +
+                                self.units(args[0], 0, relative=True))
+            else:
+                self.set_indent(self.units(args[0], self.indent))
+        elif name == 'nf':
+            self.brk()
+            self.fill = False
+        elif name == 'fi':
+            self.brk()
+            self.fill = True
+        elif name == 'sp':
+            self.brk()
+            self.space(self.units(args[0], 1) if args else 1)
+        elif name == 'br':
+            self.brk()
+        elif name in ('B', 'I'):
+            if args:
+                words = self.styled(args, name)
+                if not self.fill:
+                    self.brk()
+                    self.emit(' ' * self.indent + ' '.join(
+                        self.overstrike(w) for w in words))
+                else:
+                    self.add_words(words)
+            else:
+                self.next_line_font = name
+
+    def units(self, value, default, relative=False):
+        """Columns of a groff numeric expression, e.g. '+2n', '3'."""
+        m = re.match(r'([-+]?)(\d+(?:\.\d+)?)([nmiuv]?)$', value)
+        if not m:
+            return default
+        n = float(m.group(2))
+        if m.group(3) == 'i':
+            n *= 10
+        n = int(round(n))
+        return -n if m.group(1) == '-' else n
+
+    def three_part(self, left, center, right):
+        """Line of a left, a centered and a right aligned part, as .tl."""
+        line = list(left.ljust(self.columns))
+        start = max(len(left) + 1, (self.columns - len(center)) // 2)
+        line[start:start + len(center)] = center
+        line = ''.join(line).rstrip()
+        pad = self.columns - len(right) - len(line)
+        return line + ' ' * max(1, pad) + right
+
+    # Tables
+    # ----------------------------------------------------------------------
+
+    def table(self, lines):
+        """Render the lines between .TS and .TE."""
+        self.brk()
+        table = Table(lines)
+        width = max(10, self.columns - self.indent)
+        for line in table.render(self, width):
+            self.emit(' ' * self.indent + line)
+
+    # Driver
+    # ----------------------------------------------------------------------
+
+    def render(self, groff_text):
+        lines = groff_text.split('\n')
+        i = 0
+        while i < len(lines):
+            line = lines[i]
+            i += 1
+            if line.startswith(('.', "'")) and len(line) > 1:
+                name, args = split_request(line[1:])
+                if name == 'TS':
+                    start = i
+                    while i < len(lines) and \
+                            not lines[i].startswith('.TE'):
+                        i += 1
+                    self.table(lines[start:i])
+                    i += 1
+                elif name in ('SH', 'SS') and not args and i < len(lines):
+                    # The heading is the next line
+                    self.request(name, [lines[i]])
+                    i += 1
+                else:
+                    self.request(name, args)
+            else:
+                self.text(line)
+
+        self.brk()
+        if self.title:
+            self.no_space = False
+            self.space()
+            self.emit(self.three_part(self.title[3], self.title[2],
+                                      '%s(%s)' % (self.title[0],
+                                                  self.title[1])))
+        return '\n'.join(self.lines) + '\n'
+
+
+def split_request(line):
+    """Name and arguments of a request line, without the leading '.'."""
+    line = line.lstrip()
+    m = re.match(r'(\S*)\s*(.*)$', line)
+    name, rest = m.group(1), m.group(2)
+    if name.startswith('\\"'):
+        return '', []
+    args = []
+    for m in re.finditer(r'"((?:[^"]|"")*)"?|(\S+)', rest):
+        if m.group(1) is not None:
+            args.append(m.group(1).replace('""', '"'))
+        else:
+            args.append(m.group(2))
+    if name[:1].isupper():
+        # Arguments of the man macros, unlike those of requests, are read
+        # in copy mode, where \\ is a backslash, e.g. .IP \\[bu] 3
+        args = [arg.replace('\\\\', '\\') for arg in args]
+    return name, args
+
+
+class Table(object):
+    """A tbl(1) table: options, a format line per row, and rows of cells
+    separated by the tab character, T{ and T} enclosing text blocks."""
+    def __init__(self, lines):
+        self.tab = '\t'
+        self.box = False
+        i = 0
+        if lines and lines[0].rstrip().endswith(';'):
+            options = lines[0]
+            self.box = 'box' in options
+            m = re.search(r'tab\s*\((.)\)', options)
+            if m:
+                self.tab = m.group(1)
+            i = 1
+
+        self.formats = []
+        while i < len(lines):
+            line = lines[i].strip()
+            i += 1
+            self.formats.append(re.findall(r'([lcrnsa^_=])([a-z0-9]*)',
+                                           line.rstrip('.').lower()))
+            if line.endswith('.'):
+                break
+        self.rows = self.parse_rows(lines[i:])
+        self.columns = max([len(f) for f in self.formats] +
+                           [len(r) for r in self.rows] + [1])
+
+    def parse_rows(self, lines):
+        rows = []
+        i = 0
+        while i < len(lines):
+            rest = lines[i]
+            i += 1
+            if rest.startswith('.'):
+                # Requests between rows, e.g. .sp
+                continue
+            cells = []
+            while True:
+                cell, sep, rest = rest.partition(self.tab)
+                if cell.strip() == 'T{':
+                    block = []
+                    while i < len(lines) and not lines[i].startswith('T}'):
+                        block.append(lines[i])
+                        i += 1
+                    rest = lines[i][2:] if i < len(lines) else ''
+                    i += 1
+                    cells.append(block)
+                    if rest.startswith(self.tab):
+                        rest = rest[1:]
+                        continue
+                    break
+                cells.append([cell])
+                if not sep:
+                    break
+            rows.append(cells)
+        return rows
+
+    def format(self, row, column):
+        """Key letter of the format of a cell, e.g. 'l'."""
+        fmt = self.formats[min(row, len(self.formats) - 1)]
+        return fmt[column][0] if column < len(fmt) else 'l'
+
+    def expanded(self, column):
+        """Whether a column has the x modifier, filling the line."""
+        return any(column < len(fmt) and 'x' in fmt[column][1]
+                   for fmt in self.formats)
+
+    def cell_lines(self, renderer, cell, width):
+        sub = Renderer(width, renderer.device)
+        sub.margin = sub.indent = sub.previous_indent = 0
+        sub.prevailing = INDENT
+        text = '\n'.join(cell)
+        if text.strip() in ('\\^', '^'):
+            return []
+        sub.render(text)
+        while sub.lines and not sub.lines[-1]:
+            sub.lines.pop()
+        while sub.lines and not sub.lines[0]:
+            sub.lines.pop(0)
+        return sub.lines
+
+    def spans(self, r):
+        """(column, span) of the cells of row r."""
+        spans = []
+        for c in range(self.columns):
+            if self.format(r, c) == 's' and spans:
+                column, span = spans[-1]
+                spans[-1] = (column, span + 1)
+            else:
+                spans.append((c, 1))
+        return spans
+
+    def widths(self, renderer, width):
+        """Column widths fitting width, less the borders."""
+        separator = 3
+        available = width - separator * self.columns - 1
+        natural = [1] * self.columns
+        minimum = [1] * self.columns
+        for r, row in enumerate(self.rows):
+            cells = iter(row)
+            for c, span in self.spans(r):
+                cell = next(cells, [])
+                if span > 1:
+                    continue
+                words = str(' '.join(cell)).split()
+                text = ' '.join(w for w in words if w not in ('.br', '.sp'))
+                plain = strip_escapes(text)
+                natural[c] = max(natural[c], len(plain))
+                minimum[c] = max([minimum[c]] +
+                                 [len(w) for w in plain.split()])
+
+        if sum(natural) <= available:
+            widths = natural
+            expanded = [c for c in range(self.columns) if self.expanded(c)]
+            for i, c in enumerate(expanded):
+                share = (available - sum(widths)) // (len(expanded) - i)
+                widths[c] += share
+            return widths
+
+        widths = list(minimum)
+        spare = available - sum(widths)
+        if spare > 0:
+            wanted = [n - m for n, m in zip(natural, minimum)]
+            total = sum(wanted) or 1
+            for c in range(self.columns):
+                widths[c] += spare * wanted[c] // total
+        return widths
+
+    def render(self, renderer, width):
+        widths = self.widths(renderer, width)
+        horizontal, vertical, cross = '-', '|', '+'
+
+        def rule(r):
+            if not self.box:
+                return None
+            parts = []
+            for c, span in (self.spans(r) if r < len(self.rows) else
+                            [(c, 1) for c in range(self.columns)]):
+                w = sum(widths[c:c + span]) + 3 * (span - 1) + 2
+                spanned = r < len(self.rows) and self.format(r, c) == '^'
+                parts.append((' ' if spanned else horizontal) * w)
+            return cross + cross.join(parts) + cross
+
+        out = []
+        for r, row in enumerate(self.rows):
+            if rule(r):
+                out.append(rule(r))
+            cells = iter(row)
+            columns = []
+            for c, span in self.spans(r):
+                w = sum(widths[c:c + span]) + 3 * (span - 1)
+                cell = next(cells, [])
+                lines = (self.cell_lines(renderer, cell, w)
+                         if self.format(r, c) != '^' else [])
+                columns.append((w, self.format(r, c), lines))
+
+            height = max([len(lines) for w, f, lines in columns] + [1])
+            for i in range(height):
+                parts = []
+                for w, f, lines in columns:
+                    line = lines[i] if i < len(lines) else ''
+                    pad = w - visible_width(line)
+                    if f == 'c':
+                        line = ' ' * (pad // 2) + line + ' ' * (pad - pad // 2)
+                    elif f in ('r', 'n'):
+                        line = ' ' * pad + line
+                    else:
+                        line = line + ' ' * pad
+                    parts.append(line)
+                if self.box:
+                    out.append(vertical + ' ' + (' ' + vertical + ' ')
+                               .join(parts) + ' ' + vertical)
+                else:
+                    out.append('   '.join(parts).rstrip())
+        if rule(len(self.rows)):
+            out.append(rule(len(self.rows)))
+        return out
+
+
+def strip_escapes(text):
+    return ESCAPE.sub(lambda m: '' if not m.group(7) or
+                      m.group(7) in ZERO_WIDTH else m.group(7), text)
+
+
+def visible_width(line):
+    return len(re.sub('.\b', '', line))
+
+
+def render(groff_text, columns, device='ascii'):
+    """Typeset groff_text, a man page, for a terminal of the given columns
+    and groff device, ascii or utf8."""
+    return Renderer(columns, device).render(groff_text)
+
+
+# Columns of the expected outputs of the test pages
+TEST_COLUMNS = (80, 120)
+
+
+def expected_path(page_path, columns):
+    """The expected -Tascii output of the test page at page_path, e.g.
+    test/groff/cplusplus-vector.ascii.80.txt."""
+    return '%s.ascii.%d.txt' % (page_path[:-len('.3')], columns)
+
+
+def groff_ascii(groff_text, columns):
+    """groff_text as groff typesets it for the ascii device, overstriking
+    removed."""
+    import subprocess
+
+    # Without hyphenation, as the Python renderer has none
+    text = subprocess.run(
+        ['groff', '-t', '-m', 'man', '-Tascii', '-rHY=0',
+         '-rLL=%dn' % columns, '-rLT=%dn' % columns],
+        input=groff_text.encode('utf-8'), stdout=subprocess.PIPE,
+        check=True).stdout.decode('utf-8')
+    return re.sub('.\b', '', text)
+
+
+def write_expected(corpus_dir):
+    """Write the outputs groff typesets for the man pages (*.3) in
+    corpus_dir, as func_test expects them."""
+    import os
+
+    for name in sorted(os.listdir(corpus_dir)):
+        if not name.endswith('.3'):
+            continue
+        path = os.path.join(corpus_dir, name)
+        with open(path) as f:
+            groff_text = f.read()
+        for columns in TEST_COLUMNS:
+            with open(expected_path(path, columns), 'w') as f:
+                f.write(groff_ascii(groff_text, columns))
+
+
+def func_test(corpus_dir):
+    """Render the man pages (*.3) in corpus_dir, checking no line is wider
+    than the terminal, no escape is output as text and each line has the
+    words of the same line groff typesets. groff's output is read from the
+    files write_expected writes, or failing that from groff if installed."""
+    import os
+    import shutil
+
+    def words(line):
+        # Spaces are spread differently and table rules drawn differently
+        return [w for w in line.replace('|', ' ').split()
+                if not re.match(r'^[-+=]+$', w)]
+
+    def unbreakable(groff_text):
+        # Lines output as they are however wide, as groff does: lines of
+        # no-fill text and .IP tags
+        renderer = Renderer(80)
+        lines = set()
+        for line in groff_text.split('\n'):
+            if line.startswith('.'):
+                name, args = split_request(line[1:])
+                if name != 'IP' or not args:
+                    continue
+                line = args[0]
+            lines.add(' '.join(str(renderer.phrase(line))
+                               .replace(NBSP, ' ').split()))
+        return lines
+
+    for name in sorted(os.listdir(corpus_dir)):
+        if not name.endswith('.3'):
+            continue
+        path = os.path.join(corpus_dir, name)
+        with open(path) as f:
+            groff_text = f.read()
+
+        wide = unbreakable(groff_text)
+        for columns in TEST_COLUMNS:
+            text = render(groff_text, columns)
+            lines = re.sub('.\b', '', text).rstrip('\n').split('\n')
+            for line in lines:
+                # Tables too are as wide as their cells need
+                assert (len(line) <= columns or
+                        re.match(r'\s*[|+]', line) or
+                        ' '.join(line.split()) in wide), (name, line)
+                assert not re.search(r'\\[\\(\[*\'`fs]', line), (
+                    name, columns, line)
+
+            if os.path.exists(expected_path(path, columns)):
+                with open(expected_path(path, columns)) as f:
+                    expected = f.read()
+            elif shutil.which('groff'):
+                expected = groff_ascii(groff_text, columns)
+            else:
+                continue
+            expected = expected.rstrip('\n').split('\n')
+            assert len(lines) == len(expected), (name, columns, len(lines),
+                                                 len(expected))
+            for number, (line, groff_line) in enumerate(zip(lines, expected),
+                                                         1):
+                assert words(line) == words(groff_line), (
+                    name, columns, number, line, groff_line)
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+#
+# scheduler.py - polite per-host request scheduling for the crawler
+#
+# Copyright (C) 2010 - 2016  Wei-Ning Huang (AZ) <aitjcize@gmail.com>
+# All Rights reserved.
+#
+# This file is part of cppman.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+import time
+
+from email.utils import parsedate_to_datetime
+from threading import Condition, Lock
+
+
+THROTTLED = (429, 503)
+
+
+class TokenBucket(object):
+    """Allow `rate' requests per second on average, bursts of `burst'."""
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst))
+        self.tokens = self.burst
+        self.last = time.time()
+
+    def reserve(self, now):
+        """Take a token, returns 0, or the seconds to wait for one."""
+        self.tokens = min(self.burst,
+                          self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class HostState(object):
+    """Politeness state and statistics of a single host.
+
+    The concurrency limit follows AIMD: it grows by one request per window
+    of successful requests and is halved, at most once per `latency_target'
+    seconds, on errors, throttling responses or slow responses.
+    """
+    def __init__(self, max_limit, rate=None, burst=1, latency_target=2.0):
+        self.max_limit = max(1, max_limit)
+        self.limit = float(self.max_limit)
+        self.latency_target = latency_target
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.in_flight = 0
+        self.blocked_until = 0
+        self.last_decrease = 0
+        self.robots = None
+
+        self.requests = 0
+        self.errors = 0
+        self.throttled = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def reserve(self, now):
+        """Start a request, returns 0, or the seconds to wait before
+        trying again."""
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.in_flight >= int(self.limit):
+            return None
+        if self.bucket:
+            wait = self.bucket.reserve(now)
+            if wait:
+                return wait
+        self.in_flight += 1
+        return 0
+
+    def release(self, now, status, latency, retry_after, error):
+        self.in_flight -= 1
+        self.requests += 1
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+
+        if status in THROTTLED:
+            self.throttled += 1
+            self.blocked_until = max(self.blocked_until, now + retry_after)
+        if error:
+            self.errors += 1
+
+        if error or status in THROTTLED or latency > self.latency_target:
+            if now - self.last_decrease >= self.latency_target:
+                self.limit = max(1.0, self.limit / 2)
+                self.last_decrease = now
+        else:
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+
+class Scheduler(object):
+    """Decide when the crawler may send a request to a host.
+
+    Every request is bracketed by acquire() (or try_acquire() for the
+    asyncio engine) and release(). Requests are spaced by a per-host token
+    bucket, hosts answering 429/503 are left alone for their Retry-After
+    time, the per-host concurrency adapts to errors and latency and urls
+    disallowed by robots.txt are not crawled.
+    """
+    DEFAULT_RETRY_AFTER = 5
+
+    def __init__(self, max_concurrency=16, rate=None, burst=1,
+                 latency_target=2.0, user_agent='cppman', robots=True):
+        self.max_concurrency = max_concurrency
+        self.rate = rate
+        self.burst = burst
+        self.latency_target = latency_target
+        self.user_agent = user_agent
+        self.robots = robots
+        self.hosts = {}
+        self.cond = Condition(Lock())
+
+    def host(self, host):
+        with self.cond:
+            return self._host(host)
+
+    def _host(self, host):
+        if host not in self.hosts:
+            self.hosts[host] = HostState(self.max_concurrency, self.rate,
+                                         self.burst, self.latency_target)
+        return self.hosts[host]
+
+    def try_acquire(self, host):
+        """Start a request to host if allowed, returns 0, or the seconds to
+        wait before trying again."""
+        with self.cond:
+            wait = self._host(host).reserve(time.time())
+            return 0.05 if wait is None else wait
+
+    def acquire(self, host):
+        """Wait until a request to host is allowed and start it."""
+        with self.cond:
+            state = self._host(host)
+            while True:
+                wait = state.reserve(time.time())
+                if wait == 0:
+                    return
+                # None: wait for a release
+                self.cond.wait(wait)
+
+    def release(self, host, status=None, latency=0, retry_after=None,
+                error=False):
+        """Finish a request to host started by acquire()."""
+        with self.cond:
+            self._host(host).release(
+                time.time(), status, latency,
+                self.parse_retry_after(retry_after), error)
+            self.cond.notify_all()
+
+    def delay(self, host):
+        """Seconds until host accepts requests again."""
+        with self.cond:
+            return max(0, self._host(host).blocked_until - time.time())
+
+    def parse_retry_after(self, value):
+        """Parse a Retry-After header, in seconds or as an HTTP date."""
+        if not value:
+            return self.DEFAULT_RETRY_AFTER
+        try:
+            return max(0, int(value))
+        except ValueError:
+            pass
+        try:
+            return max(0, parsedate_to_datetime(value).timestamp() -
+                       time.time())
+        except (TypeError, ValueError, IndexError):
+            return self.DEFAULT_RETRY_AFTER
+
+    def load_robots(self, proto, host):
+        """Fetch robots.txt of host, honoring its Crawl-delay and
+        Request-rate. Done once per host, failures allow everything."""
+        # Imported lazily, urllib.request is heavy
+        from urllib.robotparser import RobotFileParser
+
+        state = self.host(host)
+        if not self.robots or state.robots is not None:
+            return
+
+        robots = RobotFileParser(proto + host + '/robots.txt')
+        try:
+            robots.read()
+        except Exception:
+            robots.allow_all = True
+
+        rate = None
+        delay = robots.crawl_delay(self.user_agent)
+        if delay:
+            rate = 1.0 / float(delay)
+        request_rate = robots.request_rate(self.user_agent)
+        if request_rate and request_rate.seconds:
+            rate = min(rate or float('inf'),
+                       float(request_rate.requests) / request_rate.seconds)
+
+        with self.cond:
+            state.robots = robots
+            if rate and (not state.bucket or rate < state.bucket.rate):
+                state.bucket = TokenBucket(rate)
+
+    def allowed(self, proto, host, url):
+        """Whether robots.txt of host allows crawling url."""
+        if not self.robots:
+            return True
+        state = self.host(host)
+        if state.robots is None:
+            self.load_robots(proto, host)
+        return state.robots.can_fetch(self.user_agent, url)
+
+    def print_stats(self, host):
+        state = self.host(host)
+        if not state.requests:
+            return
+        print('%s: %d requests, %d errors, %d throttled, '
+              'latency avg %.0fms max %.0fms, concurrency %d' %
+              (host, state.requests, state.errors, state.throttled,
+               1000 * state.total_latency / state.requests,
+               1000 * state.max_latency, int(state.limit)))
@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+#
+# search.py - full-text search over page names and contents
+#
+# Copyright (C) 2010 - 2016  Wei-Ning Huang (AZ) <aitjcize@gmail.com>
+# All Rights reserved.
+#
+# This file is part of cppman.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+import os
+import re
+import sqlite3
+
+from collections import namedtuple
+from threading import Lock
+
+from cppman import index
+from cppman.cache import connect, remove_database
+from cppman.config import Config
+
+
+# A search result, name and description are highlighted, excerpt is a
+# highlighted snippet of the page text when only the text matched
+SearchResult = namedtuple('SearchResult',
+                          ['name', 'url', 'std', 'description', 'excerpt'])
+
+# bm25 weights of the name, description and text columns
+WEIGHTS = (10.0, 4.0, 1.0)
+
+# Enclose matches in the results of the query, replaced by the caller's
+MARK_START, MARK_END = '\x02', '\x03'
+
+# Results of a query matching only some of its words
+OR_LIMIT = 20
+
+# Whether SQLite has FTS5, see has_fts5
+_fts5 = None
+
+
+def has_fts5():
+    """Whether SQLite is built with FTS5, checked once. Without it pages
+    are only searched by name."""
+    global _fts5
+    if _fts5 is None:
+        conn = sqlite3.connect(':memory:')
+        try:
+            conn.execute('CREATE VIRTUAL TABLE "probe" USING fts5(text)')
+            _fts5 = True
+        except sqlite3.OperationalError:
+            _fts5 = False
+        finally:
+            conn.close()
+    return _fts5
+
+
+def page_summary(groff_text):
+    """Return the (short description, plain text) of a formatted page."""
+    m = re.search(r'\.SH "NAME"\n[^\n]*? - (.*?)\n', groff_text)
+    description = m.group(1).strip() if m else ''
+
+    lines = []
+    for line in groff_text.split('\n'):
+        if line.startswith('.'):
+            # Keep the arguments of paragraph macros, e.g. .IP "push_back"
+            m = re.match(r'\.(?:IP|SH|SS|TP|B|I)\s+"?(.*?)"?\s*$', line)
+            if not m:
+                continue
+            line = m.group(1)
+        lines.append(line)
+    text = re.sub(r'\\f[BIRP]|\\f\(\w\w|\\\(\w\w|\\[e&]|T[{}]', ' ',
+                  '\n'.join(lines))
+    return description, re.sub(r'\s+', ' ', text).strip()
+
+
+def match_query(pattern, all_words=True):
+    """FTS5 query of the words of pattern. Matching all words, each is a
+    prefix, e.g. 'vec' finds vector; matching any word, as for sentences,
+    words are only stemmed. Returns None if pattern has no words."""
+    words = re.findall(r'\w+', pattern)
+    if not words:
+        return None
+    if all_words:
+        return ' AND '.join('"%s"*' % w for w in words)
+    return ' OR '.join('"%s"' % w for w in words)
+
+
+class SearchIndex(object):
+    """FTS5 index of the pages of index.db. Names are taken from index.db,
+    descriptions and text are added as pages are formatted. Without FTS5,
+    updates are dropped and searches return None."""
+    def __init__(self, path):
+        self.path = path
+        self.lock = Lock()
+        self.conn = None
+
+    def _connect(self):
+        if self.conn is None:
+            self.conn = connect(self.path)
+            self.conn.execute('CREATE TABLE IF NOT EXISTS "page" '
+                              '(id INTEGER PRIMARY KEY, source TEXT, '
+                              'name TEXT, url TEXT, std TEXT, '
+                              'UNIQUE (source, name))')
+            self.conn.execute('CREATE VIRTUAL TABLE IF NOT EXISTS "page_fts" '
+                              'USING fts5(name, description, text, '
+                              'tokenize="porter unicode61")')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS "meta" '
+                              '(key TEXT PRIMARY KEY, value TEXT)')
+            self.conn.commit()
+        return self.conn
+
+    def sync(self, index_db):
+        """Add the names of index_db and drop the pages no longer in it,
+        unless index_db didn't change since the last sync."""
+        if not has_fts5():
+            return
+        try:
+            st = os.stat(index_db)
+        except OSError:
+            return
+        stamp = '%s:%d:%d' % (os.path.abspath(index_db), st.st_mtime_ns,
+                              st.st_size)
+
+        with self.lock:
+            conn = self._connect()
+            row = conn.execute('SELECT value FROM "meta" WHERE key=?',
+                               ('index',)).fetchone()
+            if row and row[0] == stamp:
+                return
+
+            index_conn = index.open_readonly(index_db)
+            try:
+                wanted = {}
+                for source in Config.SOURCES:
+                    for name, url, std in index_conn.execute(
+                            'SELECT name, url, std FROM "%s"' % source):
+                        wanted.setdefault((source, name), (url, std))
+            finally:
+                index_conn.close()
+
+            with conn:
+                existing = dict(((source, name), id) for id, source, name in
+                                conn.execute('SELECT id, source, name '
+                                             'FROM "page"'))
+                removed = [(id,) for key, id in existing.items()
+                           if key not in wanted]
+                conn.executemany('DELETE FROM "page" WHERE id=?', removed)
+                conn.executemany('DELETE FROM "page_fts" WHERE rowid=?',
+                                 removed)
+
+                for (source, name), (url, std) in wanted.items():
+                    if (source, name) in existing:
+                        conn.execute('UPDATE "page" SET url=?, std=? '
+                                     'WHERE id=?',
+                                     (url, std, existing[source, name]))
+                        continue
+                    id = conn.execute('INSERT INTO "page" '
+                                      '(source, name, url, std) '
+                                      'VALUES (?, ?, ?, ?)',
+                                      (source, name, url, std)).lastrowid
+                    conn.execute('INSERT INTO "page_fts" '
+                                 '(rowid, name, description, text) '
+                                 "VALUES (?, ?, '', '')", (id, name))
+                conn.execute('INSERT OR REPLACE INTO "meta" (key, value) '
+                             'VALUES (?, ?)', ('index', stamp))
+                conn.execute("INSERT INTO page_fts (page_fts) "
+                             "VALUES ('optimize')")
+
+    def update(self, source, name, groff_text, url=None):
+        """Record the description and text of a formatted page."""
+        if not has_fts5():
+            return
+        description, text = page_summary(groff_text)
+        with self.lock:
+            conn = self._connect()
+            with conn:
+                row = conn.execute('SELECT id FROM "page" '
+                                   'WHERE source=? AND name=?',
+                                   (source, name)).fetchone()
+                if row is None:
+                    id = conn.execute('INSERT INTO "page" (source, name, url) '
+                                      'VALUES (?, ?, ?)',
+                                      (source, name, url)).lastrowid
+                else:
+                    id = row[0]
+                    conn.execute('DELETE FROM "page_fts" WHERE rowid=?',
+                                 (id,))
+                conn.execute('INSERT INTO "page_fts" '
+                             '(rowid, name, description, text) '
+                             'VALUES (?, ?, ?, ?)',
+                             (id, name, description, text))
+
+    def search(self, source, pattern, start='', end=''):
+        """Return the SearchResults of the pages of source matching the
+        words of pattern, best first, with matches enclosed in start and
+        end. Pages matching all words are returned, or failing that the
+        OR_LIMIT pages matching most. Returns None if pattern has no
+        words or SQLite has no FTS5."""
+        if not has_fts5() or match_query(pattern) is None:
+            return None
+
+        with self.lock:
+            conn = self._connect()
+            for all_words in (True, False):
+                query = match_query(
+                    pattern if all_words else self._rare_words(pattern),
+                    all_words)
+                # Pages whose name matches first, shortest name first as
+                # index.search does, then the others by bm25. The text of a
+                # cached page mentions its name too often for bm25 alone to
+                # rank the page above those named after it.
+                ranked = conn.execute(
+                    'SELECT p.id, p.url, p.std, page_fts.rowid IN ('
+                    ' SELECT rowid FROM "page_fts" WHERE page_fts MATCH :name'
+                    ') AS named '
+                    'FROM "page_fts" JOIN "page" AS p ON p.id=page_fts.rowid '
+                    'WHERE page_fts MATCH :query AND p.source=:source '
+                    'ORDER BY named DESC, '
+                    'CASE WHEN named THEN LENGTH(p.name) END, '
+                    'bm25(page_fts, %s) %s'
+                    % (', '.join('%.1f' % w for w in WEIGHTS),
+                       '' if all_words else 'LIMIT %d' % OR_LIMIT),
+                    {'query': query, 'name': 'name : (%s)' % query,
+                     'source': source}).fetchall()
+                if ranked:
+                    break
+            else:
+                return []
+
+            # Highlight the returned pages only, not every match
+            marked = dict((row[0], row[1:]) for row in conn.execute(
+                'SELECT rowid, highlight(page_fts, 0, :start, :end),'
+                ' highlight(page_fts, 1, :start, :end),'
+                " snippet(page_fts, 2, :start, :end, '...', 12) "
+                'FROM "page_fts" WHERE page_fts MATCH :query AND rowid IN (%s)'
+                % ', '.join(str(row[0]) for row in ranked),
+                {'query': query, 'start': MARK_START, 'end': MARK_END}))
+
+        results = []
+        for id, url, std, named in ranked:
+            name, description, excerpt = marked[id]
+            # Excerpts only when the name and description didn't match
+            if MARK_START in name or MARK_START in description:
+                excerpt = ''
+            name, description, excerpt = [
+                f.replace(MARK_START, start).replace(MARK_END, end)
+                for f in (name, description, excerpt)]
+            results.append(SearchResult(name, url, std or '', description,
+                                        excerpt))
+        return results
+
+    def _rare_words(self, pattern):
+        """The words of pattern but those on half of the pages or more, such
+        as 'the', which bm25 gives no weight but take the longest to rank."""
+        conn = self._connect()
+        total = conn.execute('SELECT COUNT(*) FROM "page"').fetchone()[0]
+        words = re.findall(r'\w+', pattern)
+        rare = [w for w in words if conn.execute(
+            'SELECT COUNT(*) FROM "page_fts" WHERE page_fts MATCH ?',
+            ('"%s"' % w,)).fetchone()[0] < total / 2]
+        return ' '.join(rare or words)
+
+    def optimize(self):
+        """Merge the FTS5 index segments, after many updates."""
+        if not has_fts5():
+            return
+        with self.lock:
+            conn = self._connect()
+            conn.execute("INSERT INTO page_fts (page_fts) VALUES ('optimize')")
+            conn.commit()
+
+    def clear(self):
+        self.close()
+        remove_database(self.path)
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+
+def func_test():
+    """Search the pages of the bundled index.db, and check that without
+    FTS5 the index takes updates and returns no results, leaving
+    Cppman.find to search the page names."""
+    global _fts5
+    import shutil
+    import tempfile
+
+    from cppman import get_lib_path
+
+    index_db = get_lib_path('index.db')
+    available = has_fts5()
+    tmpdir = tempfile.mkdtemp()
+    try:
+        for _fts5 in sorted(set((available, False))):
+            path = os.path.join(tmpdir, 'search-%s.db' % _fts5)
+            search_index = SearchIndex(path)
+            search_index.sync(index_db)
+            search_index.update('cppreference.com', 'std::vector',
+                                '.SH "NAME"\nstd::vector - Dynamic array\n')
+            search_index.optimize()
+            results = search_index.search('cppreference.com', 'vector')
+            search_index.close()
+            if _fts5:
+                assert results[0].name == 'std::vector', results[:3]
+                assert results[0].description == 'Dynamic array', results[0]
+            else:
+                assert results is None, results
+                assert not os.path.exists(path), path
+    finally:
+        _fts5 = available
+        shutil.rmtree(tmpdir)
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+#
+# snapshot.py - offline store of raw HTML pages
+#
+# Copyright (C) 2010 - 2016  Wei-Ning Huang (AZ) <aitjcize@gmail.com>
+# All Rights reserved.
+#
+# This file is part of cppman.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+import gzip
+import hashlib
+import os
+import sqlite3
+import time
+
+from threading import Lock
+
+from cppman.util import replace_file
+
+
+class SnapshotStore(object):
+    """Content addressed store of the raw HTML of fetched pages.
+
+    Pages are gzipped under objects/ by the SHA-1 of their content, so
+    identical pages are stored once, and index.db maps each url to the hash
+    of its latest snapshot.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.objects = os.path.join(path, 'objects')
+        try:
+            os.makedirs(self.objects)
+        except OSError:
+            pass
+
+        self.lock = Lock()
+        self.conn = sqlite3.connect(os.path.join(path, 'index.db'),
+                                    check_same_thread=False)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS "snapshot" '
+                          '(url TEXT PRIMARY KEY, hash TEXT, fetched REAL)')
+        self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def object_path(self, digest):
+        return os.path.join(self.objects, digest[:2], digest[2:] + '.gz')
+
+    def put(self, url, html):
+        """Record `html' (bytes) as the latest snapshot of url, returns its
+        hash."""
+        digest = hashlib.sha1(html).hexdigest()
+        path = self.object_path(digest)
+
+        if not os.path.exists(path):
+            try:
+                os.makedirs(os.path.dirname(path))
+            except OSError:
+                pass
+
+            def write(tmp):
+                with open(tmp, 'wb') as f:
+                    with gzip.GzipFile(filename='', fileobj=f, mode='wb',
+                                       mtime=0) as gz:
+                        gz.write(html)
+
+            replace_file(path, write)
+
+        with self.lock:
+            self.conn.execute('INSERT OR REPLACE INTO "snapshot" '
+                              '(url, hash, fetched) VALUES (?, ?, ?)',
+                              (url, digest, time.time()))
+            self.conn.commit()
+        return digest
+
+    def get(self, url):
+        """Return the latest snapshot of url, or None."""
+        with self.lock:
+            row = self.conn.execute('SELECT hash FROM "snapshot" WHERE url=?',
+                                    (url,)).fetchone()
+        if row is None:
+            return None
+
+        try:
+            with gzip.open(self.object_path(row[0]), 'rb') as f:
+                return f.read()
+        except IOError:
+            return None
+
+    def urls(self):
+        with self.lock:
+            return set(url for url, in
+                       self.conn.execute('SELECT url FROM "snapshot"'))
@@ -25,14 +25,11 @@
 import fcntl
 import os
 import struct
-import subprocess
 import sys
 import termios
 
 from cppman import environ
 
-import bs4
-
 
 def update_mandb_path():
     """Add ~/.local/share/man to $HOME/.manpath"""
@@ -84,6 +81,28 @@ def update_man3_link():
     os.symlink(environ.config.Source, man3_path)
 
 
+def replace_file(path, write, suffix='', rename=os.replace):
+    """Create path with write(tmp), which writes the new contents to tmp, a
+    hidden file beside path, renamed over path once complete: readers never
+    see a partial file. tmp is removed when anything fails, even an
+    interrupt, and the exception re-raised."""
+    import tempfile
+
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                               prefix='.', suffix=suffix)
+    os.close(fd)
+    try:
+        write(tmp)
+        rename(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            # Already renamed
+            pass
+        raise
+
+
 def get_width():
     """Get terminal width"""
     # Get terminal size
@@ -96,16 +115,62 @@ def get_width():
     return width
 
 
+def get_output_device():
+    """groff output device for the locale, utf8 or ascii."""
+    for var in (os.environ.get('LC_ALL', ''), os.environ.get('LANG', '')):
+        if 'utf8' in var.replace('-', '').lower():
+            return 'utf8'
+    return 'ascii'
+
+
+def get_renderer(renderer=None):
+    """The renderer to typeset pages with, 'groff' or 'python'. 'auto', the
+    default, is groff when installed, else the Python one."""
+    renderer = renderer or environ.renderer
+    if renderer == 'auto':
+        import shutil
+
+        renderer = 'groff' if shutil.which('groff') else 'python'
+    return renderer
+
+
+def typeset(groff_text, columns, device, renderer=None):
+    """Typeset groff_text, a man page as bytes, for a terminal of the given
+    columns and groff device, as pager.sh does. Returns None if groff
+    fails."""
+    if get_renderer(renderer) == 'python':
+        from cppman import renderer
+
+        return renderer.render(groff_text.decode('utf-8'), columns,
+                               device).encode('utf-8')
+
+    import subprocess
+
+    cmd = ['groff', '-t', '-c', '-m', 'man', '-T' + device,
+           '-rLL=%dn' % columns, '-rLT=%dn' % columns]
+    try:
+        handle = subprocess.run(cmd, input=groff_text,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL)
+    except OSError:
+        return None
+    if handle.returncode != 0 or not handle.stdout:
+        return None
+    return handle.stdout
+
+
+def render_page(data, columns, device, renderer=None):
+    """Typeset the gzipped man page data, see typeset()."""
+    import gzip
+
+    return typeset(gzip.decompress(data), columns, device, renderer)
+
+
 def groff2man(data):
     """Read groff-formatted text and output man pages."""
-    width = get_width()
-
-    cmd = 'groff -t -Tascii -m man -rLL=%dn -rLT=%dn' % (width, width)
-    handle = subprocess.Popen(
-        cmd, shell=True, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE)
-    man_text, stderr = handle.communicate(data)
-    return man_text
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return typeset(data, get_width(), 'ascii')
 
 
 def html2man(data, formatter):
@@ -115,5 +180,66 @@ def html2man(data, formatter):
     return man_text
 
 
-def fixupHTML(data):
-    return str(bs4.BeautifulSoup(data, "html5lib"))
+# HTML normalizers, in the order 'auto' tries them. 'html5lib', through
+# BeautifulSoup, is the slowest and is only used when asked for.
+NORMALIZERS = ['html5-parser', 'lxml', 'python', 'html5lib']
+
+_normalizer = None
+
+
+def get_normalizer(normalizer=None):
+    """The normalizer of fixupHTML, the first of NORMALIZERS installed
+    unless normalizer is given."""
+    global _normalizer
+
+    if normalizer and normalizer != 'auto':
+        return normalizer
+    if _normalizer is None:
+        import importlib
+        import importlib.util
+
+        _normalizer = 'python'
+        if importlib.util.find_spec('lxml') is not None:
+            _normalizer = 'lxml'
+        if importlib.util.find_spec('html5_parser') is not None:
+            try:
+                # html5-parser refuses to load with a different libxml2
+                # than lxml's
+                importlib.import_module('html5_parser')
+                _normalizer = 'html5-parser'
+            except (ImportError, RuntimeError):
+                pass
+    return _normalizer
+
+
+def fixupHTML(data, normalizer=None):
+    """The HTML text or bytes data with its tags balanced, serialized as
+    the formatters expect, see get_normalizer()."""
+    normalizer = get_normalizer(normalizer)
+    # Only needed when formatting pages, slow to import
+    if normalizer == 'html5lib':
+        import bs4
+        from bs4.formatter import HTMLFormatter
+        from bs4.dammit import EntitySubstitution
+
+        class SourceOrder(HTMLFormatter):
+            # The rules match attributes in the order of the page, which
+            # BeautifulSoup sorts by default
+            def attributes(self, tag):
+                return tag.attrs.items()
+
+        return bs4.BeautifulSoup(data, "html5lib").decode(
+            formatter=SourceOrder(
+                entity_substitution=EntitySubstitution.substitute_xml))
+
+    from cppman.formatter import htmltree
+
+    if normalizer == 'html5-parser':
+        import html5_parser
+
+        return htmltree.normalize_lxml(data, html5_parser.parse)
+    if normalizer == 'lxml':
+        import lxml.html
+
+        return htmltree.normalize_lxml(data, lxml.html.document_fromstring)
+    return htmltree.normalize(data)
@@ -0,0 +1,20 @@
+# fish completion for cppman
+#
+# Page names are looked up in the sorted list written by
+# `cppman --completion-list', by bisection with look(1), so completing
+# doesn't start cppman. A prefix matches names regardless of case and of
+# the std:: prefix, e.g. 'unordered_m' completes to std::unordered_map.
+
+function __cppman_pages
+    set -l list ~/.cache/cppman/completion.list
+    test -r $list; or cppman --completion-list >/dev/null
+    set -l key (string lower -- (commandline -ct))
+    if command -q look
+        env LC_ALL=C look -- "$key" $list
+    else
+        env LC_ALL=C awk -F '\t' -v key="$key" \
+            'index($1, key) == 1 { print }' $list
+    end | cut -f 2 | sort -u
+end
+
+complete -c cppman -f -a '(__cppman_pages)'
@@ -10,7 +10,12 @@ _package_data = [
 
 _data_files = [
         ('share/doc/cppman', ['README.rst', 'AUTHORS', 'COPYING', 'ChangeLog']),
-        ('share/man/man1', ['misc/cppman.1'])
+        ('share/man/man1', ['misc/cppman.1']),
+        ('share/bash-completion/completions',
+            ['misc/completion/bash/cppman']),
+        ('share/zsh/site-functions', ['misc/completion/zsh/_cppman']),
+        ('share/fish/vendor_completions.d',
+            ['misc/completion/fish/cppman.fish'])
         ]
 
 setup(
@@ -25,10 +30,20 @@ setup(
         package_data = {'cppman': _package_data},
         data_files = _data_files,
         scripts = ['bin/cppman'],
-        install_requires=['beautifulsoup4', 'html5lib'],
+        extras_require={
+            # Faster parsing of the pages than the standard library
+            'lxml': ['lxml'],
+            # The html5lib normalizer, needs bs4.formatter
+            'html5lib': ['beautifulsoup4>=4.7', 'html5lib'],
+        },
+        python_requires='>=3.7',
         classifiers = [
-            'Programming Language :: Python :: 3.3',
-            'Programming Language :: Python :: 3.4',
+            'Programming Language :: Python :: 3.7',
+            'Programming Language :: Python :: 3.8',
+            'Programming Language :: Python :: 3.9',
+            'Programming Language :: Python :: 3.10',
+            'Programming Language :: Python :: 3.11',
+            'Programming Language :: Python :: 3.12',
             'Programming Language :: Python :: 3 :: Only',
             'Topic :: Software Development :: Documentation',
         ],
@@ -0,0 +1,1273 @@
+#!/usr/bin/env python
+"""Performance benchmarks for cppman.
+
+Usage: test/benchmark.py BENCHMARK [ARGS...]
+
+Benchmarks:
+  crawl [MIRROR_DIR]
+      Crawl a local HTTP fixture server with every crawler engine and
+      report pages/sec. MIRROR_DIR is a mirrored tree (e.g. `wget -m -E')
+      with the top-level directories 'cplusplus.com/reference' and
+      'cppreference.com/w/cpp'; absolute links are rewritten to point to
+      the fixture server. Without MIRROR_DIR a synthetic tree of the same
+      shape is served.
+
+  recrawl [MIRROR_DIR]
+      Crawl the fixture server once, then again revalidating the recorded
+      pages with conditional requests, and report both timings.
+
+  polite [RATE]
+      Crawl the synthetic fixture tree while the server answers 429 with
+      Retry-After to one request in 50, with a per-host rate limit of RATE
+      requests/sec (unlimited by default), and report the throughput and
+      the scheduler statistics.
+
+  cache [PAGES]
+      Cache PAGES (default 100) synthetic cppreference.com pages served by
+      the fixture server, one at a time as before and with the pipelined
+      cache_pages, and report pages/sec.
+
+  lookup [SIZES]
+      Time checking whether a page is cached, as man() does, in directory
+      caches of the comma separated SIZES pages (default 100,1000,10000),
+      with a directory listing as before and with the cache manifest.
+
+  query [INDEX_DB]
+      Time man()'s page lookup over every entry of INDEX_DB (the bundled
+      index by default): the exact name, the name without std:: and a
+      substring of it, with the previous three formatted queries on an
+      index without indexes and with the single parameterized query.
+
+  build [INDEX_DB]
+      Time writing the pages of INDEX_DB (the bundled index by default) to
+      a new index, names shared by several cplusplus.com pages renamed,
+      with an INSERT per name and a SELECT and UPDATE per duplicate as
+      before and with Indexer.write_index.
+
+  swap [SECONDS]
+      Look pages up from 4 processes for SECONDS (default 3) while
+      another rebuilds the index over and over, and report the lookups,
+      the rebuilds and the failed or inconsistent lookups, which make the
+      benchmark fail.
+
+  resolve [COUNT]
+      Time looking up COUNT (default 5) page names given on the command
+      line, with a connection and a query each as before and with
+      Cppman.resolve.
+
+  search [MAN_DIR]
+      Time --find-page queries over the full-text index of the bundled
+      index, with the description and text of the cached pages (*.3.gz)
+      in MAN_DIR/<source>, or of a synthetic page for each entry.
+
+  names
+      Time loading the serialized name index of the bundled index, "did
+      you mean" suggestions for misspelled names and prefix completion
+      of each prefix of a name, as typed.
+
+  complete [PREFIX]
+      Time completing PREFIX (default 'vector::em') as shell completion
+      does: running `cppman --complete', which skips the other imports,
+      bisecting the list of `cppman --completion-list' and running
+      look(1) on it.
+
+  startup
+      Report the import time of the commands that format nothing, with
+      `python -X importtime', over that of the bare interpreter. Exits
+      with an error if any exceeds STARTUP_BUDGET_MS or imports the
+      crawler, the formatters or BeautifulSoup.
+
+  render [COUNT]
+      Time viewing COUNT (default 20) synthetic pages at 80 columns twice:
+      typeset by groff, as each view did before, then read from the
+      render cache. Needs groff.
+
+  renderer [CORPUS_DIR]
+      Time typesetting the man pages (*.3) in CORPUS_DIR (default
+      test/groff) at 80 columns with the Python renderer, and with a
+      groff process per page, as the 'groff' renderer does, if installed.
+
+  links [CORPUS_DIR]
+      Links/sec of the cppreference.com link parser, against the previous
+      reverse-regex implementation, over the saved pages (*.html) in
+      CORPUS_DIR or over synthetic pages.
+
+  formatters [CORPUS_DIR]
+      Pages/sec of the html2groff of each formatter over the saved pages
+      in CORPUS_DIR/<source>/*.html (default test/html), with the rules
+      compiled once, against compiling and applying each rule in turn as
+      before, checking both give the same pages. The slowest rules follow.
+
+  normalizers [CORPUS_DIR] [SCALE]
+      Time fixupHTML with each installed normalizer over the saved pages
+      in CORPUS_DIR/<source>/*.html (default test/html), with the tags
+      pages may leave out removed, and over their body repeated SCALE
+      (default 10) times, as large as std::basic_string, against
+      html5lib. Fails if a page is formatted differently than with
+      html5lib.
+
+  tables [CORPUS_DIR]
+      Time formatting the tables of the saved pages in
+      CORPUS_DIR/<source>/*.html (default test/html), their rows repeated
+      up to 1000 rows, and synthetic 1000 rows tables and tables of a cell
+      of many lines, with the tag stack of parse_table, against matching
+      the element regex over the body of each element as before. Tables
+      formatted differently are marked: the regex took some tags for
+      elements named after a prefix of their name, e.g. <br/> before <b>.
+
+  postprocess [CORPUS_DIR]
+      Time html2groff of each formatter over the saved pages in
+      CORPUS_DIR/<source>/*.html (default test/html), their content
+      repeated 1 to 64 times, and cppreference.postprocess over the text
+      of the rules, and report the time per KiB, which stays flat as the
+      pages grow.
+"""
+
+import gzip
+import hashlib
+import multiprocessing
+import os
+import os.path
+import random
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.normpath(os.getcwd()))
+
+from cppman import environ
+from cppman import get_lib_path, index
+from cppman.cache import DirectoryCache
+from cppman.crawler import Crawler, CPPReferenceLinkParser
+from cppman.indexer import Indexer
+from cppman.main import Cppman
+from cppman.names import NameIndex
+from cppman.search import SearchIndex
+
+
+# Fixture HTTP server
+# ------------------------------------------------------------------------
+
+SYNTHETIC_LIBS = 20
+SYNTHETIC_PAGES = 50
+SYNTHETIC_PADDING = '<p>%s</p>\n' % ('lorem ipsum dolor sit amet ' * 40)
+
+
+def synthetic_page(path):
+    """Generate a page of the synthetic cplusplus.com/cppreference.com tree,
+    returns None if `path' is not part of it."""
+    for root in ('/cplusplus.com/reference/', '/cppreference.com/w/cpp/'):
+        if (path.rstrip('/') + '/').startswith(root):
+            break
+    else:
+        return None
+
+    parts = [p for p in path[len(root) - 1:].split('/') if p]
+    if len(parts) == 0:
+        children = ['%slib%d/' % (root, i) for i in range(SYNTHETIC_LIBS)]
+        title = 'Reference'
+    elif len(parts) == 1:
+        children = ['%s%s/name%d/' % (root, parts[0], i)
+                    for i in range(SYNTHETIC_PAGES)]
+        title = 'std::' + parts[0]
+    elif len(parts) == 2:
+        index = int(parts[1][4:])
+        children = ['%s%s/name%d/' % (root, parts[0],
+                                      (index + i) % SYNTHETIC_PAGES)
+                    for i in range(1, 6)] + [root + parts[0] + '/']
+        title = 'std::%s::%s' % tuple(parts)
+    else:
+        return None
+
+    links = ''.join(
+        '<a href="%s">%s</a> <span class="t-mark-rev">(C++11)</span>\n'
+        % (c, c) for c in children)
+    return ('<html><head><title>%s</title></head><body>\n'
+            '<h1>%s</h1>\n%s%s</body></html>\n'
+            % (title, title, links, SYNTHETIC_PADDING * 10)).encode('utf-8')
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    mirror_dir = None
+    throttle_every = 0
+    requests = 0
+    requests_lock = threading.Lock()
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+
+        if self.throttle_every:
+            with self.requests_lock:
+                FixtureHandler.requests += 1
+                throttle = FixtureHandler.requests % self.throttle_every == 0
+            if throttle:
+                self.send_response(429)
+                self.send_header('Retry-After', '1')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+        if self.mirror_dir:
+            filename = os.path.join(self.mirror_dir, path.lstrip('/'))
+            if os.path.isdir(filename):
+                filename = os.path.join(filename, 'index.html')
+            try:
+                with open(filename, 'rb') as f:
+                    body = self.rewrite_links(path, f.read())
+            except IOError:
+                body = None
+        elif path.startswith('/pages/'):
+            body = synthetic_cppreference_page(
+                int(path[len('/pages/'):])).encode('utf-8')
+        else:
+            body = synthetic_page(path)
+
+        if body is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def rewrite_links(self, path, body):
+        """Point absolute links of a mirrored page back to this server."""
+        site = path.split('/')[1].encode('utf-8')
+        return re.sub(br'(href\s*=\s*["\'])(?:https?://[a-z]*\.?' +
+                      re.escape(site) + br')?/(?!/)',
+                      br'\1/' + site + br'/', body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _serve(mirror_dir, throttle_every, port_queue):
+    FixtureHandler.mirror_dir = mirror_dir
+    FixtureHandler.throttle_every = throttle_every
+    ThreadingHTTPServer.request_queue_size = 128
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FixtureHandler)
+    server.daemon_threads = True
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+def start_fixture_server(mirror_dir=None, throttle_every=0):
+    """Serve the fixture tree from another process, returns (process, base
+    url). If throttle_every is set, every throttle_every-th request is
+    answered with 429."""
+    port_queue = multiprocessing.Queue()
+    proc = multiprocessing.Process(target=_serve,
+                                   args=(mirror_dir, throttle_every,
+                                         port_queue))
+    proc.daemon = True
+    proc.start()
+    return proc, 'http://127.0.0.1:%d' % port_queue.get()
+
+
+# Benchmarks
+# ------------------------------------------------------------------------
+
+class BenchCrawler(Crawler):
+    def __init__(self):
+        Crawler.__init__(self)
+        self.pages = 0
+        self.pages_lock = threading.Lock()
+
+    def process_document(self, doc, std):
+        with self.pages_lock:
+            self.pages += 1
+
+
+    def process_unmodified(self, url, std):
+        with self.pages_lock:
+            self.pages += 1
+
+
+CRAWL_ROOTS = (('/cplusplus.com/reference/', None),
+               ('/cppreference.com/w/cpp', '/cppreference.com/w/cpp'))
+
+
+def timed_crawl(base, root, path, engine, revalidate=None, rate=None):
+    crawler = BenchCrawler()
+    crawler.set_engine(engine)
+    if rate:
+        crawler.set_rate_limit(rate, rate)
+    crawler.set_follow_mode(Crawler.F_SAME_PATH)
+    crawler.add_url_filter(r'\.(jpg|jpeg|gif|png|js|css|swf|svg)$')
+    if revalidate:
+        crawler.set_revalidate(revalidate)
+
+    start = time.time()
+    crawler.crawl(base + root, path)
+    elapsed = time.time() - start
+
+    print('  %-16s %6d pages %8.2fs %10.1f pages/sec' %
+          (engine + (' (reval)' if revalidate else ''), crawler.pages,
+           elapsed, crawler.pages / elapsed))
+    return crawler
+
+
+def bench_crawl(mirror_dir=None):
+    proc, base = start_fixture_server(mirror_dir)
+    try:
+        for root, path in CRAWL_ROOTS:
+            print('%s%s' % (base, root))
+            for engine in Crawler.ENGINES:
+                timed_crawl(base, root, path, engine)
+    finally:
+        proc.terminate()
+
+
+def bench_recrawl(mirror_dir=None):
+    proc, base = start_fixture_server(mirror_dir)
+    try:
+        for root, path in CRAWL_ROOTS:
+            print('%s%s' % (base, root))
+            for engine in Crawler.ENGINES:
+                crawler = timed_crawl(base, root, path, engine)
+                timed_crawl(base, root, path, engine, crawler.crawled)
+    finally:
+        proc.terminate()
+
+
+def bench_polite(rate=None):
+    proc, base = start_fixture_server(throttle_every=50)
+    try:
+        root, path = CRAWL_ROOTS[0]
+        print('%s%s' % (base, root))
+        for engine in Crawler.ENGINES:
+            crawler = timed_crawl(base, root, path, engine,
+                                  rate=float(rate) if rate else None)
+            assert crawler.pages == len(crawler.visited)
+    finally:
+        proc.terminate()
+
+
+def bench_cache(count=100):
+    pages = [('std::c%d' % i, '/pages/%d' % i) for i in range(int(count))]
+    man_dir = environ.man_dir
+    environ.man_dir = tempfile.mkdtemp()
+    proc, base = start_fixture_server()
+    try:
+        pages = [(name, base + url) for name, url in pages]
+        cm = Cppman(forced=True)
+
+        start = time.time()
+        for name, url in pages:
+            cm.cache_man_page('cppreference.com', url, name)
+        serial = time.time() - start
+        print('  %-10s %6d pages %8.2fs %10.1f pages/sec' %
+              ('serial', len(pages), serial, len(pages) / serial))
+
+        cm.success_count = cm.failure_count = 0
+        start = time.time()
+        cm.cache_pages('cppreference.com', pages)
+        elapsed = time.time() - start
+        assert cm.success_count == len(pages)
+        print('  %-10s %6d pages %8.2fs %10.1f pages/sec (%d CPUs)' %
+              ('pipelined', len(pages), elapsed, len(pages) / elapsed,
+               os.cpu_count()))
+    finally:
+        proc.terminate()
+        shutil.rmtree(environ.man_dir)
+        environ.man_dir = man_dir
+
+
+def bench_lookup(sizes='100,1000,10000'):
+    rounds = 200
+    for size in [int(s) for s in sizes.split(',')]:
+        tmp = tempfile.mkdtemp()
+        try:
+            man_dir = os.path.join(tmp, 'man')
+            manifest = os.path.join(tmp, 'manifest.db')
+            cache = DirectoryCache(man_dir, manifest)
+            for i in range(size):
+                cache.write_compressed('cppreference.com', 'std::c%d' % i,
+                                       b'', 'http://localhost/%d' % i)
+            cache.close()
+            name = 'std::c%d' % (size // 2)
+
+            start = time.time()
+            for i in range(rounds):
+                avail = os.listdir(os.path.join(man_dir, 'cppreference.com'))
+                assert name + '.3.gz' in avail
+            listdir = (time.time() - start) / rounds
+
+            # A fresh cache each time, like a new cppman process
+            start = time.time()
+            for i in range(rounds):
+                cache = DirectoryCache(man_dir, manifest)
+                assert cache.contains('cppreference.com', name)
+                cache.close()
+            manifest = (time.time() - start) / rounds
+
+            print('  %6d pages  listdir %8.3fms  manifest %8.3fms' %
+                  (size, listdir * 1000, manifest * 1000))
+        finally:
+            shutil.rmtree(tmp)
+
+
+def legacy_lookup(cursor, source, pattern):
+    """Cppman.man's lookup before the indexed schema."""
+    for query in ('WHERE name="%s"', 'WHERE name="std::%s"',
+                  'WHERE name LIKE "%%%%%s%%%%"'):
+        row = cursor.execute(('SELECT name,url FROM "%s" ' + query +
+                              ' ORDER BY LENGTH(name)')
+                             % (source, pattern)).fetchone()
+        if row is not None:
+            return row
+    return None
+
+
+def bench_query(index_db=None):
+    tmp = tempfile.mkdtemp()
+    try:
+        db = os.path.join(tmp, 'index.db')
+        legacy_db = os.path.join(tmp, 'legacy.db')
+        shutil.copy(index_db or get_lib_path('index.db'), db)
+        conn = index.connect(db)
+        legacy = sqlite3.connect(legacy_db)
+        for source in environ.config.SOURCES:
+            legacy.execute('CREATE TABLE "%s" (name VARCHAR(255), '
+                           'url VARCHAR(255), std VARCHAR(255))' % source)
+            legacy.executemany('INSERT INTO "%s" VALUES (?, ?, ?)' % source,
+                               conn.execute('SELECT name, url, std FROM "%s"'
+                                            % source))
+        legacy.commit()
+
+        for source in environ.config.SOURCES:
+            names = [name for name, in conn.execute(
+                'SELECT name FROM "%s"' % source) if '"' not in name]
+            short = [n[5:] for n in names if n.startswith('std::')]
+            substrings = [n[len(n) // 4:-len(n) // 4 or None] for n in short]
+            print('%s: %d entries' % (source, len(names)))
+            for kind, patterns in (('exact', names), ('std::', short),
+                                   ('substring', substrings)):
+                timings = []
+                for lookup, c in ((legacy_lookup, legacy.cursor()),
+                                  (index.lookup, conn)):
+                    start = time.time()
+                    for pattern in patterns:
+                        lookup(c, source, pattern)
+                    timings.append((time.time() - start) / len(patterns))
+                print('  %-10s %6d lookups  legacy %8.3fms  indexed %8.3fms' %
+                      (kind, len(patterns), timings[0] * 1000,
+                       timings[1] * 1000))
+        conn.close()
+        legacy.close()
+    finally:
+        shutil.rmtree(tmp)
+
+
+def legacy_build(path, tables):
+    """Indexer.rebuild_index's writes before the bulk load."""
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    index.create_tables(conn)
+    for source, rows in sorted(tables.items()):
+        for name, url, std in rows:
+            cursor.execute('INSERT INTO "%s" (name, url, std, normalized) '
+                           'VALUES ("%s", "%s", "%s", "%s")'
+                           % (source, name, url, std,
+                              index.normalized_name(name)))
+        conn.commit()
+
+        if source != 'cplusplus.com':
+            continue
+        duplicates = cursor.execute('SELECT name, COUNT(name) AS NON '
+                                    'FROM "cplusplus.com" GROUP BY NAME '
+                                    'HAVING (NON > 1)').fetchall()
+        for name, num in duplicates:
+            dump = cursor.execute('SELECT name, url FROM "cplusplus.com" '
+                                  'WHERE name="%s"' % name).fetchall()
+            for n, u in dump:
+                n2 = n[5:] if n.startswith('std::') else n
+                try:
+                    group = re.search('/([^/]+)/%s/$' % n2, u).group(1)
+                except Exception:
+                    group = re.search('/([^/]+)/[^/]+/$', u).group(1)
+                new_name = '%s (%s)' % (n, group)
+                cursor.execute('UPDATE "cplusplus.com" SET name="%s", '
+                               'normalized="%s" WHERE url="%s"'
+                               % (new_name, index.normalized_name(new_name),
+                                  u))
+        conn.commit()
+    conn.close()
+
+
+def bench_build(index_db=None):
+    conn = index.connect(index_db or get_lib_path('index.db'))
+    tables = {}
+    for source in environ.config.SOURCES:
+        # As crawled, before duplicates were renamed; the legacy queries
+        # can't take names with quotes
+        tables[source] = [
+            (re.sub(r' \([^)]*\)$', '', name), url, std or '')
+            for name, url, std in conn.execute(
+                'SELECT name, url, std FROM "%s"' % source)
+            if '"' not in name]
+    conn.close()
+
+    indexer = Indexer(None)
+    tmp = tempfile.mkdtemp()
+    try:
+        def bulk(path, tables):
+            tables = dict(tables, **{'cplusplus.com': indexer.rename_duplicates(
+                tables['cplusplus.com'])})
+            indexer.write_index(path, tables)
+
+        for name, build in (('legacy', legacy_build), ('bulk', bulk)):
+            path = os.path.join(tmp, name + '.db')
+            start = time.time()
+            build(path, tables)
+            elapsed = time.time() - start
+            print('  %-8s %6d rows %8.3fs' %
+                  (name, sum(len(rows) for rows in tables.values()), elapsed))
+    finally:
+        shutil.rmtree(tmp)
+
+
+def swap_reader(path, seconds, expected):
+    lookups = errors = 0
+    end = time.time() + seconds
+    while time.time() < end:
+        try:
+            conn = index.connect(path)
+            try:
+                count = conn.execute('SELECT COUNT(*) FROM "%s"'
+                                     % environ.source).fetchone()[0]
+                if count != expected or \
+                        not index.lookup(conn, environ.source, 'vector'):
+                    errors += 1
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            errors += 1
+        lookups += 1
+    return lookups, errors
+
+
+def swap_writer(path, seconds, rows):
+    def build(conn):
+        index.create_tables(conn)
+        index.insert_many(conn, environ.source, rows)
+
+    count = 0
+    end = time.time() + seconds
+    while not count or time.time() < end:
+        index.write(path, build)
+        count += 1
+    return count
+
+
+def bench_swap(seconds=3):
+    seconds = float(seconds)
+    conn = index.connect(get_lib_path('index.db'))
+    rows = conn.execute('SELECT name, url, std FROM "%s"'
+                        % environ.source).fetchall()
+    conn.close()
+
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, 'index.db')
+        swap_writer(path, 0, rows)
+        with multiprocessing.Pool(5) as pool:
+            writes = pool.apply_async(swap_writer, (path, seconds, rows))
+            readers = [pool.apply_async(swap_reader,
+                                        (path, seconds, len(rows)))
+                       for i in range(4)]
+            lookups = [r.get() for r in readers]
+            print('  %d rebuilds, %d lookups, %d failed' %
+                  (writes.get(), sum(n for n, e in lookups),
+                   sum(e for n, e in lookups)))
+    finally:
+        shutil.rmtree(tmp)
+
+    if any(e for n, e in lookups):
+        sys.exit(1)
+
+
+def bench_resolve(count=5):
+    rounds = 100
+    conn = index.connect(environ.index_db)
+    names = [name for name, in conn.execute(
+        'SELECT name FROM "%s"' % environ.source)]
+    conn.close()
+    random.seed(0)
+    patterns = random.sample(names, int(count) - 1) + ['no such page']
+
+    def one_by_one():
+        for pattern in patterns:
+            conn = index.connect(environ.index_db)
+            index.lookup(conn, environ.source, pattern)
+            conn.close()
+
+    cm = Cppman()
+    for name, resolve in (('one by one', one_by_one),
+                          ('Cppman.resolve', lambda: cm.resolve(patterns))):
+        start = time.time()
+        for i in range(rounds):
+            resolve()
+        elapsed = (time.time() - start) / rounds
+        print('  %-16s %3d pages %8.3fms' % (name, len(patterns),
+                                              elapsed * 1000))
+
+
+SEARCH_QUERIES = ('vector', 'push_back', 'vec push', 'unordered_map find',
+                  'specific criteria',
+                  'find the function that erases elements by predicate')
+
+
+SEARCH_WORDS = ('the of to a in is and for that by with are element elements '
+                'range iterator container value key insert sort compare '
+                'allocator thread lock string predicate erase removes '
+                'satisfying criteria returns').split()
+
+
+def synthetic_groff_page(name, i):
+    """A page with words of SEARCH_WORDS, the first ones more frequent,
+    and of a vocabulary of 5000 synthetic words."""
+    rand = random.Random(i)
+
+    def words(count):
+        return ' '.join(
+            SEARCH_WORDS[min(int(rand.expovariate(0.25)),
+                             len(SEARCH_WORDS) - 1)]
+            if rand.random() < 0.5 else 'w%d' % rand.randrange(5000)
+            for j in range(count))
+
+    return ('.TH "%s" 3 "" "cppreference.com" "C++ Programmer\'s Manual"\n'
+            '.SH "NAME"\n%s - %s\n.SH "DESCRIPTION"\n%s\n'
+            % (name, name, words(6), words(400)))
+
+
+def bench_search(man_dir=None):
+    tmp = tempfile.mkdtemp()
+    try:
+        search = SearchIndex(os.path.join(tmp, 'search.db'))
+        start = time.time()
+        search.sync(get_lib_path('index.db'))
+        print('  names indexed in %.3fs' % (time.time() - start))
+
+        conn = index.connect(get_lib_path('index.db'))
+        pages = 0
+        start = time.time()
+        for source in environ.config.SOURCES:
+            for i, (name,) in enumerate(conn.execute(
+                    'SELECT name FROM "%s"' % source)):
+                if man_dir:
+                    path = os.path.join(man_dir, source,
+                                        name.replace('/', '_') + '.3.gz')
+                    try:
+                        with gzip.open(path, 'rt') as f:
+                            groff_text = f.read()
+                    except IOError:
+                        continue
+                else:
+                    groff_text = synthetic_groff_page(name, i)
+                search.update(source, name, groff_text)
+                pages += 1
+        conn.close()
+        search.optimize()
+        print('  %d pages indexed in %.3fs' % (pages, time.time() - start))
+
+        rounds = 20
+        for source in environ.config.SOURCES:
+            print(source)
+            for query in SEARCH_QUERIES:
+                start = time.time()
+                for i in range(rounds):
+                    results = search.search(source, query)
+                elapsed = (time.time() - start) / rounds
+                print('  %-55s %4d results %8.3fms' %
+                      (repr(query), len(results), elapsed * 1000))
+        search.close()
+    finally:
+        shutil.rmtree(tmp)
+
+
+MISSPELLINGS = ('unorderd_map', 'vector::emplaceback', 'std::vectr', 'pirntf',
+                'lower_bund', 'map::insrt', 'shared_pointer', 'xyzzy')
+
+
+def bench_names():
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, 'names.idx')
+        index_db = get_lib_path('index.db')
+        start = time.time()
+        NameIndex.open(path, index_db)
+        print('  build and save %8.3fms' % ((time.time() - start) * 1000))
+
+        rounds = 20
+        for source in environ.config.SOURCES:
+            print(source)
+            start = time.time()
+            for i in range(rounds):
+                names = NameIndex.open(path, index_db)
+                names.names(source)
+            print('  load %8.3fms' % ((time.time() - start) / rounds * 1000))
+
+            for pattern in MISSPELLINGS:
+                start = time.time()
+                for i in range(rounds):
+                    suggestions = names.suggest(source, pattern)
+                elapsed = (time.time() - start) / rounds
+                print('  suggest %-22s %8.3fms  %s' %
+                      (repr(pattern), elapsed * 1000,
+                       ', '.join(suggestions) or '-'))
+
+            name = 'std::unordered_map::emplace_hint'
+            start = time.time()
+            for i in range(rounds):
+                for j in range(len(name) + 1):
+                    names.complete(source, name[:j])
+            elapsed = (time.time() - start) / rounds / (len(name) + 1)
+            print('  complete, each prefix of %s %8.3fms' %
+                  (name, elapsed * 1000))
+    finally:
+        shutil.rmtree(tmp)
+
+
+def bench_complete(prefix='vector::em'):
+    import bisect
+    import subprocess
+
+    rounds = 20
+    tmp = tempfile.mkdtemp()
+    env = dict(os.environ, HOME=tmp)
+    try:
+        cmd = [sys.executable, 'bin/cppman', '--complete', prefix]
+        path = subprocess.check_output(
+            [sys.executable, 'bin/cppman', '--completion-list'],
+            env=env).decode('utf-8').strip()
+
+        start = time.time()
+        for i in range(rounds):
+            names = subprocess.check_output(cmd, env=env).split(b'\n')
+        elapsed = (time.time() - start) / rounds
+        print('  %-28s %8.3fms %5d names' %
+              ('cppman --complete', elapsed * 1000, len(names) - 1))
+
+        start = time.time()
+        for i in range(rounds):
+            with open(path, 'rb') as f:
+                lines = f.read().split(b'\n')
+            key = prefix.lower().encode('utf-8')
+            j = bisect.bisect_left(lines, key)
+            names = set()
+            while j < len(lines) and lines[j].startswith(key):
+                names.add(lines[j].split(b'\t')[1])
+                j += 1
+        elapsed = (time.time() - start) / rounds
+        print('  %-28s %8.3fms %5d names' %
+              ('bisect completion.list', elapsed * 1000, len(names)))
+
+        if shutil.which('look'):
+            start = time.time()
+            for i in range(rounds):
+                subprocess.check_output(['look', '--', prefix.lower(), path],
+                                        env=dict(env, LC_ALL='C'))
+            elapsed = (time.time() - start) / rounds
+            print('  %-28s %8.3fms' % ('look completion.list',
+                                        elapsed * 1000))
+    finally:
+        shutil.rmtree(tmp)
+
+
+STARTUP_COMMANDS = (['--version'], ['--find-page', 'vector'],
+                    ['--find-page', 'push back'], ['vectr'],
+                    ['--complete', 'vector::em'])
+
+# Import time of the commands above over the bare interpreter's
+STARTUP_BUDGET_MS = 50
+
+# Modules only needed to crawl or format pages
+STARTUP_FORBIDDEN = ('bs4', 'html5lib', 'cppman.crawler', 'cppman.formatter',
+                     'urllib.request', 'http.client', 'multiprocessing',
+                     'concurrent.futures')
+
+
+def import_times(args, env):
+    """Return the {module: microseconds} imported by running args, as
+    reported by -X importtime, and their total."""
+    import subprocess
+
+    proc = subprocess.run([sys.executable, '-X', 'importtime'] + args,
+                          env=env, stdout=subprocess.DEVNULL,
+                          stderr=subprocess.PIPE)
+    modules = {}
+    total = 0
+    for line in proc.stderr.decode('utf-8').split('\n'):
+        m = re.match(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)', line)
+        if not m:
+            continue
+        modules[m.group(4)] = int(m.group(1))
+        total += int(m.group(1))
+    return modules, total
+
+
+def bench_startup():
+    rounds = 5
+    tmp = tempfile.mkdtemp()
+    env = dict(os.environ, HOME=tmp)
+    failed = False
+    try:
+        # First runs build the search and name indexes of the new HOME
+        for args in STARTUP_COMMANDS:
+            import_times(['bin/cppman'] + args, env)
+
+        base = min(import_times(['-c', 'pass'], env)[1]
+                   for i in range(rounds))
+        for args in STARTUP_COMMANDS:
+            runs = [import_times(['bin/cppman'] + args, env)
+                    for i in range(rounds)]
+            modules = runs[0][0]
+            elapsed = (min(total for modules, total in runs) - base) / 1000.0
+            forbidden = sorted(name for name in modules
+                               if name.startswith(STARTUP_FORBIDDEN))
+            status = 'ok'
+            if elapsed > STARTUP_BUDGET_MS:
+                status = 'over budget'
+            if forbidden:
+                status = 'imports ' + ', '.join(forbidden)
+            failed = failed or status != 'ok'
+            print('  %-32s %8.1fms %4d modules  %s' %
+                  (' '.join(args), elapsed, len(modules), status))
+    finally:
+        shutil.rmtree(tmp)
+
+    if failed:
+        sys.exit(1)
+
+
+def bench_render(count=20):
+    from cppman.cache import RenderCache, compress
+    from cppman.util import render_page
+
+    if not shutil.which('groff'):
+        print('groff not found')
+        sys.exit(1)
+
+    pages = [compress(synthetic_groff_page('page%d' % i, i))
+             for i in range(int(count))]
+    tmp = tempfile.mkdtemp()
+    try:
+        cache = RenderCache(tmp, 1 << 30)
+        start = time.time()
+        for i, data in enumerate(pages):
+            cache.put(str(i), render_page(data, 80, 'ascii'))
+        elapsed = (time.time() - start) / len(pages)
+        print('  %-8s %8.3fms/page' % ('groff', elapsed * 1000))
+
+        start = time.time()
+        for i in range(len(pages)):
+            with cache.open(str(i)) as f:
+                f.read()
+        elapsed = (time.time() - start) / len(pages)
+        print('  %-8s %8.3fms/page' % ('cached', elapsed * 1000))
+    finally:
+        shutil.rmtree(tmp)
+
+
+def bench_renderer(corpus_dir=None):
+    from cppman.util import typeset
+
+    corpus_dir = corpus_dir or os.path.join(os.path.dirname(__file__),
+                                            'groff')
+    pages = []
+    for name in sorted(os.listdir(corpus_dir)):
+        if name.endswith('.3'):
+            with open(os.path.join(corpus_dir, name), 'rb') as f:
+                pages.append(f.read())
+
+    for renderer in ('python', 'groff'):
+        if renderer == 'groff' and not shutil.which('groff'):
+            print('  %-8s not found' % renderer)
+            continue
+        rounds = 10
+        start = time.time()
+        for i in range(rounds):
+            for page in pages:
+                typeset(page, 80, 'ascii', renderer)
+        elapsed = (time.time() - start) / (rounds * len(pages))
+        print('  %-8s %8.3fms/page' % (renderer, elapsed * 1000))
+
+
+def legacy_cppreference_links(text):
+    """CPPReferenceLinkParser before the single-pass tokenizer."""
+    processed = {}
+    links = []
+    body = re.search('<[^>]*body[^>]*>(.+?)</body>', text, re.S).group(1)
+    bodyr = body[::-1]
+    href = "href"[::-1]
+    span = "span"[::-1]
+    mark_rev = "t-mark-rev"[::-1]
+    _class = "class"[::-1]
+    for std, url in re.findall(
+        '>' + span + r'/<\)([^(<>]*)\(' + '>[^<]*?' +
+        '''['"][^'"]*''' + mark_rev + r'''[^'"]*['"]\s*=\s*''' + _class +
+        '[^<]*' + span + '''<.*?['"]([^'"]+)['"]=''' + href, bodyr):
+        links.append((url[::-1], std[::-1]))
+        processed[url[::-1]] = True
+
+    for url in re.findall(r'''href\s*=\s*['"]\s*([^'"]+)['"]''', text):
+        if url in processed:
+            continue
+        links.append((url, ""))
+        processed[url] = True
+
+    unique = {}
+    for url, std in links:
+        unique.setdefault(url, std)
+    return unique
+
+
+def synthetic_cppreference_page(index, rows=300):
+    """A page shaped like a cppreference.com class page, with member
+    tables of tagged and untagged links."""
+    rows = ''.join(
+        '<tr class="t-dsc"><td><div class="t-dsc-member-div"><div>'
+        '<a href="/w/cpp/container/c%d/m%d" title="cpp/container/m%d">'
+        '<span class="t-lines"><span>m%d</span></span></a></div><div>'
+        '<span class="t-lines"><span>%s</span></span></div></div></td>\n'
+        '<td>does something with <a href="/w/cpp/types/t%d">type %d</a>'
+        '<br/> <span class="t-mark">(public member function)</span></td>'
+        '</tr>\n'
+        % (index, i, i, i,
+           '<span class="t-mark-rev t-since-cxx11">(C++11)</span>'
+           if i % 3 == 0 else '', i % 50, i % 50)
+        for i in range(rows))
+    return ('<html><head><link rel="stylesheet" href="/mwiki/load.php">'
+            '</head><body>\n<h1>std::c%d</h1>\n%s'
+            '<table class="t-dsc-begin">\n%s</table>\n%s</body></html>\n'
+            % (index, SYNTHETIC_PADDING * 20, rows, SYNTHETIC_PADDING * 20))
+
+
+def load_corpus(corpus_dir):
+    pages = []
+    for dirpath, dirnames, filenames in os.walk(corpus_dir):
+        for filename in sorted(filenames):
+            if filename.endswith('.html'):
+                with open(os.path.join(dirpath, filename), 'rb') as f:
+                    pages.append(f.read().decode('utf-8', 'replace'))
+    return pages
+
+
+def bench_links(corpus_dir=None):
+    if corpus_dir:
+        pages = load_corpus(corpus_dir)
+    else:
+        pages = [synthetic_cppreference_page(i) for i in range(50)]
+
+    parser = CPPReferenceLinkParser()
+
+    def tokenizer(text):
+        return dict((l.url, l.std) for l in parser.get_unique_links(text))
+
+    for page in pages:
+        assert tokenizer(page) == legacy_cppreference_links(page)
+
+    print('%d pages, %d KiB' % (len(pages),
+                                sum(len(p) for p in pages) // 1024))
+    for name, extract in (('reverse', legacy_cppreference_links),
+                          ('tokenizer', tokenizer)):
+        start = time.time()
+        count = sum(len(extract(page)) for page in pages)
+        elapsed = time.time() - start
+        print('  %-10s %8d links %8.3fs %12.1f links/sec' %
+              (name, count, elapsed, count / elapsed))
+
+
+def load_formatter_corpus(corpus_dir):
+    """{source: [(name, html)]} of the pages in corpus_dir/<source>, named
+    after their title."""
+    corpus = {}
+    for source in sorted(os.listdir(corpus_dir)):
+        if not os.path.isdir(os.path.join(corpus_dir, source)):
+            continue
+        for html in load_corpus(os.path.join(corpus_dir, source)):
+            title = re.search(r'<title>(.*?) - ', html).group(1)
+            name = re.sub(r'<[^>]*>', '', title.replace('&lt;', '<')
+                          .replace('&gt;', '>'))
+            corpus.setdefault(source, []).append((name, html))
+    return corpus
+
+
+class LegacyRules(object):
+    """The rules of a formatter compiled and applied one by one, on each
+    page, as html2groff did before RuleSet."""
+    def __init__(self, rps):
+        self.rps = rps
+
+    def sub(self, data):
+        for rp in self.rps:
+            data = re.compile(rp[0], rp[2]).sub(rp[1], data)
+        return data
+
+
+def bench_formatters(corpus_dir=None):
+    from cppman.formatter import cplusplus, cppreference
+
+    formatters = {'cplusplus.com': cplusplus, 'cppreference.com': cppreference}
+    corpus = load_formatter_corpus(
+        corpus_dir or os.path.join(os.path.dirname(__file__), 'html'))
+
+    for source, pages in sorted(corpus.items()):
+        formatter = formatters[source]
+        rounds = max(1, 200 // len(pages))
+        results = {}
+        for label in ('compiled', 'legacy'):
+            ruleset = formatter.rules
+            if label == 'legacy':
+                formatter.rules = LegacyRules(formatter.rps)
+            else:
+                ruleset.reset()
+            try:
+                start = time.time()
+                for i in range(rounds):
+                    output = [formatter.html2groff(html, name)
+                              for name, html in pages]
+                elapsed = time.time() - start
+            finally:
+                formatter.rules = ruleset
+            results[label] = output
+            print('%-17s %-9s %8.1f pages/sec' %
+                  (source, label, rounds * len(pages) / elapsed))
+        assert results['compiled'] == results['legacy']
+
+        for seconds, label in formatter.rules.profile()[:5]:
+            print('  %6.2fms/page  %s' % (seconds * 1000 / rounds / len(pages),
+                                         label[:60].replace('\n', '\\n')))
+
+
+def bench_normalizers(corpus_dir=None, scale=10):
+    from cppman import util
+    from cppman.formatter import cplusplus, cppreference, htmltree
+
+    formatters = {'cplusplus.com': cplusplus, 'cppreference.com': cppreference}
+    corpus = load_formatter_corpus(
+        corpus_dir or os.path.join(os.path.dirname(__file__), 'html'))
+
+    pages = []
+    for source, named in sorted(corpus.items()):
+        for name, html in named:
+            html = htmltree.loosened(html)
+            head, body = html.split('<body', 1)
+            body, tail = body.rsplit('</body>', 1)
+            pages.append((source, name, html))
+            pages.append((source, '%s x%s' % (name, scale),
+                          head + '<body' + body * int(scale) +
+                          '</body>' + tail))
+
+    normalizers = []
+    for normalizer in util.NORMALIZERS:
+        try:
+            util.fixupHTML('<p>', normalizer)
+        except (ImportError, RuntimeError):
+            print('%s not installed, skipped' % normalizer)
+            continue
+        normalizers.append(normalizer)
+
+    for source, name, html in pages:
+        timings = {}
+        outputs = {}
+        for normalizer in normalizers:
+            rounds = 1 if normalizer == 'html5lib' else 5
+            start = time.time()
+            for i in range(rounds):
+                fixed = util.fixupHTML(html, normalizer)
+            timings[normalizer] = (time.time() - start) / rounds
+            outputs[normalizer] = formatters[source].html2groff(fixed, name)
+        print('%-17s %-30s %5d KiB' % (source, name[:30], len(html) // 1024))
+        for normalizer in normalizers:
+            print('  %-13s %8.2fms' % (normalizer,
+                                       timings[normalizer] * 1000), end='')
+            if 'html5lib' in timings and normalizer != 'html5lib':
+                print('  %6.1fx' % (timings['html5lib'] /
+                                    timings[normalizer]), end='')
+                assert outputs[normalizer] == outputs['html5lib'], \
+                    (name, normalizer)
+            print()
+
+
+# The element regex of tableparser before, closing an element by the first
+# end tag starting with its name
+LEGACY_NODE = re.compile(r'<\s*([^/]\w*)\s?(.*?)>(.*?)<\s*/\1.*?>', re.S)
+
+
+def legacy_table_node(parent, name, attr_list, body):
+    """The table Node of the elements of body found with LEGACY_NODE over
+    the body of each element, as tableparser did before."""
+    from cppman.formatter.tableparser import Node
+
+    NODE = LEGACY_NODE
+
+    def strip_tags(html):
+        return NODE.sub(lambda m: strip_tags(m.group(3)), html)
+
+    node = Node(parent, name, attr_list, '')
+    if name in ['th', 'td']:
+        node.text = strip_tags(body)
+    else:
+        node.children = [legacy_table_node(node, *g)
+                         for g in NODE.findall(body)]
+    return node
+
+
+def legacy_parse_table(html):
+    import io
+
+    fd = io.StringIO()
+    legacy_table_node(None, 'root', '', html).gen(fd)
+    return fd.getvalue()
+
+
+def synthetic_table(rows, lines=1):
+    """A table of rows rows of links, code and line breaks, with cells of
+    lines lines."""
+    cell = '<br/>'.join('line %d of <code>f(x)</code>' % i
+                        for i in range(lines))
+    return ('<table class="wikitable"><tbody><tr><th>Name</th><th>Since</th>'
+            '<th>Description</th></tr>\n%s</tbody></table>' % ''.join(
+                '<tr><td><a href="m%d.html"><span class="t-lines">'
+                '<span>m%d</span></span></a></td><td>C++%d</td>'
+                '<td>%s<br/><span class="t-mark">(function)</span></td>'
+                '</tr>\n' % (i, i, 11 + i % 3 * 3, cell) for i in range(rows)))
+
+
+def bench_tables(corpus_dir=None):
+    from cppman.formatter.tableparser import parse_table
+
+    corpus = load_formatter_corpus(
+        corpus_dir or os.path.join(os.path.dirname(__file__), 'html'))
+    tables = []
+    for source, pages in sorted(corpus.items()):
+        for name, html in pages:
+            for table in re.findall(r'<table.*?</table>', html, re.S):
+                rows = re.findall(r'<tr.*?</tr>\s*', table, re.S)
+                tables.append(('%s %s' % (source, name), table))
+                if len(rows) > 1:
+                    body = ''.join(rows[1:])
+                    scaled = table.replace(
+                        body, body * (1000 // (len(rows) - 1)), 1)
+                    tables.append(('%s %s x%d' % (source, name,
+                                                  1000 // (len(rows) - 1)),
+                                   scaled))
+    for rows, lines in ((1000, 1), (1000, 5), (10, 50), (10, 100)):
+        tables.append(('synthetic %d rows, %d lines' % (rows, lines),
+                       synthetic_table(rows, lines)))
+
+    for label, table in tables:
+        timings = []
+        for parse in (legacy_parse_table, parse_table):
+            rounds = 1
+            while True:
+                start = time.time()
+                for i in range(rounds):
+                    output = parse(table)
+                elapsed = time.time() - start
+                if elapsed > 0.05 or rounds >= 100:
+                    break
+                rounds *= 10
+            timings.append((elapsed / rounds, output))
+        (before, expected), (after, result) = timings
+        print('%-48s %5d KiB %9.2fms %9.2fms %7.1fx%s' % (
+            label[:48], len(table) // 1024, before * 1000, after * 1000,
+            before / after, '' if result == expected else '  differs'))
+
+
+def bench_postprocess(corpus_dir=None):
+    from cppman.formatter import cplusplus, cppreference
+
+    formatters = {'cplusplus.com': (cplusplus, '<section id="description">',
+                                    '</body>'),
+                  'cppreference.com': (cppreference, '<h3',
+                                       '<div class="printfooter">')}
+    corpus = load_formatter_corpus(
+        corpus_dir or os.path.join(os.path.dirname(__file__), 'html'))
+
+    postprocess = cppreference.postprocess
+    for source, pages in sorted(corpus.items()):
+        formatter, first, last = formatters[source]
+        for name, html in pages:
+            if first not in html:
+                continue
+            start, end = html.index(first), html.rindex(last)
+            for scale in (1, 4, 16, 64):
+                page = html[:start] + html[start:end] * scale + html[end:]
+                texts = []
+                cppreference.postprocess = lambda data, name: \
+                    texts.append(data) or postprocess(data, name)
+                try:
+                    begin = time.time()
+                    formatter.html2groff(page, name)
+                    elapsed = time.time() - begin
+                finally:
+                    cppreference.postprocess = postprocess
+                print('%-17s %-24s x%-3d %5d KiB %8.1fms %7.1fus/KiB' % (
+                    source, name[:24], scale, len(page) // 1024,
+                    elapsed * 1000, elapsed * 1e6 * 1024 / len(page)),
+                    end='')
+                if texts:
+                    begin = time.time()
+                    postprocess(texts[0], name)
+                    elapsed = time.time() - begin
+                    print('  postprocess %6.1fms %7.1fus/KiB' % (
+                        elapsed * 1000, elapsed * 1e6 * 1024 / len(texts[0])),
+                        end='')
+                print()
+
+
+BENCHMARKS = {
+    'crawl': bench_crawl,
+    'recrawl': bench_recrawl,
+    'polite': bench_polite,
+    'cache': bench_cache,
+    'lookup': bench_lookup,
+    'query': bench_query,
+    'build': bench_build,
+    'swap': bench_swap,
+    'resolve': bench_resolve,
+    'search': bench_search,
+    'names': bench_names,
+    'complete': bench_complete,
+    'startup': bench_startup,
+    'render': bench_render,
+    'renderer': bench_renderer,
+    'links': bench_links,
+    'formatters': bench_formatters,
+    'normalizers': bench_normalizers,
+    'tables': bench_tables,
+    'postprocess': bench_postprocess,
+}
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in BENCHMARKS:
+        sys.stderr.write(__doc__)
+        sys.exit(1)
+    BENCHMARKS[sys.argv[1]](*sys.argv[2:])
+
+
+if __name__ == '__main__':
+    main()
@@ -5,7 +5,13 @@ import os
 import os.path
 sys.path.insert(0, os.path.normpath(os.getcwd()))
 
+from cppman import renderer, search
 from cppman.formatter import cplusplus, cppreference
+from cppman.formatter import htmltree, tableparser
 
 cplusplus.func_test()
 cppreference.func_test()
+renderer.func_test(os.path.join('test', 'groff'))
+htmltree.func_test(os.path.join('test', 'html'))
+tableparser.func_test(os.path.join('test', 'html'))
+search.func_test()